@@ -3,6 +3,8 @@
 #include <WiFi.h>
 #include <HTTPClient.h>
 #include <ArduinoJson.h>
+#include <mbedtls/sha256.h>
+#include <esp32/rom/crc.h>
 
 #define SS_PIN 5
 #define RST_PIN 21
@@ -20,96 +22,370 @@ const char *roomName = "EN4401";                       // ชื่อห้อ
 // =====================
 // Timing
 // =====================
-unsigned long lastPoll = 0;
 unsigned long lastWhitelistRefresh = 0;
 
-const unsigned long pollInterval = 1000;                            // poll door command ทุก 1 วิ
+// door command ใช้ long-poll: server ถือ request ไว้สูงสุด commandWaitSeconds วิ
+// แล้วตอบทันทีที่ web กด open/close → ไม่ต้อง poll ทุก 1 วิ และประตูตอบสนองเร็วขึ้น
+// รันใน FreeRTOS task แยก เพื่อไม่ให้ loop() (อ่านบัตร) ถูก block ระหว่างรอ
+const int commandWaitSeconds = 25;
+const unsigned long commandRetryDelay = 1000; // poll ล้มเหลว → รอ 1 วิ ก่อนลองใหม่
+long pendingAckSeq = 0;                       // seq ของคำสั่งที่ทำเสร็จแล้ว — ส่ง ?ack= ไปกับ poll ถัดไป
 const unsigned long whitelistRefreshInterval = 5UL * 60UL * 1000UL; // refresh whitelist ทุก 5 นาที
 const unsigned long whitelistRetryInterval = 30UL * 1000UL;         // retry ถ้าโหลดไม่ได้ ทุก 30 วิ
 
 // =====================
-// Admin Whitelist (เก็บใน RAM — โหลดจาก server)
+// Admin Whitelist (เก็บใน RAM — โหลดจาก server แบบ binary)
 //
 // Flow:
 //   boot  → setup() เรียก loadWhitelistFromServer()
-//             → สำเร็จ: เก็บใน adminWhitelist[]
+//             → สำเร็จ: เก็บ buffer ใน adminWhitelist
 //             → ล้มเหลว (server ยังไม่พร้อม): adminWhitelistCount = 0
 //                        loop() จะ retry ทุก 30 วิ จนกว่าจะได้
-//   ทุก 5 นาที → loop() โหลดใหม่อัตโนมัติ (ดึง admin เพิ่มใหม่)
+//   ทุก 5 นาที → loop() ถามด้วย ETag ที่มีอยู่ (If-None-Match)
+//             → 304: ไม่มีอะไรเปลี่ยน ไม่ต้องโหลดใหม่
+//             → 200: แทนที่ buffer ทั้งก้อน
 //   server ล่ม → ใช้ค่าใน RAM ที่โหลดล่าสุด (ไม่หาย จนกว่าบอร์ด reset)
+//
+// รูปแบบ (GET /api/whitelist, Accept: application/octet-stream — little-endian):
+//   "WLB1" | version u32 | count u32 | crc32 u32 | count x 8 ไบต์
+//   แต่ละ entry = SHA-256(UUID ตัวใหญ่) 8 ไบต์แรก เรียงแบบ memcmp
+//   → ไม่ต้อง parse JSON, ใช้ buffer ตรง ๆ แล้ว binary search
 // =====================
-#define MAX_WHITELIST 50
-String adminWhitelist[MAX_WHITELIST];
-int adminWhitelistCount = 0;
+#define WHITELIST_HASH_BYTES 8
+#define WHITELIST_HEADER_BYTES 16
+#define MAX_WHITELIST 4096 // 32 KB สูงสุด — กัน response ผิดปกติกิน heap
 
-// โหลด whitelist จาก server — คืน true ถ้าสำเร็จ
-bool loadWhitelistFromServer()
+uint8_t *adminWhitelist = NULL; // entries เรียงแล้ว (count x 8 ไบต์)
+uint32_t adminWhitelistCount = 0;
+uint32_t whitelistVersion = 0;
+String whitelistETag = "";
+
+static uint32_t readU32LE(const uint8_t *p)
+{
+  return (uint32_t)p[0] | ((uint32_t)p[1] << 8) | ((uint32_t)p[2] << 16) | ((uint32_t)p[3] << 24);
+}
+
+// hash ให้ตรงกับ uuid_hash() ใน backend/whitelist.py
+void uuidHash(String uuid, uint8_t out[WHITELIST_HASH_BYTES])
+{
+  uuid.trim();
+  uuid.toUpperCase();
+  uint8_t digest[32];
+  mbedtls_sha256_context ctx;
+  mbedtls_sha256_init(&ctx);
+  mbedtls_sha256_starts(&ctx, 0);
+  mbedtls_sha256_update(&ctx, (const uint8_t *)uuid.c_str(), uuid.length());
+  mbedtls_sha256_finish(&ctx, digest);
+  mbedtls_sha256_free(&ctx);
+  memcpy(out, digest, WHITELIST_HASH_BYTES);
+}
+
+// GET ไฟล์ binary (whitelist / grant bundle) พร้อม If-None-Match
+// คืน HTTP code: 304 = ของเดิมยังใหม่อยู่, 200 = *out ชี้ buffer ใหม่ (ผู้เรียกต้อง free)
+// ค่าอื่น = ล้มเหลว
+int fetchBinary(const char *tag, const String &url, String &etag, int maxSize,
+                uint8_t **out, int *outSize)
 {
   if (WiFi.status() != WL_CONNECTED)
   {
-    Serial.println("[WHITELIST] WiFi not connected — skip");
-    return false;
+    Serial.printf("[%s] WiFi not connected — skip\n", tag);
+    return -1;
   }
 
   HTTPClient http;
-  String url = String(apiIPAddress) + "/api/whitelist";
   http.begin(url);
+  http.addHeader("Accept", "application/octet-stream");
+  if (etag.length() > 0)
+    http.addHeader("If-None-Match", etag);
+  const char *keepHeaders[] = {"ETag"};
+  http.collectHeaders(keepHeaders, 1);
   http.setTimeout(5000);
   int code = http.GET();
 
+  if (code == 304)
+  {
+    http.end();
+    return code;
+  }
   if (code != 200)
   {
-    Serial.print("[WHITELIST] HTTP GET failed. Code: ");
-    Serial.println(code);
+    Serial.printf("[%s] HTTP GET failed. Code: %d\n", tag, code);
     http.end();
-    return false;
+    return code;
   }
 
-  String body = http.getString();
+  int size = http.getSize();
+  if (size <= 0 || size > maxSize)
+  {
+    Serial.printf("[%s] Bad size: %d\n", tag, size);
+    http.end();
+    return -1;
+  }
+  uint8_t *buf = (uint8_t *)malloc(size);
+  if (buf == NULL)
+  {
+    Serial.printf("[%s] Out of memory\n", tag);
+    http.end();
+    return -1;
+  }
+  int got = http.getStreamPtr()->readBytes(buf, size);
+  String newETag = http.header("ETag");
   http.end();
+  if (got != size)
+  {
+    Serial.printf("[%s] Short read: %d/%d\n", tag, got, size);
+    free(buf);
+    return -1;
+  }
+
+  etag = newETag;
+  *out = buf;
+  *outSize = size;
+  return code;
+}
 
-  // Parse JSON: {"success":true,"admins":[{"uuid":"AABBCCDD","name":"Firstname Lastname"},...]}
-  StaticJsonDocument<4096> doc;
-  DeserializationError err = deserializeJson(doc, body);
-  if (err)
+// โหลด whitelist จาก server — คืน true ถ้าสำเร็จ (รวม 304 = ของใน RAM ยังใหม่อยู่)
+bool loadWhitelistFromServer()
+{
+  String etag = whitelistETag;
+  uint8_t *buf = NULL;
+  int size = 0;
+  int code = fetchBinary("WHITELIST", String(apiIPAddress) + "/api/whitelist", etag,
+                         WHITELIST_HEADER_BYTES + MAX_WHITELIST * WHITELIST_HASH_BYTES,
+                         &buf, &size);
+  if (code == 304)
   {
-    Serial.print("[WHITELIST] JSON parse error: ");
-    Serial.println(err.c_str());
-    return false;
+    Serial.println("[WHITELIST] Up to date (v" + String(whitelistVersion) + ")");
+    return true;
   }
+  if (code != 200)
+    return false;
 
-  // โหลดสำเร็จ → อัปเดต whitelist ใน RAM
-  int newCount = 0;
-  for (JsonObject admin : doc["admins"].as<JsonArray>())
+  // ตรวจ header: magic, ขนาดตรงกับ count, crc32 ของ entries
+  uint32_t count = (size >= WHITELIST_HEADER_BYTES) ? readU32LE(buf + 8) : 0;
+  const uint8_t *entries = buf + WHITELIST_HEADER_BYTES;
+  size_t entriesLen = (size_t)count * WHITELIST_HASH_BYTES;
+  if (size < WHITELIST_HEADER_BYTES || memcmp(buf, "WLB1", 4) != 0 ||
+      entriesLen != (size_t)(size - WHITELIST_HEADER_BYTES) ||
+      crc32_le(0, entries, entriesLen) != readU32LE(buf + 12))
   {
-    if (newCount >= MAX_WHITELIST)
-      break;
-    String uuid = admin["uuid"].as<String>();
-    uuid.toUpperCase();
-    adminWhitelist[newCount++] = uuid;
-    Serial.print("[WHITELIST]  + ");
-    Serial.print(uuid);
-    Serial.print("  (");
-    Serial.print(admin["name"].as<String>());
-    Serial.println(")");
+    Serial.println("[WHITELIST] Corrupt response — keeping previous list");
+    free(buf);
+    return false;
   }
-  adminWhitelistCount = newCount;
+
+  // โหลดสำเร็จ → สลับ buffer ใน RAM (เก็บไว้ทั้งก้อน entries อยู่ที่ offset 16)
+  free(adminWhitelist);
+  adminWhitelist = buf;
+  adminWhitelistCount = count;
+  whitelistVersion = readU32LE(buf + 4);
+  whitelistETag = etag;
 
   Serial.print("[WHITELIST] Loaded ");
   Serial.print(adminWhitelistCount);
-  Serial.println(" admin(s) into RAM");
+  Serial.print(" admin(s) into RAM (v");
+  Serial.print(whitelistVersion);
+  Serial.println(")");
   return true;
 }
 
-// ตรวจสอบว่า UUID นี้อยู่ใน whitelist RAM หรือไม่
+// ตรวจสอบว่า UUID นี้อยู่ใน whitelist RAM หรือไม่ — binary search บน hash ที่เรียงแล้ว
 bool isAdminUUID(const String &uuid)
 {
-  for (int i = 0; i < adminWhitelistCount; i++)
-    if (uuid.equalsIgnoreCase(adminWhitelist[i]))
+  if (adminWhitelist == NULL)
+    return false;
+  uint8_t key[WHITELIST_HASH_BYTES];
+  uuidHash(uuid, key);
+
+  const uint8_t *entries = adminWhitelist + WHITELIST_HEADER_BYTES;
+  int32_t lo = 0, hi = (int32_t)adminWhitelistCount - 1;
+  while (lo <= hi)
+  {
+    int32_t mid = lo + (hi - lo) / 2;
+    int cmp = memcmp(entries + (size_t)mid * WHITELIST_HASH_BYTES, key, WHITELIST_HASH_BYTES);
+    if (cmp == 0)
+      return true;
+    if (cmp < 0)
+      lo = mid + 1;
+    else
+      hi = mid - 1;
+  }
+  return false;
+}
+
+// =====================
+// Offline Grant Bundle (booking ที่ approved ของห้องนี้ — โหลดจาก server แบบ binary)
+//
+// GET /api/door/grants?room=<roomName>&hours=24 (Accept: application/octet-stream):
+//   "GRB1" | version u32 | server_time u32 | window_end u32 | count u32 | crc32 u32
+//   (bit 31 ของ count = server ตัด bundle เหลือ booking ที่เริ่มเร็วสุด)
+//   | count x (hash 8 ไบต์ + starts_at u32 + ends_at u32) เรียงตาม hash แล้ว starts_at
+// บอร์ดไม่มี RTC → ใช้ server_time + millis() ที่ผ่านไปเป็นนาฬิกา
+// ตอน server ล่ม นักศึกษาที่มี booking ตอนนี้เข้าได้ แล้ว log ถูกเก็บไว้ upload ทีหลัง
+// =====================
+#define GRANT_HEADER_BYTES 24
+#define GRANT_ENTRY_BYTES 16
+#define MAX_GRANTS 2048 // 32 KB สูงสุด
+#define GRANT_TRUNCATED_FLAG 0x80000000UL
+
+uint8_t *grantBundle = NULL;
+uint32_t grantCount = 0;
+uint32_t grantServerTime = 0;      // epoch ตอน server ตอบครั้งล่าสุด (0 = ยังไม่รู้เวลา)
+unsigned long grantFetchedAt = 0;  // millis() ตอนได้ server_time
+String grantETag = "";
+unsigned long lastGrantRefresh = 0;
+
+// เวลาปัจจุบัน (epoch) จาก server_time ล่าสุด — 0 ถ้ายังไม่เคยโหลดสำเร็จ
+uint32_t currentEpoch()
+{
+  if (grantServerTime == 0)
+    return 0;
+  return grantServerTime + (millis() - grantFetchedAt) / 1000UL;
+}
+
+// โหลด grant bundle ของห้องนี้ — คืน true ถ้าสำเร็จ (รวม 304)
+bool loadGrantsFromServer()
+{
+  String etag = grantETag;
+  uint8_t *buf = NULL;
+  int size = 0;
+  String url = String(apiIPAddress) + "/api/door/grants?room=" + String(roomName) + "&hours=24";
+  int code = fetchBinary("GRANTS", url, etag,
+                         GRANT_HEADER_BYTES + MAX_GRANTS * GRANT_ENTRY_BYTES, &buf, &size);
+  if (code == 304)
+    return true;
+  if (code != 200)
+    return false;
+
+  uint32_t countField = (size >= GRANT_HEADER_BYTES) ? readU32LE(buf + 16) : 0;
+  uint32_t count = countField & ~GRANT_TRUNCATED_FLAG;
+  const uint8_t *entries = buf + GRANT_HEADER_BYTES;
+  size_t entriesLen = (size_t)count * GRANT_ENTRY_BYTES;
+  if (size < GRANT_HEADER_BYTES || memcmp(buf, "GRB1", 4) != 0 ||
+      entriesLen != (size_t)(size - GRANT_HEADER_BYTES) ||
+      crc32_le(0, entries, entriesLen) != readU32LE(buf + 20))
+  {
+    Serial.println("[GRANTS] Corrupt response — keeping previous bundle");
+    free(buf);
+    return false;
+  }
+
+  free(grantBundle);
+  grantBundle = buf;
+  grantCount = count;
+  grantServerTime = readU32LE(buf + 8);
+  grantFetchedAt = millis();
+  grantETag = etag;
+
+  Serial.print("[GRANTS] Loaded ");
+  Serial.print(grantCount);
+  Serial.print(" grant(s) for ");
+  Serial.print(roomName);
+  Serial.print(" (v");
+  Serial.print(readU32LE(buf + 4));
+  Serial.println(")");
+  if (countField & GRANT_TRUNCATED_FLAG)
+    Serial.println("[GRANTS] Bundle truncated by server — covers only the soonest bookings");
+  return true;
+}
+
+// UUID นี้มี booking ที่ครอบคลุมเวลาปัจจุบันหรือไม่ — binary search หา hash แรกแล้วไล่ช่วงเวลา
+bool hasGrantNow(const String &uuid)
+{
+  uint32_t now = currentEpoch();
+  if (grantBundle == NULL || now == 0)
+    return false;
+  uint8_t key[WHITELIST_HASH_BYTES];
+  uuidHash(uuid, key);
+
+  const uint8_t *entries = grantBundle + GRANT_HEADER_BYTES;
+  uint32_t lo = 0, hi = grantCount;
+  while (lo < hi) // lower bound
+  {
+    uint32_t mid = lo + (hi - lo) / 2;
+    if (memcmp(entries + (size_t)mid * GRANT_ENTRY_BYTES, key, WHITELIST_HASH_BYTES) < 0)
+      lo = mid + 1;
+    else
+      hi = mid;
+  }
+  for (uint32_t i = lo; i < grantCount; i++)
+  {
+    const uint8_t *e = entries + (size_t)i * GRANT_ENTRY_BYTES;
+    if (memcmp(e, key, WHITELIST_HASH_BYTES) != 0)
+      break;
+    if (readU32LE(e + 8) <= now && now < readU32LE(e + 12))
       return true;
+  }
   return false;
 }
 
+// =====================
+// Offline scan log — เก็บ scan ที่ตัดสินในบอร์ดไว้ upload ผ่าน /api/send_uuid/batch
+// =====================
+#define MAX_OFFLINE_SCANS 64
+
+struct OfflineScan
+{
+  char uuid[21];
+  unsigned long at; // millis() ตอนสแกน → ส่งเป็น age_ms
+  bool granted;
+};
+OfflineScan offlineScans[MAX_OFFLINE_SCANS];
+int offlineScanCount = 0;
+unsigned long lastOfflineUpload = 0;
+const unsigned long offlineUploadInterval = 30UL * 1000UL;
+
+void queueOfflineScan(const String &uuid, bool granted)
+{
+  if (offlineScanCount >= MAX_OFFLINE_SCANS)
+  {
+    // เต็ม → ทิ้งอันเก่าสุด
+    memmove(offlineScans, offlineScans + 1, sizeof(OfflineScan) * (MAX_OFFLINE_SCANS - 1));
+    offlineScanCount--;
+  }
+  OfflineScan &scan = offlineScans[offlineScanCount++];
+  strncpy(scan.uuid, uuid.c_str(), sizeof(scan.uuid) - 1);
+  scan.uuid[sizeof(scan.uuid) - 1] = '\0';
+  scan.at = millis();
+  scan.granted = granted;
+}
+
+// upload scan ที่ค้างทั้งหมดในครั้งเดียว — คืน true ถ้า server รับแล้ว (ล้างคิว)
+bool uploadOfflineScans()
+{
+  if (offlineScanCount == 0 || WiFi.status() != WL_CONNECTED)
+    return offlineScanCount == 0;
+
+  unsigned long now = millis();
+  String payload = "{\"room\":\"" + String(roomName) + "\",\"scans\":[";
+  for (int i = 0; i < offlineScanCount; i++)
+  {
+    if (i > 0)
+      payload += ",";
+    payload += "{\"uuid\":\"" + String(offlineScans[i].uuid) +
+               "\",\"age_ms\":" + String(now - offlineScans[i].at) +
+               ",\"offline\":true,\"device_result\":\"" +
+               (offlineScans[i].granted ? "granted" : "denied") + "\"}";
+  }
+  payload += "]}";
+
+  HTTPClient http;
+  http.begin(String(apiIPAddress) + "/api/send_uuid/batch");
+  http.addHeader("Content-Type", "application/json");
+  http.setTimeout(5000);
+  int code = http.POST(payload);
+  http.end();
+
+  if (code != 200)
+  {
+    Serial.printf("[OFFLINE] Upload of %d scan(s) failed. Code: %d\n", offlineScanCount, code);
+    return false;
+  }
+  Serial.printf("[OFFLINE] Uploaded %d scan(s)\n", offlineScanCount);
+  offlineScanCount = 0;
+  return true;
+}
+
 // =====================
 // Door Control
 // =====================
@@ -172,65 +448,86 @@ bool sendUUIDToAPI(const String &uuid)
 }
 
 // =====================
-// Offline Fallback: เช็ค whitelist ใน RAM
+// Offline Fallback: เช็ค whitelist + grant bundle ใน RAM
+// ผลทุกครั้ง (เข้าได้หรือไม่ได้) ถูกเก็บไว้ upload เมื่อ server กลับมา
 // =====================
 void handleOfflineFallback(const String &uuid)
 {
-  Serial.println("[OFFLINE] Server unreachable — checking RAM whitelist...");
-
-  if (adminWhitelistCount == 0)
-  {
-    Serial.println("[OFFLINE] Whitelist empty — access denied.");
-    Serial.println("[OFFLINE] Will retry loading whitelist soon.");
-    return;
-  }
+  Serial.println("[OFFLINE] Server unreachable — checking RAM whitelist / grants...");
 
+  bool granted = false;
   if (isAdminUUID(uuid))
   {
     Serial.println("[OFFLINE] Admin matched — opening door.");
-    openDoor();
+    granted = true;
+  }
+  else if (hasGrantNow(uuid))
+  {
+    Serial.println("[OFFLINE] Booking grant matched — opening door.");
+    granted = true;
+  }
+  else if (adminWhitelistCount == 0 && grantCount == 0)
+  {
+    Serial.println("[OFFLINE] Whitelist / grants empty — access denied.");
+    Serial.println("[OFFLINE] Will retry loading them soon.");
   }
   else
   {
-    Serial.println("[OFFLINE] Not in whitelist — access denied.");
+    Serial.println("[OFFLINE] No admin entry or current booking — access denied.");
   }
+
+  if (granted)
+    openDoor();
+  queueOfflineScan(uuid, granted);
 }
 
 // =====================
-// Poll door command จาก server (open/close จาก web)
+// Long-poll door command จาก server (open/close จาก web)
+// คืน true ถ้า server ตอบ 200 (มีคำสั่งหรือ idle ก็ได้)
 // =====================
-void checkDoorCommand()
+bool checkDoorCommand()
 {
   if (WiFi.status() != WL_CONNECTED)
-    return;
+    return false;
 
   HTTPClient http;
-  String url = String(apiIPAddress) + "/api/door/command?room=" + String(roomName);
+  String url = String(apiIPAddress) + "/api/door/command?room=" + String(roomName) +
+               "&wait=" + String(commandWaitSeconds);
+  if (pendingAckSeq > 0)
+    url += "&ack=" + String(pendingAckSeq);
   http.begin(url);
-  http.setTimeout(2000);
+  http.setTimeout((commandWaitSeconds + 5) * 1000); // เผื่อเวลาให้ server ตอบหลังครบ wait
   int code = http.GET();
+  bool ok = (code == 200);
 
-  if (code == 200)
+  if (ok)
   {
+    pendingAckSeq = 0; // server รับ ack ไปพร้อม request นี้แล้ว
     String payload = http.getString();
-    Serial.print("[CMD] Poll: ");
-    Serial.println(payload);
 
-    // Flask 3.x returns {"command": "open"} with space — support both
-    bool isOpen = payload.indexOf("\"command\":\"open\"") != -1 ||
-                  payload.indexOf("\"command\": \"open\"") != -1;
-    bool isClose = payload.indexOf("\"command\":\"close\"") != -1 ||
-                   payload.indexOf("\"command\": \"close\"") != -1;
-
-    if (isOpen)
+    // {"command": "open" | "close" | "idle", "seq": n}
+    StaticJsonDocument<128> doc;
+    if (deserializeJson(doc, payload))
     {
-      Serial.println("[CMD] Web command: OPEN");
-      openDoor();
+      Serial.println("[CMD] JSON parse error");
     }
-    else if (isClose)
+    else
     {
-      Serial.println("[CMD] Web command: CLOSE");
-      digitalWrite(RELAY_PIN, DOOR_CLOSE);
+      String command = doc["command"].as<String>();
+      long seq = doc["seq"] | 0L;
+
+      if (command == "open")
+      {
+        Serial.println("[CMD] Web command: OPEN (seq " + String(seq) + ")");
+        openDoor();
+        pendingAckSeq = seq;
+      }
+      else if (command == "close")
+      {
+        Serial.println("[CMD] Web command: CLOSE (seq " + String(seq) + ")");
+        digitalWrite(RELAY_PIN, DOOR_CLOSE);
+        pendingAckSeq = seq;
+      }
     }
   }
   else
@@ -239,6 +536,17 @@ void checkDoorCommand()
     Serial.println(code);
   }
   http.end();
+  return ok;
+}
+
+// task แยกสำหรับ long-poll — ต่อ request ใหม่ทันทีหลังได้คำตอบ
+void doorCommandTask(void *param)
+{
+  for (;;)
+  {
+    if (!checkDoorCommand())
+      vTaskDelay(pdMS_TO_TICKS(commandRetryDelay));
+  }
 }
 
 // =====================
@@ -270,13 +578,23 @@ void setup()
   if (!ok)
     Serial.println("[WHITELIST] Initial load failed — will retry in 30s via loop()");
 
+  Serial.println("[GRANTS] Initial load from server...");
+  if (!loadGrantsFromServer())
+    Serial.println("[GRANTS] Initial load failed — will retry in 30s via loop()");
+
   // ตั้ง timer ให้ refresh ครั้งถัดไปใน 5 นาที
   lastWhitelistRefresh = millis();
+  lastGrantRefresh = millis();
+
+  // เริ่ม long-poll door command บน core 0 (loop() รันบน core 1)
+  xTaskCreatePinnedToCore(doorCommandTask, "doorCommand", 8192, NULL, 1, NULL, 0);
 
   Serial.println("=================================");
   Serial.println("System ready. Scan RFID card...");
   Serial.print("RAM whitelist entries: ");
   Serial.println(adminWhitelistCount);
+  Serial.print("RAM booking grants: ");
+  Serial.println(grantCount);
   Serial.println("=================================");
 }
 
@@ -287,17 +605,12 @@ void loop()
 {
   unsigned long now = millis();
 
-  // --- 1. Poll door command จาก web ทุก 1 วิ ---
-  if (now - lastPoll >= pollInterval)
-  {
-    lastPoll = now;
-    checkDoorCommand();
-  }
+  // --- 1. door command รับผ่าน doorCommandTask (long-poll) ---
 
   // --- 2. Refresh whitelist ---
-  //   กรณี A: โหลดสำเร็จแล้ว → refresh ทุก 5 นาที (ดึง admin เพิ่มใหม่)
+  //   กรณี A: โหลดสำเร็จแล้ว → refresh ทุก 5 นาที (ส่วนใหญ่ได้ 304)
   //   กรณี B: ยังโหลดไม่ได้   → retry ทุก 30 วิ (server อาจยังไม่พร้อม)
-  unsigned long refreshInterval = (adminWhitelistCount > 0)
+  unsigned long refreshInterval = (whitelistETag.length() > 0)
                                       ? whitelistRefreshInterval
                                       : whitelistRetryInterval;
 
@@ -312,7 +625,24 @@ void loop()
     lastWhitelistRefresh = now;
   }
 
-  // --- 3. รับบัตร RFID ---
+  // --- 3. Refresh grant bundle (304 ถ้าไม่มี booking เปลี่ยน) ---
+  unsigned long grantInterval = (grantETag.length() > 0)
+                                    ? whitelistRefreshInterval
+                                    : whitelistRetryInterval;
+  if (now - lastGrantRefresh >= grantInterval)
+  {
+    loadGrantsFromServer();
+    lastGrantRefresh = now;
+  }
+
+  // --- 4. Upload scan ที่ตัดสินตอน offline ---
+  if (offlineScanCount > 0 && now - lastOfflineUpload >= offlineUploadInterval)
+  {
+    uploadOfflineScans();
+    lastOfflineUpload = now;
+  }
+
+  // --- 5. รับบัตร RFID ---
   if (!mfrc522.PICC_IsNewCardPresent() || !mfrc522.PICC_ReadCardSerial())
     return;
 
@@ -331,6 +661,8 @@ void loop()
   bool serverReached = sendUUIDToAPI(uuid);
   if (!serverReached)
     handleOfflineFallback(uuid);
+  else if (offlineScanCount > 0)
+    lastOfflineUpload = now - offlineUploadInterval; // server กลับมาแล้ว → upload รอบ loop ถัดไป
 
   mfrc522.PICC_HaltA();
   mfrc522.PCD_StopCrypto1();
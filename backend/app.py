@@ -6,24 +6,54 @@ from flask import (
     url_for,
     jsonify,
     send_from_directory,
+    g,
+    Response,
 )
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room, leave_room
 from flask_cors import CORS
 import threading  # Bug #5 Fix: ใช้ Lock แทน global variable เปล่า
 
 import sqlite3
 import os
+import base64
 import csv
+import io
+import json
+import math
+import time
+import zlib
 from uuid import uuid4
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 
 from auth import auth_bp, init_auth_db
-from booking import booking_bp, init_booking_db
+from booking import (
+    TZ_THAI,
+    booking_bp,
+    has_access_grant,
+    init_booking_db,
+    on_grants_changed,
+    sync_grant_uuids,
+)
+from db import get_db_connection, pool_stats
+from metrics import REGISTRY, Counter, Gauge, Histogram, track_job, watch_thread
+from writeback import BatchWriter
+from state import create_state_backend
+from whitelist import whitelist_bp, init_whitelist_db
+from door_grants import door_grants_bp, init_door_grants_db
+from log_archive import (
+    LOG_RETENTION_DAYS,
+    init_log_archive_db,
+    list_partitions,
+    open_partition,
+    purge_progress,
+    rotate_log_partitions,
+)
 from notifications import (
     notif_bp,
     init_notification_db,
     notify_rfid_denied,
+    rfid_denied_dispatcher,
     check_and_send_reminders,
 )
 
@@ -34,7 +64,13 @@ load_dotenv()
 # =====================
 app = Flask(__name__)
 CORS(app)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
+# หลาย worker process: ตั้ง SOCKETIO_MESSAGE_QUEUE (เช่น redis://) ให้ emit ถึง client ทุก process
+socketio = SocketIO(
+    app,
+    cors_allowed_origins="*",
+    async_mode="threading",
+    message_queue=os.getenv("SOCKETIO_MESSAGE_QUEUE") or None,
+)
 
 app.config["SECRET_KEY"] = os.getenv(
     "SECRET_KEY", "your-secret-key-change-this-in-production"
@@ -43,41 +79,73 @@ app.config["SECRET_KEY"] = os.getenv(
 app.register_blueprint(auth_bp)
 app.register_blueprint(booking_bp)
 app.register_blueprint(notif_bp)
+app.register_blueprint(whitelist_bp)
+app.register_blueprint(door_grants_bp)
 
 BASE_DIR = os.path.dirname(__file__)
-DB_PATH = os.path.abspath(
-    os.path.join(BASE_DIR, os.getenv("DATABASE_PATH", "database.db"))
-)
 PHOTO_DIR = os.getenv("UPLOAD_FOLDER", "photos")
 
 
 # =====================
-# Bug #5 Fix: UUID state ป้องกัน race condition ด้วย Lock
+# Metrics (เสิร์ฟที่ /metrics — Prometheus text format)
+# =====================
+scan_phase_seconds = Histogram(
+    "rfid_scan_phase_seconds",
+    "Time spent in each phase of an RFID scan (/api/send_uuid)",
+    ("phase",),
+)
+scans_total = Counter(
+    "rfid_scans_total", "RFID scans by access result and source", ("result", "source")
+)
+http_request_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Flask request latency by endpoint",
+    ("endpoint", "method", "status"),
+)
+
+
+@app.before_request
+def _start_request_timer():
+    g._request_started = time.perf_counter()
+
+
+@app.after_request
+def _observe_request_latency(response):
+    started = g.pop("_request_started", None)
+    if started is not None:
+        http_request_seconds.observe(
+            time.perf_counter() - started,
+            endpoint=request.endpoint or "unmatched",
+            method=request.method,
+            status=response.status_code,
+        )
+    return response
+
+
+# =====================
+# Runtime state (door commands / heartbeat / latest UUID) — ดู state.py
 # =====================
-_uuid_lock = threading.Lock()
-_latest_uuid = None  # ใช้ผ่าน getter/setter ด้านล่างเท่านั้น
+COMMAND_TTL = 10  # วิ — command จะหมดอายุหลัง 10 วิ ถ้า ESP32 ไม่ได้ poll
+# STATE_BACKEND=sqlite ให้หลาย worker process เห็น state เดียวกัน
+runtime_state = create_state_backend(
+    command_ttl=COMMAND_TTL,
+    max_pending=int(os.getenv("DOOR_COMMAND_MAX_PENDING", "8")),
+)
 
 
+# Bug #5 Fix: UUID state ป้องกัน race condition — lock อยู่ใน state backend
 def get_latest_uuid():
-    with _uuid_lock:
-        return _latest_uuid
+    return runtime_state.get_latest_uuid()
 
 
 def set_latest_uuid(value):
-    global _latest_uuid
-    with _uuid_lock:
-        _latest_uuid = value
+    runtime_state.set_latest_uuid(value)
 
 
 # =====================
 # Database Helpers
 # =====================
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
+# connection pool + pragma (WAL ฯลฯ) อยู่ใน db.py — ใช้ร่วมกันทุก module
 def init_db():
     # --- users_reg + rooms ---
     with get_db_connection() as conn:
@@ -100,6 +168,10 @@ def init_db():
             )
             """
         )
+        # lookup ตาม uuid (fallback ของ user index), user_id / email (ลงทะเบียน, เช็คซ้ำ, grant)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_uuid ON users_reg(uuid)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_user_id ON users_reg(user_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_email ON users_reg(email)")
         # Rooms table
         cursor.execute("PRAGMA table_info(rooms)")
         existing_cols = {row["name"] for row in cursor.fetchall()}
@@ -148,6 +220,8 @@ def init_db():
         if log_cols and "uuid" not in log_cols:
             # ตารางเก่าสร้างไม่สมบูรณ์ — drop แล้วสร้างใหม่
             cursor.execute("DROP TABLE access_logs")
+            cursor.execute("DROP TABLE IF EXISTS access_log_counts")
+            cursor.execute("DROP TABLE IF EXISTS access_log_hourly")
             conn.commit()
 
         cursor.execute(
@@ -169,12 +243,284 @@ def init_db():
         conn.commit()
 
         # สร้าง index หลัง commit ให้แน่ใจว่า column พร้อมแล้ว
+        # ทุก index มี rowid (= id) ต่อท้ายอยู่แล้ว → (..., scanned_at) เรียงตาม (scanned_at, id)
+        # ใช้ทำ keyset pagination ได้โดยไม่ต้อง sort
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_uuid ON access_logs(uuid)")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_logs_room ON access_logs(room)")
+        cursor.execute("DROP INDEX IF EXISTS idx_logs_room")  # แทนด้วย idx_logs_room_time
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_logs_room_time ON access_logs(room, scanned_at)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_logs_result_time ON access_logs(result, scanned_at)"
+        )
         cursor.execute(
             "CREATE INDEX IF NOT EXISTS idx_logs_scanned_at ON access_logs(scanned_at)"
         )
+
+        # จำนวน log ต่อ (room, result) — trigger อัปเดตใน transaction เดียวกับ insert/delete
+        # /api/access-logs เอา total จากตรงนี้แทน SELECT COUNT(*) ทุกหน้า
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'access_log_counts'"
+        )
+        counts_exist = cursor.fetchone() is not None
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS access_log_counts (
+                room    TEXT NOT NULL,
+                result  TEXT NOT NULL,
+                n       INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (room, result)
+            )
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_log_counts_insert
+            AFTER INSERT ON access_logs
+            BEGIN
+                INSERT INTO access_log_counts (room, result, n)
+                VALUES (COALESCE(NEW.room, ''), NEW.result, 1)
+                ON CONFLICT(room, result) DO UPDATE SET n = n + 1;
+            END
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_log_counts_delete
+            AFTER DELETE ON access_logs
+            BEGIN
+                UPDATE access_log_counts SET n = n - 1
+                WHERE room = COALESCE(OLD.room, '') AND result = OLD.result;
+            END
+            """
+        )
+        if not counts_exist:
+            # ครั้งแรก: นับจาก log ที่มีอยู่แล้ว
+            cursor.execute(
+                """
+                INSERT INTO access_log_counts (room, result, n)
+                SELECT COALESCE(room, ''), result, COUNT(*)
+                FROM access_logs GROUP BY COALESCE(room, ''), result
+                """
+            )
+
+        # rollup รายชั่วโมง (UTC) ต่อ (room, result) — dashboard stats / analytics อ่านจากตรงนี้
+        # trigger ทำงานใน transaction ของ log writer / batch upload / purge เอง
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'access_log_hourly'"
+        )
+        hourly_exist = cursor.fetchone() is not None
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS access_log_hourly (
+                hour    TEXT NOT NULL,      -- 'YYYY-MM-DD HH:00' (UTC เหมือน scanned_at)
+                room    TEXT NOT NULL,
+                result  TEXT NOT NULL,
+                n       INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (hour, room, result)
+            )
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_log_hourly_insert
+            AFTER INSERT ON access_logs
+            BEGIN
+                INSERT INTO access_log_hourly (hour, room, result, n)
+                VALUES (strftime('%Y-%m-%d %H:00', NEW.scanned_at),
+                        COALESCE(NEW.room, ''), NEW.result, 1)
+                ON CONFLICT(hour, room, result) DO UPDATE SET n = n + 1;
+            END
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_log_hourly_delete
+            AFTER DELETE ON access_logs
+            BEGIN
+                UPDATE access_log_hourly SET n = n - 1
+                WHERE hour = strftime('%Y-%m-%d %H:00', OLD.scanned_at)
+                  AND room = COALESCE(OLD.room, '') AND result = OLD.result;
+            END
+            """
+        )
+        if not hourly_exist:
+            cursor.execute(
+                """
+                INSERT INTO access_log_hourly (hour, room, result, n)
+                SELECT strftime('%Y-%m-%d %H:00', scanned_at), COALESCE(room, ''), result, COUNT(*)
+                FROM access_logs
+                WHERE scanned_at IS NOT NULL
+                GROUP BY 1, 2, 3
+                """
+            )
+        conn.commit()
+
+    init_log_search_index()
+
+
+# =====================
+# Access Log Search Index (FTS5 trigram)
+# =====================
+# search ใน /api/access-logs เป็น substring (LIKE '%x%') บน uuid / name / email / user_id
+# → B-tree index ช่วยไม่ได้ ต้อง scan ทั้งตาราง
+# ใช้ FTS5 tokenizer 'trigram' แบบ external content (ไม่เก็บข้อความซ้ำ)
+# trigger บน access_logs sync ให้เองทั้งตอน writer insert และตอน purge delete
+# ค้นหา >= 3 ตัวอักษร → MATCH บน index, สั้นกว่านั้น trigram ใช้ไม่ได้ → LIKE เหมือนเดิม
+LOG_SEARCH_MIN_FTS = 3
+_log_fts_enabled = False
+
+
+def init_log_search_index():
+    """สร้าง access_logs_fts + trigger (ต้องเรียกหลังสร้าง access_logs) — SQLite ไม่มี FTS5 = ใช้ LIKE"""
+    global _log_fts_enabled
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'access_logs_fts'"
+        )
+        fts_exist = cursor.fetchone() is not None
+        try:
+            cursor.execute(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS access_logs_fts USING fts5(
+                    uuid, name, email, user_id,
+                    content = 'access_logs', content_rowid = 'id',
+                    tokenize = 'trigram'
+                )
+                """
+            )
+        except sqlite3.OperationalError as e:
+            # SQLite เก่ากว่า 3.34 / build ไม่มี FTS5
+            print(f"[LOGS] FTS5 trigram unavailable, search uses LIKE: {e}")
+            _log_fts_enabled = False
+            return
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_logs_fts_insert
+            AFTER INSERT ON access_logs
+            BEGIN
+                INSERT INTO access_logs_fts (rowid, uuid, name, email, user_id)
+                VALUES (NEW.id, NEW.uuid, NEW.name, NEW.email, NEW.user_id);
+            END
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_logs_fts_delete
+            AFTER DELETE ON access_logs
+            BEGIN
+                INSERT INTO access_logs_fts (access_logs_fts, rowid, uuid, name, email, user_id)
+                VALUES ('delete', OLD.id, OLD.uuid, OLD.name, OLD.email, OLD.user_id);
+            END
+            """
+        )
+        cursor.execute(
+            """
+            CREATE TRIGGER IF NOT EXISTS trg_logs_fts_update
+            AFTER UPDATE OF uuid, name, email, user_id ON access_logs
+            BEGIN
+                INSERT INTO access_logs_fts (access_logs_fts, rowid, uuid, name, email, user_id)
+                VALUES ('delete', OLD.id, OLD.uuid, OLD.name, OLD.email, OLD.user_id);
+                INSERT INTO access_logs_fts (rowid, uuid, name, email, user_id)
+                VALUES (NEW.id, NEW.uuid, NEW.name, NEW.email, NEW.user_id);
+            END
+            """
+        )
+        if not fts_exist:
+            # ครั้งแรก: index log ที่มีอยู่แล้วทั้งหมด
+            cursor.execute("INSERT INTO access_logs_fts (access_logs_fts) VALUES ('rebuild')")
+            print("[LOGS] built access_logs_fts search index")
         conn.commit()
+    _log_fts_enabled = True
+
+
+# คำที่เจอบ่อย (เช่นนามสกุล) LIKE ไล่ index ตามเวลาเจอครบหน้าเร็วกว่า FTS ที่ต้องรวม posting list
+# → ลอง LIKE ก่อนด้วยงบ VM step จำกัด (ไม่กี่ ms) ถ้าไม่ครบหน้าค่อยใช้ FTS
+LOG_SEARCH_PROBE_STEPS = int(os.getenv("LOG_SEARCH_PROBE_STEPS", "50000"))
+
+
+def log_search_uses_index(search: str) -> bool:
+    return _log_fts_enabled and len(search) >= LOG_SEARCH_MIN_FTS
+
+
+def log_search_condition(search: str, use_index: bool = True):
+    """
+    เงื่อนไข WHERE สำหรับ search (substring, ไม่สนตัวพิมพ์เล็ก/ใหญ่ แบบ LIKE เดิม)
+    คืน (sql, params) ไว้ต่อกับเงื่อนไขอื่นของ access_logs
+    """
+    if use_index and log_search_uses_index(search):
+        # phrase ใน trigram = substring ภายใน column เดียว (เหมือน LIKE '%x%' OR ...)
+        phrase = '"' + search.replace('"', '""') + '"'
+        return (
+            "id IN (SELECT rowid FROM access_logs_fts WHERE access_logs_fts MATCH ?)",
+            [phrase],
+        )
+    like = f"%{search}%"
+    return (
+        "(uuid LIKE ? OR name LIKE ? OR email LIKE ? OR user_id LIKE ?)",
+        [like, like, like, like],
+    )
+
+
+def _fetch_with_budget(conn, sql, params, max_steps: int):
+    """รัน query แต่ยอมให้ใช้ไม่เกิน max_steps VM step — เกินคืน None"""
+    ticks = [0]
+
+    def _tick():
+        ticks[0] += 1
+        return ticks[0] * 1000 > max_steps  # คืนค่าจริง = SQLite interrupt query
+
+    conn.set_progress_handler(_tick, 1000)
+    try:
+        return conn.execute(sql, params).fetchall()
+    except sqlite3.OperationalError as e:
+        if "interrupt" not in str(e):
+            raise
+        return None
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def fetch_log_page(
+    conn, conditions, params, search="", after=None, limit=200, offset=0, use_index=True
+):
+    """
+    หนึ่งหน้าของ access_logs เรียงใหม่ → เก่าตาม (scanned_at, id)
+    conditions / params = filter อื่น (room, result), after = (scanned_at, id) ของ cursor
+    use_index=False สำหรับ database ที่ไม่มี access_logs_fts (ไฟล์ archive)
+    """
+    conditions, params = list(conditions), list(params)
+    if after is not None:
+        conditions.append("(scanned_at, id) < (?, ?)")
+        params.extend(after)
+
+    def _page(search_sql=None, search_params=()):
+        conds = conditions + ([search_sql] if search_sql else [])
+        where = ("WHERE " + " AND ".join(conds)) if conds else ""
+        sql = f"""
+            SELECT id, uuid, user_id, name, email, role,
+                   room, result, method, scanned_at
+            FROM access_logs
+            {where}
+            ORDER BY scanned_at DESC, id DESC
+            LIMIT ? OFFSET ?
+        """
+        return sql, params + list(search_params) + [limit, offset]
+
+    if not search:
+        return conn.execute(*_page()).fetchall()
+    if not use_index:
+        return conn.execute(*_page(*log_search_condition(search, use_index=False))).fetchall()
+    if log_search_uses_index(search):
+        # คำที่เจอบ่อย: LIKE ตาม index เวลาเจอครบหน้าก่อนหมดงบ
+        rows = _fetch_with_budget(
+            conn, *_page(*log_search_condition(search, use_index=False)),
+            LOG_SEARCH_PROBE_STEPS,
+        )
+        if rows is not None:
+            return rows
+    return conn.execute(*_page(*log_search_condition(search))).fetchall()
 
 
 # =====================
@@ -256,34 +602,55 @@ def append_user_to_csv(uuid, user_id, first_name, last_name, email, role):
 # =====================
 # Access Log Helper
 # =====================
+# write-behind: request thread แค่ enqueue → background thread group commit
+# (executemany ใน transaction เดียว) ทุก LOG_FLUSH_INTERVAL_MS หรือครบ LOG_FLUSH_BATCH แถว
+_ACCESS_LOG_INSERT_SQL = """
+    INSERT INTO access_logs
+        (uuid, user_id, name, email, role, room, result, method, scanned_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def _flush_access_logs(rows):
+    with get_db_connection() as conn:
+        conn.executemany(_ACCESS_LOG_INSERT_SQL, rows)
+        conn.commit()
+
+
+access_log_writer = BatchWriter(
+    "access-log",
+    _flush_access_logs,
+    flush_interval_ms=int(os.getenv("LOG_FLUSH_INTERVAL_MS", "20")),
+    max_batch=int(os.getenv("LOG_FLUSH_BATCH", "200")),
+)
+
+
+def _access_log_row(uuid, user, room, result, method, scanned_at=None):
+    """แปลงข้อมูล scan → tuple ตามลำดับ column ของ INSERT ใน _flush_access_logs"""
+    return (
+        uuid,
+        user["user_id"] if user else None,
+        f"{user['first_name']} {user['last_name']}" if user else None,
+        user["email"] if user else None,
+        user["role"] if user else None,
+        room or None,
+        result,
+        method,
+        scanned_at or datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+    )
+
+
 def write_access_log(
     uuid: str, user: dict | None, room: str, result: str, method: str = "rfid"
 ):
     """
-    บันทึก access log ทุกครั้งที่มีการสแกน RFID
+    บันทึก access log ทุกครั้งที่มีการสแกน RFID (async ผ่าน access_log_writer)
     result: 'granted' | 'denied'
-    method: 'rfid' | 'web'
+    method: 'rfid' | 'rfid_offline' | 'web'
+    scanned_at ใช้เวลาตอน enqueue (UTC แบบเดียวกับ CURRENT_TIMESTAMP)
     """
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                INSERT INTO access_logs (uuid, user_id, name, email, role, room, result, method)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """,
-                (
-                    uuid,
-                    user["user_id"] if user else None,
-                    f"{user['first_name']} {user['last_name']}" if user else None,
-                    user["email"] if user else None,
-                    user["role"] if user else None,
-                    room or None,
-                    result,
-                    method,
-                ),
-            )
-            conn.commit()
+        access_log_writer.put(_access_log_row(uuid, user, room, result, method))
     except Exception as e:
         print(f"[LOG] write_access_log error: {e}")
 
@@ -310,8 +677,18 @@ def get_users():
 
 
 def get_user_by_uuid(uuid):
+    """
+    Lookup user จาก UUID บัตร — ใช้ in-memory index เป็นหลัก (ไม่แตะ DB ตอนสแกน)
+    fallback ไป query DB ถ้าโหลด index ไม่สำเร็จ
+    """
     if not uuid:
         return None
+    if _ensure_user_index():
+        return lookup_user_index(uuid)
+    return _query_user_by_uuid(uuid)
+
+
+def _query_user_by_uuid(uuid):
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -330,6 +707,195 @@ def get_user_by_uuid(uuid):
         return None
 
 
+# =====================
+# UUID Index (in-memory)
+# =====================
+# index ของ users_reg (is_deleted = 0) keyed by UUID — โหลดตอน start
+# add_user / update_user_route / delete_user ต้องเรียก _on_users_reg_changed()
+# หลัง commit เพื่อให้ index ตรงกับตารางเสมอ
+_USER_INDEX_FIELDS = ("uuid", "user_id", "first_name", "last_name", "email", "role")
+
+_user_index_lock = threading.Lock()
+_user_index = {}  # { uuid: {uuid, user_id, first_name, last_name, email, role} }
+_user_index_ids = {}  # { users_reg.id: uuid }
+_user_index_loaded = False
+_user_index_stats = {"hits": 0, "misses": 0, "reloads": 0, "refreshes": 0}
+# version ของ users_reg ใน runtime_state — worker อื่นแก้ users_reg แล้ว bump
+# → process นี้เห็น version ไม่ตรงแล้ว reload index ทั้งก้อน
+_user_index_version = 0
+
+
+def load_user_index():
+    """โหลด users_reg ทั้งหมดเข้า index ใหม่ (เรียกตอน start หรือ force reload)"""
+    global _user_index, _user_index_ids, _user_index_loaded, _user_index_version
+    version = runtime_state.version("users_reg")
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT id, uuid, user_id, first_name, last_name, email, role
+                FROM users_reg
+                WHERE is_deleted = 0
+                ORDER BY id
+                """
+            )
+            rows = cursor.fetchall()
+    except sqlite3.Error as e:
+        print(f"[INDEX] load_user_index error: {e}")
+        return False
+
+    index, ids = {}, {}
+    for row in rows:
+        # UUID ซ้ำ (ไม่ควรเกิด) → ใช้แถวแรกเหมือน query เดิม
+        if row["uuid"] in index:
+            continue
+        index[row["uuid"]] = {k: row[k] for k in _USER_INDEX_FIELDS}
+        ids[row["id"]] = row["uuid"]
+
+    with _user_index_lock:
+        _user_index, _user_index_ids = index, ids
+        _user_index_loaded = True
+        _user_index_version = version
+        _user_index_stats["reloads"] += 1
+    print(f"[INDEX] loaded {len(index)} users into UUID index")
+    return True
+
+
+def _ensure_user_index():
+    if _user_index_loaded and _user_index_version == runtime_state.version("users_reg"):
+        return True
+    if _user_index_loaded:
+        # users_reg ถูกแก้จาก worker process อื่น
+        invalidate_scan_cache()
+    return load_user_index()
+
+
+def lookup_user_index(uuid):
+    with _user_index_lock:
+        user = _user_index.get(uuid)
+        if user is None:
+            _user_index_stats["misses"] += 1
+        else:
+            _user_index_stats["hits"] += 1
+            user = dict(user)
+    user_index_lookups_total.inc(outcome="miss" if user is None else "hit")
+    return user
+
+
+def _refresh_user_index_entry(id):
+    """sync แถวเดียวของ users_reg (ตาม id) เข้า index หลังเพิ่ม/แก้ไข/ลบ user"""
+    if not _user_index_loaded:
+        return
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT id, uuid, user_id, first_name, last_name, email, role, is_deleted
+                FROM users_reg WHERE id = ?
+                """,
+                (id,),
+            )
+            row = cursor.fetchone()
+    except sqlite3.Error as e:
+        # sync ไม่ได้ → ทิ้ง index ทั้งก้อน ให้โหลดใหม่ตอน lookup ครั้งถัดไป
+        print(f"[INDEX] refresh error (id={id}): {e} — invalidating index")
+        invalidate_user_index()
+        return
+
+    freed_uuid = None
+    with _user_index_lock:
+        _user_index_stats["refreshes"] += 1
+        old_uuid = _user_index_ids.pop(id, None)
+        if old_uuid is not None:
+            _user_index.pop(old_uuid, None)
+            freed_uuid = old_uuid
+        if row and not row["is_deleted"] and row["uuid"] not in _user_index:
+            _user_index[row["uuid"]] = {k: row[k] for k in _USER_INDEX_FIELDS}
+            _user_index_ids[id] = row["uuid"]
+            if freed_uuid == row["uuid"]:
+                freed_uuid = None
+
+    # UUID ที่หลุดจาก index อาจมีแถวอื่น (active) ใช้อยู่ — reload ทั้งก้อนให้ชัวร์
+    if freed_uuid is not None and _query_user_by_uuid(freed_uuid):
+        load_user_index()
+
+
+def _on_users_reg_changed(id):
+    """เรียกหลัง users_reg เปลี่ยน — sync UUID index และ UUID ใน access_grants"""
+    global _user_index_version
+    in_sync = _user_index_version == runtime_state.version("users_reg")
+    version = runtime_state.bump_version("users_reg")  # แจ้ง worker process อื่น
+    if in_sync:
+        _user_index_version = version  # process นี้ refresh แถวเองด้านล่าง ไม่ต้อง reload
+    _refresh_user_index_entry(id)
+    sync_grant_uuids()
+    invalidate_scan_cache()
+
+
+def invalidate_user_index():
+    global _user_index_loaded
+    with _user_index_lock:
+        _user_index_loaded = False
+
+
+def user_index_stats():
+    with _user_index_lock:
+        lookups = _user_index_stats["hits"] + _user_index_stats["misses"]
+        return {
+            **_user_index_stats,
+            "loaded": _user_index_loaded,
+            "size": len(_user_index),
+            "hit_ratio": (
+                round(_user_index_stats["hits"] / lookups, 4) if lookups else None
+            ),
+        }
+
+
+user_index_lookups_total = Counter(
+    "user_index_lookups_total", "UUID index lookups by outcome", ("outcome",)
+)
+Gauge("user_index_size", "Users held in the UUID index").set_function(
+    lambda: len(_user_index)
+)
+
+
+def check_user_index_consistency():
+    """
+    เทียบ index กับตาราง users_reg — คืน UUID ที่หายจาก index (missing),
+    ค้างอยู่ใน index ทั้งที่ถูกลบแล้ว (stale) และข้อมูลไม่ตรงกัน (mismatched)
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT uuid, user_id, first_name, last_name, email, role
+            FROM users_reg
+            WHERE is_deleted = 0
+            ORDER BY id
+            """
+        )
+        table = {}
+        for row in cursor.fetchall():
+            table.setdefault(row["uuid"], {k: row[k] for k in _USER_INDEX_FIELDS})
+
+    with _user_index_lock:
+        index = dict(_user_index)
+
+    missing = sorted(u for u in table if u not in index)
+    stale = sorted(u for u in index if u not in table)
+    mismatched = sorted(u for u in table if u in index and index[u] != table[u])
+    return {
+        "consistent": not (missing or stale or mismatched),
+        "table_size": len(table),
+        "index_size": len(index),
+        "missing": missing,
+        "stale": stale,
+        "mismatched": mismatched,
+    }
+
+
 def get_user_by_email(email):
     if not email:
         return None
@@ -391,6 +957,8 @@ def add_user(uuid, user_id, first_name, last_name, email, role="student"):
             conn.commit()
             user_id_created = cursor.lastrowid
 
+        _on_users_reg_changed(user_id_created)
+
         try:
             append_user_to_csv(uuid, user_id, first_name, last_name, email, role)
         except Exception:
@@ -414,6 +982,7 @@ def delete_user(id):
             affected = cursor.rowcount
 
         if affected > 0:
+            _on_users_reg_changed(id)
             rebuild_csv_from_db()
             return {"success": True, "message": "ลบผู้ใช้สำเร็จ"}
         return {"success": False, "message": "ไม่สามารถลบผู้ใช้ได้"}
@@ -461,10 +1030,9 @@ def check_is_user_id_exist_except_id(user_id, current_id):
 # =====================
 # Door Command State (per-room)
 # =====================
-room_commands = {}  # { room_name: "open" | "close" }
-room_command_time = {}  # { room_name: datetime } — เก็บเวลาที่ set command
-COMMAND_TTL = 10  # วิ — command จะหมดอายุหลัง 10 วิ ถ้า ESP32 ไม่ได้ poll
-room_last_seen = {}  # { room_name: datetime }
+# คิวคำสั่งต่อห้อง (seq + ack + expiry) และ last_seen อยู่ใน runtime_state
+# long-poll สูงสุดกี่วินาทีต่อ request (ESP32 ส่ง ?wait=N มา)
+MAX_COMMAND_WAIT = int(os.getenv("DOOR_COMMAND_MAX_WAIT", "30"))
 
 
 # =====================
@@ -512,6 +1080,71 @@ def get_all_admin_users():
         return jsonify({"error": str(e)}), 500
 
 
+def _verify_admin_token():
+    """
+    ตรวจ JWT ของ admin (@kku.ac.th) จาก Authorization header
+    คืน None ถ้าผ่าน หรือ (response, status) ให้ route return ต่อได้เลย
+    """
+    auth_header = request.headers.get("Authorization", "")
+    if not auth_header.startswith("Bearer "):
+        return jsonify({"error": "Token is missing"}), 401
+    try:
+        import jwt as pyjwt
+
+        data = pyjwt.decode(
+            auth_header.split(" ")[1], app.config["SECRET_KEY"], algorithms=["HS256"]
+        )
+        if not data.get("email", "").endswith("@kku.ac.th"):
+            return jsonify({"error": "ไม่มีสิทธิ์"}), 403
+    except Exception:
+        return jsonify({"error": "Invalid token"}), 401
+    return None
+
+
+@app.route("/api/admin/user-index", methods=["GET"])
+def get_user_index_status():
+    """
+    สถานะ UUID index (hit/miss) + ตรวจความตรงกันกับตาราง users_reg
+    ?reload=true → โหลด index ใหม่จาก DB ก่อนตรวจ
+    """
+    denied = _verify_admin_token()
+    if denied:
+        return denied
+    if request.args.get("reload", "false").lower() == "true":
+        load_user_index()
+    try:
+        consistency = check_user_index_consistency()
+    except sqlite3.Error as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify(
+        {"success": True, "stats": user_index_stats(), "consistency": consistency}
+    )
+
+
+@app.route("/api/admin/db-pool", methods=["GET"])
+def get_db_pool_status():
+    """สถิติ connection pool (created / reused / in_use) และ pragma ที่ใช้อยู่"""
+    denied = _verify_admin_token()
+    if denied:
+        return denied
+    return jsonify({"success": True, "stats": pool_stats()})
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """
+    Prometheus text exposition — latency ต่อ phase ของ scan, ต่อ endpoint,
+    SQLite query timing, background writer และ scheduler thread
+    ถ้าตั้ง METRICS_TOKEN ไว้ ต้องส่ง Authorization: Bearer <METRICS_TOKEN>
+    """
+    token = os.getenv("METRICS_TOKEN", "")
+    if token and request.headers.get("Authorization", "") != f"Bearer {token}":
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(
+        REGISTRY.render(), mimetype="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 @app.route("/api/user/lookup", methods=["GET"])
 def lookup_user_by_student_id():
     """
@@ -581,8 +1214,7 @@ def lookup_user_by_student_id():
 def door_open():
     data = request.get_json(silent=True) or {}
     room = data.get("room", "")
-    room_commands[room] = "open"
-    room_command_time[room] = datetime.utcnow()
+    seq = runtime_state.post_command(room, "open")
     try:
         import jwt as pyjwt
 
@@ -599,15 +1231,14 @@ def door_open():
         )
     except Exception as e:
         print(f"[LOG] door_open log error: {e}")
-    return jsonify({"success": True, "message": "Door open command sent"})
+    return jsonify({"success": True, "message": "Door open command sent", "seq": seq})
 
 
 @app.route("/api/door/close", methods=["POST"])
 def door_close():
     data = request.get_json(silent=True) or {}
     room = data.get("room", "")
-    room_commands[room] = "close"
-    room_command_time[room] = datetime.utcnow()
+    seq = runtime_state.post_command(room, "close")
     try:
         import jwt as pyjwt
 
@@ -624,122 +1255,331 @@ def door_close():
         )
     except Exception as e:
         print(f"[LOG] door_close log error: {e}")
-    return jsonify({"success": True, "message": "Door close command sent"})
+    return jsonify({"success": True, "message": "Door close command sent", "seq": seq})
 
 
 @app.route("/api/door/command", methods=["GET"])
 def get_door_command():
+    """
+    ESP32_Door รับคำสั่งจาก web — คืน {"command": ..., "seq": n}
+    ?wait=N (วินาที) = long-poll: ถือ request ไว้จนมีคำสั่งของห้องนี้หรือครบ N วิ
+    ?ack=seq         = ยืนยันว่าทำคำสั่ง seq (ที่ได้จาก poll ก่อนหน้า) เสร็จแล้ว
+    ไม่ส่ง wait = ตอบทันทีแบบ poll เดิม (firmware เก่า)
+    """
     room = request.args.get("room", "")
+    try:
+        wait = min(max(float(request.args.get("wait", 0)), 0.0), MAX_COMMAND_WAIT)
+    except ValueError:
+        wait = 0.0
+    ack = request.args.get("ack", type=int)
+    if room:
+        runtime_state.touch_room(room)
+    cmd, seq = runtime_state.take_command(room, wait, ack)
+    if room and wait > 0:
+        runtime_state.touch_room(room)
+    return jsonify({"command": cmd, "seq": seq})
+
+
+@app.route("/api/door/command/ack", methods=["POST"])
+def ack_door_command():
+    """ESP32_Door ยืนยันคำสั่งแยกจาก poll — body: {"room": ..., "seq": n}"""
+    data = request.get_json(silent=True) or {}
+    room = data.get("room", "")
+    try:
+        seq = int(data.get("seq"))
+    except (TypeError, ValueError):
+        return jsonify({"error": "seq is required"}), 400
     if room:
-        room_last_seen[room] = datetime.utcnow()
-    cmd = "idle"
-    if room in room_commands:
-        # เช็ค TTL — command อยู่ได้นาน COMMAND_TTL วิ
-        age = (
-            datetime.utcnow() - room_command_time.get(room, datetime.utcnow())
-        ).total_seconds()
-        if age <= COMMAND_TTL:
-            cmd = room_commands[room]
-        # clear command หลัง ESP32 อ่านแล้ว (หรือ expired)
-        del room_commands[room]
-        room_command_time.pop(room, None)
-    return jsonify({"command": cmd})
+        runtime_state.touch_room(room)
+    return jsonify({"success": runtime_state.ack_command(room, seq), "seq": seq})
+
+
+@app.route("/api/admin/door-commands", methods=["GET"])
+def get_door_command_stats():
+    """คิวคำสั่งประตูที่ค้างอยู่ + สถิติ posted / delivered / acked / expired"""
+    denied = _verify_admin_token()
+    if denied:
+        return denied
+    return jsonify({**runtime_state.command_stats(), "state": runtime_state.stats()})
 
 
 # =====================
 # Booking-based access check
 # =====================
-def _check_booking_access(email: str, room: str) -> str:
+def _check_booking_access(uuid: str, room: str, at: float = None, cursor=None) -> str:
     """
-    ตรวจสอบว่า user (email) มีสิทธิ์เข้าห้อง room ณ เวลาปัจจุบันหรือไม่
-    คืน 'granted' ถ้ามี booking approved ตรงกับห้องและเวลาปัจจุบัน
+    ตรวจสอบว่าบัตร uuid มีสิทธิ์เข้าห้อง room ณ เวลา at (default = ปัจจุบัน) หรือไม่
+    คืน 'granted' ถ้ามี grant จาก booking approved ตรงกับห้องและเวลาปัจจุบัน
     คืน 'denied' ถ้าไม่มี
+    (access_grants ถูก maintain โดย booking.py — ไม่ต้อง scan bookings ตอนสแกน)
     """
     if not room:
         # ถ้า ESP32 ไม่ส่ง room มา (เช่น firmware เก่า) ให้ผ่านก่อน
         return "granted"
     try:
-        from datetime import datetime, timezone, timedelta
-
-        # เวลาไทย UTC+7
-        tz_thai = timezone(timedelta(hours=7))
-        now = datetime.now(tz_thai)
-        today = now.strftime("%Y-%m-%d")
-        now_time = now.strftime("%H:%M")
-
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT COUNT(*) FROM bookings
-                WHERE user_email = ?
-                  AND room = ?
-                  AND date = ?
-                  AND status = 'approved'
-                  AND start_time <= ?
-                  AND end_time > ?
-                """,
-                (email, room, today, now_time, now_time),
-            )
-            has_booking = cursor.fetchone()[0] > 0
-        return "granted" if has_booking else "denied"
+        return "granted" if has_access_grant(uuid, room, at, cursor) else "denied"
     except Exception as e:
         print(f"[ACCESS] _check_booking_access error: {e}")
         return "denied"
 
 
-@app.route("/api/send_uuid", methods=["POST"])
-def get_uuid():
-    data = request.get_json()
-    uuid = data.get("uuid")
-    # รับ room จาก ESP32 (ถ้าส่งมา) — backward compatible ถ้าไม่ส่งก็ยังใช้ได้
-    room = data.get("room", "")
-    # source: "register" = มาจาก ESP32_Register (ไม่ต้อง notify), "door" = มาจาก ESP32_Door
-    source = data.get("source", "door")
-
-    set_latest_uuid(uuid)
-
-    user = get_user_by_uuid(uuid)
-
-    # ตรวจสอบสิทธิ์เข้าห้อง
-    # - source="register" = ESP32_Register ไม่เช็ค booking (แค่อ่านบัตรเพื่อ register)
-    # - admin เข้าได้เสมอ ไม่ต้องจอง
-    # - student/บุคคลทั่วไป ต้องมี booking approved ในห้องนี้ ณ เวลาปัจจุบัน
+def _decide_access(uuid, room, source, at=None, cursor=None):
+    """
+    ตัดสินสิทธิ์เข้าห้องของ scan หนึ่งครั้ง — คืน (user, result)
+    - source="register" = ESP32_Register ไม่เช็ค booking (แค่อ่านบัตรเพื่อ register)
+    - admin เข้าได้เสมอ ไม่ต้องจอง
+    - student/บุคคลทั่วไป ต้องมี booking approved ในห้องนี้ ณ เวลา at (default = ตอนนี้)
+    """
+    with scan_phase_seconds.time(phase="lookup"):
+        user = get_user_by_uuid(uuid)
     if user and source != "register":
         if user.get("role") == "admin":
             result = "granted"
         else:
-            result = _check_booking_access(user["email"], room)
+            with scan_phase_seconds.time(phase="booking_check"):
+                result = _check_booking_access(uuid, room, at, cursor)
     elif user and source == "register":
         result = "granted"
     else:
         result = "denied"
+    return user, result
+
+
+# =====================
+# Real-time events — Socket.IO rooms แทนการ broadcast ทุก client
+# =====================
+# client ต้องส่ง JWT ของ admin ตอน connect: io(url, { auth: { token } })
+# แล้ว emit("subscribe", {...}) เลือกรับเฉพาะที่ต้องการ:
+#   {"registration": true}  → "registration" : scan จาก ESP32_Register (หน้า register บัตร)
+#   {"rooms": ["EN4101"]}   → "room:EN4101"  : scan ที่ประตูห้องนั้น
+#   {"all_rooms": true}     → "doors"        : scan ที่ประตูทุกห้อง
+#   {"door_status": true}   → "door-status"  : event door_status เมื่อประตู online/offline
+SOCKET_REGISTRATION_ROOM = "registration"
+SOCKET_ALL_DOORS_ROOM = "doors"
+SOCKET_DOOR_STATUS_ROOM = "door-status"
+
+_socket_clients = {}  # sid -> email ของ admin ที่ connect อยู่
+_socket_clients_lock = threading.Lock()
+
+socket_emits_total = Counter(
+    "socketio_emits_total", "Socket.IO events emitted by target", ("event", "target")
+)
+socket_fanout_total = Counter(
+    "socketio_fanout_recipients_total",
+    "Clients that received a Socket.IO event (sum of fan-out)",
+    ("event",),
+)
+Gauge("socketio_clients", "Authenticated Socket.IO clients connected").set_function(
+    lambda: len(_socket_clients)
+)
+
+
+def _socket_room_for_door(room: str) -> str:
+    return f"room:{room}"
+
+
+@socketio.on("connect")
+def _socket_connect(auth=None):
+    """รับเฉพาะ admin (@kku.ac.th) — token มาจาก auth payload หรือ ?token="""
+    token = (auth or {}).get("token") if isinstance(auth, dict) else None
+    token = token or request.args.get("token", "")
+    if not token:
+        return False
+    try:
+        import jwt as pyjwt
+
+        data = pyjwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
+    except Exception:
+        return False
+    email = data.get("email", "")
+    if not email.endswith("@kku.ac.th"):
+        return False
+    with _socket_clients_lock:
+        _socket_clients[request.sid] = email
+
+
+@socketio.on("disconnect")
+def _socket_disconnect(*_):
+    with _socket_clients_lock:
+        _socket_clients.pop(request.sid, None)
+
+
+def _socket_targets(data):
+    data = data if isinstance(data, dict) else {}
+    targets = [_socket_room_for_door(r) for r in data.get("rooms") or [] if r]
+    if data.get("registration"):
+        targets.append(SOCKET_REGISTRATION_ROOM)
+    if data.get("all_rooms"):
+        targets.append(SOCKET_ALL_DOORS_ROOM)
+    if data.get("door_status"):
+        targets.append(SOCKET_DOOR_STATUS_ROOM)
+    return targets
+
+
+@socketio.on("subscribe")
+def _socket_subscribe(data=None):
+    targets = _socket_targets(data)
+    for target in targets:
+        join_room(target)
+    return {"subscribed": targets}
+
+
+@socketio.on("unsubscribe")
+def _socket_unsubscribe(data=None):
+    targets = _socket_targets(data)
+    for target in targets:
+        leave_room(target)
+    return {"unsubscribed": targets}
+
+
+def emit_scan_event(payload: dict, room: str, source: str):
+    """
+    ส่ง uuid_update เฉพาะ client ที่ subscribe ไว้ — emit ครั้งเดียวถึงหลาย room
+    (python-socketio encode packet ครั้งเดียวแล้วส่งซ้ำให้ทุกคน) คืนจำนวนผู้รับใน process นี้
+    """
+    if source == "register":
+        targets, target_label = [SOCKET_REGISTRATION_ROOM], "registration"
+    else:
+        targets, target_label = [SOCKET_ALL_DOORS_ROOM], "doors"
+        if room:
+            targets.append(_socket_room_for_door(room))
+    # emit เสมอ — มี SOCKETIO_MESSAGE_QUEUE แล้ว client อาจอยู่ที่ worker อื่น
+    # จำนวนผู้รับใน process นี้ใช้แค่กับ metric
+    recipients = sum(
+        1 for _ in socketio.server.manager.get_participants("/", targets)
+    )
+    socket_emits_total.inc(event="uuid_update", target=target_label)
+    if recipients:
+        socket_fanout_total.inc(recipients, event="uuid_update")
+    socketio.emit("uuid_update", payload, to=targets)
+    return recipients
+
+
+# =====================
+# Scan debounce — reader รายงานบัตรใบเดิมซ้ำหลายครั้งภายในวินาทีเดียว
+# =====================
+# read ซ้ำของ (uuid, room, source) เดิมภายใน window ใช้ผลตัดสินเดิม
+# ไม่เขียน access log / ไม่ notify / ไม่ emit ซ้ำ — นับไว้ใน rfid_scans_debounced_total
+# ตั้ง SCAN_DEBOUNCE_SECONDS=0 เพื่อปิด
+SCAN_DEBOUNCE_SECONDS = float(os.getenv("SCAN_DEBOUNCE_SECONDS", "2"))
+_SCAN_CACHE_SWEEP_SIZE = 1024
+_scan_cache = {}  # (uuid, room, source) -> (expires_at, user, result)
+_scan_cache_lock = threading.Lock()
+_scan_cache_grants_version = 0  # runtime_state version "access_grants" ตอนเติม cache
+
+scans_debounced_total = Counter(
+    "rfid_scans_debounced_total",
+    "Repeated card reads answered from the decision cache (not logged)",
+    ("result", "source"),
+)
+Gauge("rfid_scan_cache_size", "Entries in the scan decision cache").set_function(
+    lambda: len(_scan_cache)
+)
+
+
+def _cached_decision(key):
+    """คืน (user, result) ถ้า key นี้เพิ่งถูกตัดสินภายใน window ไม่งั้นคืน None"""
+    if SCAN_DEBOUNCE_SECONDS <= 0:
+        return None
+    _ensure_user_index()  # ล้าง cache ถ้า users_reg ถูกแก้จาก process อื่น
+    _ensure_scan_cache_grants()  # ... หรือ booking ถูก approve/reject/ลบจาก process อื่น
+    now = time.monotonic()
+    with _scan_cache_lock:
+        entry = _scan_cache.get(key)
+        if entry is None or entry[0] < now:
+            return None
+        return entry[1], entry[2]
+
+
+def _remember_decision(key, user, result):
+    if SCAN_DEBOUNCE_SECONDS <= 0:
+        return
+    now = time.monotonic()
+    with _scan_cache_lock:
+        if len(_scan_cache) >= _SCAN_CACHE_SWEEP_SIZE:
+            for k in [k for k, v in _scan_cache.items() if v[0] < now]:
+                del _scan_cache[k]
+        _scan_cache[key] = (now + SCAN_DEBOUNCE_SECONDS, user, result)
+
+
+def invalidate_scan_cache():
+    """ล้างผลตัดสินที่ cache ไว้ — เรียกเมื่อข้อมูลผู้ใช้หรือสิทธิ์เข้าห้องเปลี่ยน"""
+    with _scan_cache_lock:
+        _scan_cache.clear()
+
+
+def _ensure_scan_cache_grants():
+    global _scan_cache_grants_version
+    version = runtime_state.version("access_grants")
+    if version != _scan_cache_grants_version:
+        _scan_cache_grants_version = version
+        invalidate_scan_cache()
+
+
+@on_grants_changed
+def _on_access_grants_changed():
+    """booking.py เรียกหลัง commit ที่แก้ access_grants — ผลที่ cache ไว้อาจไม่ถูกแล้ว"""
+    global _scan_cache_grants_version
+    _scan_cache_grants_version = runtime_state.bump_version("access_grants")
+    invalidate_scan_cache()
+
+
+@app.route("/api/send_uuid", methods=["POST"])
+def get_uuid():
+    data = request.get_json()
+    uuid = data.get("uuid")
+    # รับ room จาก ESP32 (ถ้าส่งมา) — backward compatible ถ้าไม่ส่งก็ยังใช้ได้
+    room = data.get("room", "")
+    # source: "register" = มาจาก ESP32_Register (ไม่ต้อง notify), "door" = มาจาก ESP32_Door
+    source = data.get("source", "door")
+
+    set_latest_uuid(uuid)
+
+    # read ซ้ำภายใน debounce window → ตอบผลเดิม ไม่ทำ log / notify / emit ซ้ำ
+    cache_key = (uuid, room, source)
+    cached = _cached_decision(cache_key)
+    if cached is not None:
+        user, result = cached
+        scans_debounced_total.inc(result=result, source=source)
+        body = {
+            "status": "ok" if result == "granted" else "denied",
+            "user": user,
+            "debounced": True,
+        }
+        return jsonify(body), 200 if result == "granted" else 403
+
+    # ตรวจสอบสิทธิ์เข้าห้อง
+    user, result = _decide_access(uuid, room, source)
+    _remember_decision(cache_key, user, result)
+
+    scans_total.inc(result=result, source=source)
 
     # บันทึก Access Log ทุกครั้งที่สแกน
-    write_access_log(uuid=uuid, user=user, room=room, result=result, method="rfid")
+    with scan_phase_seconds.time(phase="log_write"):
+        write_access_log(uuid=uuid, user=user, room=room, result=result, method="rfid")
 
     # Trigger notification เมื่อ RFID denied — เฉพาะ door เท่านั้น ไม่แจ้งตอน register
     if result == "denied" and source != "register":
-        print(
-            f"[DEBUG] calling notify_rfid_denied: uuid={uuid} room={room} source={source}"
-        )
-        notify_rfid_denied(uuid=uuid, room=room)
-        print(f"[DEBUG] notify_rfid_denied done")
+        # enqueue เท่านั้น — dispatcher เขียน notification ของ admin ทุกคนใน background
+        with scan_phase_seconds.time(phase="notify"):
+            notify_rfid_denied(uuid=uuid, room=room)
 
-    socketio.emit(
-        "uuid_update",
-        {
-            "uuid": uuid,
-            "user_id": user["user_id"] if user else "",
-            "first_name": user["first_name"] if user else "",
-            "last_name": user["last_name"] if user else "",
-            "email": user["email"] if user else "",
-            "role": user["role"] if user else "",
-            "room": room,
-            "result": result,
-            "source": source,
-        },
-    )
+    with scan_phase_seconds.time(phase="socket_emit"):
+        emit_scan_event(
+            {
+                "uuid": uuid,
+                "user_id": user["user_id"] if user else "",
+                "first_name": user["first_name"] if user else "",
+                "last_name": user["last_name"] if user else "",
+                "email": user["email"] if user else "",
+                "role": user["role"] if user else "",
+                "room": room,
+                "result": result,
+                "source": source,
+            },
+            room,
+            source,
+        )
 
     # HTTP status code ต้องสะท้อน result จริง เพื่อให้ ESP32 อ่านถูกต้อง
     # 200 = granted (เปิดประตู), 403 = denied (ไม่เปิด)
@@ -749,6 +1589,132 @@ def get_uuid():
         return jsonify({"status": "denied", "user": user}), 403
 
 
+# =====================
+# Batch scan ingestion (ESP32_Door upload หลายใบในครั้งเดียว / scan ตอน offline)
+# =====================
+MAX_SCAN_BATCH = 500
+
+
+# เวลา scan ที่รับได้: ตั้งแต่ 2000-01-01 UTC ถึงเวลาที่ได้รับ + นาฬิกา device เร็วได้ไม่เกิน 1 วัน
+SCAN_TIME_MIN = 946684800
+SCAN_TIME_MAX_AHEAD = 86400
+
+
+def _parse_scan_time(scan: dict, received_at: float):
+    """
+    เวลา scan จาก device — คืน epoch seconds
+      - "scanned_at": epoch seconds หรือ ISO string (UTC ถ้าไม่มี timezone)
+      - "age_ms": scan นี้เกิดก่อนส่งมากี่ ms (ESP32 ที่ไม่มี RTC ใช้ millis() คำนวณ)
+    ไม่ส่งมาเลย = เวลาที่ server ได้รับ
+    ValueError ถ้าไม่ใช่ตัวเลขจำกัด หรืออยู่นอกช่วง SCAN_TIME_MIN .. received_at + SCAN_TIME_MAX_AHEAD
+    """
+    if scan.get("scanned_at") not in (None, ""):
+        value = scan["scanned_at"]
+        if isinstance(value, bool):
+            raise ValueError("scanned_at must be a number or ISO string")
+        if isinstance(value, (int, float)):
+            at = float(value)
+        else:
+            dt = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+            if dt.tzinfo is None:
+                dt = dt.replace(tzinfo=timezone.utc)
+            at = dt.timestamp()
+    elif scan.get("age_ms") not in (None, ""):
+        at = received_at - float(scan["age_ms"]) / 1000.0
+    else:
+        return received_at
+    if not math.isfinite(at) or not SCAN_TIME_MIN <= at <= received_at + SCAN_TIME_MAX_AHEAD:
+        raise ValueError(f"scan time out of range: {at}")
+    return at
+
+
+@app.route("/api/send_uuid/batch", methods=["POST"])
+def send_uuid_batch():
+    """
+    รับ scan หลายรายการในครั้งเดียว — ตัดสินสิทธิ์ด้วย pipeline เดียวกับ /api/send_uuid
+    (ณ เวลาที่ scan จริง) แล้วบันทึก log ทั้งหมดใน transaction เดียว
+    Body: {"room": "EN4401", "scans": [{"uuid", "scanned_at"|"age_ms", "room"?,
+           "offline"?, "device_result"?}, ...]}
+    คืนผลรายใบตามลำดับ: [{"index", "uuid", "result", "scanned_at"}, ...]
+    """
+    data = request.get_json(silent=True) or {}
+    scans = data.get("scans")
+    default_room = data.get("room", "")
+    if not isinstance(scans, list) or not scans:
+        return jsonify({"success": False, "message": "scans must be a non-empty list"}), 400
+    if len(scans) > MAX_SCAN_BATCH:
+        return (
+            jsonify(
+                {
+                    "success": False,
+                    "message": f"too many scans (max {MAX_SCAN_BATCH} per request)",
+                }
+            ),
+            413,
+        )
+
+    received_at = time.time()
+    results, rows, denied = [], [], []
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            for i, scan in enumerate(scans):
+                uuid = scan.get("uuid") if isinstance(scan, dict) else None
+                if not isinstance(uuid, str) or not uuid:
+                    results.append({"index": i, "error": "uuid required"})
+                    continue
+                room = scan.get("room", default_room)
+                if not isinstance(room, str):
+                    # list / dict / ตัวเลขทำให้ lookup / bind parameter ล้มทั้ง batch
+                    results.append({"index": i, "uuid": uuid, "error": "bad room"})
+                    continue
+                try:
+                    at = _parse_scan_time(scan, received_at)
+                except (TypeError, ValueError, OverflowError):
+                    results.append({"index": i, "uuid": uuid, "error": "bad scanned_at"})
+                    continue
+
+                user, result = _decide_access(uuid, room, "door", at, cursor)
+                scanned_at = datetime.fromtimestamp(at, timezone.utc).strftime(
+                    "%Y-%m-%d %H:%M:%S"
+                )
+                method = "rfid_offline" if scan.get("offline") else "rfid"
+                rows.append(
+                    _access_log_row(uuid, user, room, result, method, scanned_at)
+                )
+                scans_total.inc(result=result, source="batch")
+                if result == "denied":
+                    denied.append((uuid, room))
+                entry = {
+                    "index": i,
+                    "uuid": uuid,
+                    "room": room,
+                    "result": result,
+                    "scanned_at": scanned_at,
+                }
+                if scan.get("device_result"):
+                    entry["device_result"] = scan["device_result"]
+                results.append(entry)
+
+            if rows:
+                cursor.executemany(_ACCESS_LOG_INSERT_SQL, rows)
+            conn.commit()
+    except sqlite3.Error as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+    for uuid, room in denied:
+        notify_rfid_denied(uuid=uuid, room=room)
+
+    return jsonify(
+        {
+            "success": True,
+            "accepted": len(rows),
+            "rejected": len(scans) - len(rows),
+            "results": results,
+        }
+    )
+
+
 @app.route("/api/latest_uuid", methods=["GET"])
 def get_latest_uid():
     uuid = get_latest_uuid()  # Bug #5 Fix: thread-safe getter
@@ -913,6 +1879,7 @@ def update_user_route(id):
             )
             conn.commit()
 
+        _on_users_reg_changed(id)
         rebuild_csv_from_db()
         return jsonify({"success": True, "message": "แก้ไขข้อมูล user สำเร็จ"})
 
@@ -923,39 +1890,6 @@ def update_user_route(id):
 # =====================
 # Rooms API
 # =====================
-# =====================
-# ESP32 Whitelist API
-# =====================
-@app.route("/api/whitelist", methods=["GET"])
-def get_whitelist():
-    """
-    คืน UUID + ชื่อของ admin ทุกคนที่ลงทะเบียน RFID แล้ว
-    ใช้โดย ESP32_Door ตอน boot และ refresh ทุก 5 นาที
-    เพื่อ sync offline fallback whitelist โดยไม่ต้อง upload firmware ใหม่
-    ไม่ต้อง auth token เพราะ ESP32 ไม่มี session
-    """
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT uuid, first_name, last_name
-                FROM users_reg
-                WHERE role = 'admin' AND is_deleted = 0
-                ORDER BY id
-                """
-            )
-            rows = cursor.fetchall()
-            admins = [
-                {"uuid": r["uuid"], "name": f"{r['first_name']} {r['last_name']}"}
-                for r in rows
-            ]
-        return jsonify({"success": True, "admins": admins, "count": len(admins)})
-    except Exception as e:
-        print(f"[WHITELIST] get_whitelist error: {e}")
-        return jsonify({"success": False, "admins": [], "count": 0}), 500
-
-
 @app.route("/api/rooms", methods=["GET"])
 def get_rooms():
     try:
@@ -1027,32 +1961,175 @@ def delete_room(room_id):
         return jsonify({"error": str(e)}), 500
 
 
+DOOR_ONLINE_SECONDS = 5  # ไม่เห็น request จากประตูเกินนี้ = offline
+DOOR_SWEEP_INTERVAL = float(os.getenv("DOOR_SWEEP_INTERVAL", "1"))
+_door_online_state = {}  # room -> bool ตามที่ sweeper ของ process นี้เห็นรอบล่าสุด (gauge)
+
+
+def _room_status(room: str, now: float = None, last: float = None) -> dict:
+    if last is None:
+        last = runtime_state.room_last_seen(room)
+    # ประตูที่กำลัง long-poll อยู่ = online แม้ request ล่าสุดจะเริ่มนานกว่า 5 วิ
+    is_online = runtime_state.waiting(room) > 0
+    if last and not is_online:
+        is_online = (now or time.time()) - last < DOOR_ONLINE_SECONDS
+    return {
+        "door_status": "LOCKED",
+        "door_online": is_online,
+        "rfid_online": is_online,
+        "last_seen": (
+            datetime.utcfromtimestamp(last).isoformat() + "Z" if last else None
+        ),
+    }
+
+
 @app.route("/api/door/status", methods=["GET"])
 def get_door_status():
     room = request.args.get("room", "")
-    last = room_last_seen.get(room)
-    is_online = False
-    if last:
-        seconds_ago = (datetime.utcnow() - last).total_seconds()
-        is_online = seconds_ago < 5
+    status = _room_status(room)
+    status.pop("last_seen")
+    return jsonify(status)
+
+
+@app.route("/api/door/status/all", methods=["GET"])
+def get_door_status_all():
+    """
+    สถานะ online/offline ของทุกห้องใน request เดียว (แทน poll ทีละห้อง)
+    รวมห้องในตาราง rooms และห้องที่มีประตูติดต่อเข้ามาแม้ยังไม่ได้เพิ่มในตาราง
+    """
+    try:
+        with get_db_connection() as conn:
+            names = [r["name"] for r in conn.execute("SELECT name FROM rooms")]
+    except sqlite3.Error as e:
+        return jsonify({"error": str(e)}), 500
+    now = time.time()
+    seen = runtime_state.rooms_last_seen()
+    rooms = {
+        name: _room_status(name, now, seen.get(name)) for name in set(names) | set(seen)
+    }
     return jsonify(
-        {"door_status": "LOCKED", "door_online": is_online, "rfid_online": is_online}
+        {
+            "rooms": rooms,
+            "online": sum(1 for r in rooms.values() if r["door_online"]),
+            "total": len(rooms),
+        }
     )
 
 
+def sweep_door_heartbeats():
+    """
+    เทียบสถานะ online ของทุกประตูกับรอบก่อน — emit door_status เฉพาะห้องที่เปลี่ยน
+    (online → offline เมื่อเงียบเกิน DOOR_ONLINE_SECONDS, offline → online เมื่อกลับมา poll)
+    สถานะล่าสุดเก็บใน runtime_state → หลาย worker รัน sweeper พร้อมกันได้
+    แต่ transition หนึ่งครั้ง emit จาก worker เดียว
+    คืน list ของห้องที่เปลี่ยนสถานะ (ที่ process นี้เป็นคน emit)
+    """
+    now = time.time()
+    changed = []
+    for room, last in runtime_state.rooms_last_seen().items():
+        status = _room_status(room, now, last)
+        _door_online_state[room] = status["door_online"]
+        if runtime_state.record_door_online(room, status["door_online"], now):
+            changed.append(room)
+            door_transitions_total.inc(
+                state="online" if status["door_online"] else "offline"
+            )
+            socketio.emit(
+                "door_status", {"room": room, **status}, to=SOCKET_DOOR_STATUS_ROOM
+            )
+    return changed
+
+
+door_transitions_total = Counter(
+    "door_status_transitions_total", "Door online/offline transitions", ("state",)
+)
+Gauge("doors_online", "Doors currently online (as of the last sweep)").set_function(
+    lambda: sum(1 for v in _door_online_state.values() if v)
+)
+
+
 # =====================
 # Access Logs API
 # =====================
+def _encode_log_cursor(scanned_at, log_id) -> str:
+    raw = json.dumps([scanned_at, log_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode_log_cursor(token: str):
+    """คืน (scanned_at, id) — ValueError ถ้า token ไม่ถูกต้อง"""
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        scanned_at, log_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError("invalid cursor") from e
+    if not isinstance(scanned_at, str) or not isinstance(log_id, int):
+        raise ValueError("invalid cursor")
+    return scanned_at, log_id
+
+
+def _counted_total(cursor, room_filter: str, result_filter: str) -> int:
+    """total จาก access_log_counts (ไม่ต้อง COUNT(*) ทั้งตาราง)"""
+    conditions, params = [], []
+    if room_filter:
+        conditions.append("room = ?")
+        params.append(room_filter)
+    if result_filter in ("granted", "denied"):
+        conditions.append("result = ?")
+        params.append(result_filter)
+    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    cursor.execute(f"SELECT COALESCE(SUM(n), 0) FROM access_log_counts {where}", params)
+    return cursor.fetchone()[0]
+
+
+def _parse_log_time(value: str) -> str:
+    """'YYYY-MM-DD[ HH:MM[:SS]]' → รูปแบบเดียวกับ scanned_at (UTC) — ValueError ถ้าผิด"""
+    try:
+        return datetime.fromisoformat(value.strip()).strftime("%Y-%m-%d %H:%M:%S")
+    except ValueError as e:
+        raise ValueError(f"invalid time: {value}") from e
+
+
+def _log_filter_conditions(args):
+    """
+    filter ของ access logs จาก query string (room, result, from, to) → (conditions, params)
+    ใช้ร่วมกันระหว่าง /api/access-logs กับ /api/access-logs/export (search แยกไปที่ fetch_log_page)
+    """
+    conditions, params = [], []
+    room_filter = args.get("room", "").strip()
+    result_filter = args.get("result", "all").strip()
+    if room_filter:
+        conditions.append("room = ?")
+        params.append(room_filter)
+    if result_filter in ("granted", "denied"):
+        conditions.append("result = ?")
+        params.append(result_filter)
+    if args.get("from"):
+        conditions.append("scanned_at >= ?")
+        params.append(_parse_log_time(args["from"]))
+    if args.get("to"):
+        conditions.append("scanned_at < ?")
+        params.append(_parse_log_time(args["to"]))
+    return conditions, params
+
+
 @app.route("/api/access-logs", methods=["GET"])
 def get_access_logs():
     """
     ดึง access logs — Admin only (ผ่าน JWT header)
+    เรียงใหม่ → เก่าตาม (scanned_at, id) แบบ keyset: ส่ง next_cursor ที่ได้กลับมาเป็น ?cursor=
+    เพื่อดึงหน้าถัดไป — หน้าที่ 1000 เร็วเท่าหน้าแรก (ไม่มี OFFSET ทิ้งแถว)
     Query params:
       - room   : กรองตามห้อง
       - result : 'granted' | 'denied' | 'all' (default: all)
-      - limit  : จำนวนแถว (default: 200, max: 1000)
-      - offset : pagination offset (default: 0)
-      - search : ค้นหาจาก uuid / ชื่อ / email
+      - limit  : จำนวนแถว (default: 200, ช่วง 1–1000)
+      - cursor : next_cursor จากหน้าก่อน
+      - offset : pagination แบบเดิม (ใช้เมื่อไม่ส่ง cursor)
+      - search : ค้นหาจาก uuid / ชื่อ / email / user_id (substring — ใช้ FTS5 trigram index)
+      - from / to : ช่วงเวลา scanned_at (UTC, 'YYYY-MM-DD' หรือ 'YYYY-MM-DD HH:MM:SS')
+                    from รวมขอบ, to ไม่รวม
+      - total  : 'auto' (default) | 'exact' | 'none'
+                 auto = นับจาก access_log_counts ถ้าไม่มี search / from / to, ถ้ามีได้ null
     """
     # ตรวจ JWT token
     token = None
@@ -1078,63 +2155,187 @@ def get_access_logs():
     result_filter = request.args.get("result", "all").strip()
     search = request.args.get("search", "").strip()
     try:
-        limit = min(int(request.args.get("limit", 200)), 1000)
+        conditions, params = _log_filter_conditions(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    ranged = bool(request.args.get("from") or request.args.get("to"))
+    total_mode = request.args.get("total", "auto").strip()
+    try:
+        limit = max(1, min(int(request.args.get("limit", 200)), 1000))
         offset = max(int(request.args.get("offset", 0)), 0)
     except ValueError:
         limit, offset = 200, 0
+    after = None
+    if request.args.get("cursor"):
+        try:
+            after = _decode_log_cursor(request.args["cursor"])
+        except ValueError:
+            return jsonify({"error": "invalid cursor"}), 400
+        offset = 0
 
-    # Build query dynamically
-    conditions = []
-    params = []
-
-    if room_filter:
-        conditions.append("room = ?")
-        params.append(room_filter)
-
-    if result_filter in ("granted", "denied"):
-        conditions.append("result = ?")
-        params.append(result_filter)
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            # ดึงเกิน 1 แถวเพื่อรู้ว่ายังมีหน้าถัดไปหรือไม่
+            rows = fetch_log_page(conn, conditions, params, search, after, limit + 1, offset)
+            logs = [dict(row) for row in rows]
+            next_cursor = None
+            if len(logs) > limit:
+                logs = logs[:limit]
+                next_cursor = _encode_log_cursor(logs[-1]["scanned_at"], logs[-1]["id"])
+
+            total = None
+            if total_mode == "exact" or (total_mode == "auto" and not search and not ranged):
+                if search or ranged:
+                    # total นับตาม filter เท่านั้น (ไม่รวมตำแหน่ง cursor)
+                    conds, count_params = list(conditions), list(params)
+                    if search:
+                        search_sql, search_params = log_search_condition(search)
+                        conds.append(search_sql)
+                        count_params += search_params
+                    where = "WHERE " + " AND ".join(conds)
+                    cursor.execute(f"SELECT COUNT(*) FROM access_logs {where}", count_params)
+                    total = cursor.fetchone()[0]
+                else:
+                    total = _counted_total(cursor, room_filter, result_filter)
 
-    if search:
-        conditions.append(
-            "(uuid LIKE ? OR name LIKE ? OR email LIKE ? OR user_id LIKE ?)"
+        return jsonify(
+            {"success": True, "total": total, "logs": logs, "next_cursor": next_cursor}
         )
-        like = f"%{search}%"
-        params.extend([like, like, like, like])
 
-    where = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+    except sqlite3.Error as e:
+        return jsonify({"error": str(e)}), 500
 
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
 
-            # total count
-            cursor.execute(f"SELECT COUNT(*) FROM access_logs {where}", params)
-            total = cursor.fetchone()[0]
+# =====================
+# Access Logs Export
+# =====================
+# อ่านทีละ chunk ตาม keyset (scanned_at, id) — ยืม connection จาก pool เฉพาะตอน query
+# ไม่ถือ read transaction ค้างไว้ระหว่างรอ client ที่โหลดช้า (WAL checkpoint ยังเดินได้)
+EXPORT_CHUNK_ROWS = int(os.getenv("LOG_EXPORT_CHUNK_ROWS", "2000"))
+EXPORT_COLUMNS = (
+    "id", "scanned_at", "uuid", "user_id", "name", "email",
+    "role", "room", "result", "method",
+)
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
 
-            # paginated rows
-            cursor.execute(
-                f"""
-                SELECT id, uuid, user_id, name, email, role,
-                       room, result, method, scanned_at
-                FROM access_logs
-                {where}
-                ORDER BY scanned_at DESC
-                LIMIT ? OFFSET ?
-                """,
-                params + [limit, offset],
+def _iter_log_chunks(conditions, params, search="", archive=None):
+    """
+    ทุกแถวที่ตรง filter เรียงใหม่ → เก่า ทีละไม่เกิน EXPORT_CHUNK_ROWS แถว
+    archive = 'YYYY-MM' → อ่านจากไฟล์ partition แทน access_logs
+    """
+    after = None
+    while True:
+        with (open_partition(archive) if archive else get_db_connection()) as conn:
+            rows = fetch_log_page(
+                conn, conditions, params, search, after, EXPORT_CHUNK_ROWS,
+                use_index=not archive,
             )
-            logs = [dict(row) for row in cursor.fetchall()]
+        if not rows:
+            return
+        yield rows
+        if len(rows) < EXPORT_CHUNK_ROWS:
+            return
+        after = (rows[-1]["scanned_at"], rows[-1]["id"])
+
+
+def _encode_log_chunks(chunks, fmt: str):
+    """chunk ของ sqlite3.Row → bytes ของ CSV (มี header) หรือ NDJSON ทีละ chunk"""
+    if fmt == "ndjson":
+        for rows in chunks:
+            yield "".join(
+                json.dumps({k: row[k] for k in EXPORT_COLUMNS}, ensure_ascii=False) + "\n"
+                for row in rows
+            ).encode()
+        return
+
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    yield ("\ufeff" + buf.getvalue()).encode()  # BOM → Excel อ่านชื่อภาษาไทยถูก
+    for rows in chunks:
+        buf.seek(0)
+        buf.truncate()
+        writer.writerows([row[k] for k in EXPORT_COLUMNS] for row in rows)
+        yield buf.getvalue().encode()
+
+
+def _gzip_stream(parts):
+    """บีบอัดแบบ streaming — หน่วยความจำคงที่ไม่ว่าจะ export กี่แถว"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31 = gzip header
+    for part in parts:
+        data = compressor.compress(part)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+@app.route("/api/access-logs/export", methods=["GET"])
+def export_access_logs():
+    """
+    Export access logs ทั้งหมดที่ตรง filter เป็นไฟล์ (admin only) — stream ทีละ chunk
+    ไม่สร้าง JSON ก้อนใหญ่ในหน่วยความจำ และไม่จำกัด 1000 แถวแบบ /api/access-logs
+    Query params:
+      - room / result / search / from / to : เหมือน /api/access-logs
+      - archive : 'YYYY-MM' → export จาก partition ที่ archive ไปแล้ว
+      - format : 'csv' (default) | 'ndjson'
+      - gzip   : '1' → ได้ไฟล์ .gz (ถ้าไม่ส่ง ใช้ Content-Encoding: gzip เมื่อ client รองรับ)
+    """
+    denied = _verify_admin_token()
+    if denied:
+        return denied
 
-        return jsonify({"success": True, "total": total, "logs": logs})
+    fmt = request.args.get("format", "csv").strip().lower()
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": "format must be csv or ndjson"}), 400
+    search = request.args.get("search", "").strip()
+    archive = request.args.get("archive", "").strip() or None
+    try:
+        conditions, params = _log_filter_conditions(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if archive and archive not in {p["month"] for p in list_partitions()}:
+        return jsonify({"error": "archive not found"}), 404
+
+    stamp = archive or datetime.now(TZ_THAI).strftime("%Y%m%d_%H%M")
+    filename = f"access_logs_{stamp}.{fmt}"
+    headers = {"Cache-Control": "no-store", "Vary": "Accept-Encoding"}
+    body = _encode_log_chunks(_iter_log_chunks(conditions, params, search, archive), fmt)
+    mimetype = EXPORT_FORMATS[fmt]
+    if request.args.get("gzip") == "1":
+        body = _gzip_stream(body)
+        filename += ".gz"
+        mimetype = "application/gzip"
+    elif "gzip" in request.accept_encodings:
+        body = _gzip_stream(body)
+        headers["Content-Encoding"] = "gzip"
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+
+    print(
+        f"[EXPORT] access logs format={fmt} archive={archive} filters={params} search={search!r}"
+    )
+    return Response(body, mimetype=mimetype, headers=headers)
 
-    except sqlite3.Error as e:
-        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/admin/log-writer", methods=["GET"])
+def get_log_writer_status():
+    """สถานะ background writer: access log + rfid denied notification (queue depth, flush latency)"""
+    denied = _verify_admin_token()
+    if denied:
+        return denied
+    return jsonify(
+        {
+            "success": True,
+            "stats": access_log_writer.stats(),
+            "rfid_denied_dispatcher": rfid_denied_dispatcher.stats(),
+        }
+    )
 
 
 @app.route("/api/access-logs/stats", methods=["GET"])
 def get_access_log_stats():
-    """สถิติรวม access logs สำหรับแสดงบน dashboard"""
+    """สถิติรวม access logs สำหรับแสดงบน dashboard (อ่านจาก access_log_counts / access_log_hourly)"""
     token = None
     auth_header = request.headers.get("Authorization", "")
     if auth_header.startswith("Bearer "):
@@ -1150,37 +2351,42 @@ def get_access_log_stats():
     except Exception:
         return jsonify({"error": "Invalid token"}), 401
 
+    # "วันนี้" = วันตามเวลาไทย → ขอบเขตเป็นชั่วโมง UTC แบบเดียวกับ access_log_hourly.hour
+    now_th = datetime.now(TZ_THAI)
+    today_start = (
+        now_th.replace(hour=0, minute=0, second=0, microsecond=0)
+        .astimezone(timezone.utc)
+        .strftime("%Y-%m-%d %H:00")
+    )
+
     try:
         with get_db_connection() as conn:
             cursor = conn.cursor()
 
-            cursor.execute("SELECT COUNT(*) FROM access_logs")
-            total = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM access_logs WHERE result = 'granted'")
-            granted = cursor.fetchone()[0]
-
-            cursor.execute("SELECT COUNT(*) FROM access_logs WHERE result = 'denied'")
-            denied = cursor.fetchone()[0]
+            # อ่านจาก rollup ที่ trigger ดูแล — ไม่กี่แถว ไม่ขึ้นกับจำนวน log
+            cursor.execute("SELECT room, result, n FROM access_log_counts WHERE n > 0")
+            total = granted = denied = 0
+            rooms = {}
+            for r in cursor.fetchall():
+                total += r["n"]
+                if r["result"] == "granted":
+                    granted += r["n"]
+                elif r["result"] == "denied":
+                    denied += r["n"]
+                if r["room"]:
+                    rooms[r["room"]] = rooms.get(r["room"], 0) + r["n"]
 
             # วันนี้
             cursor.execute(
-                "SELECT COUNT(*) FROM access_logs WHERE DATE(scanned_at) = DATE('now', 'localtime')"
+                "SELECT COALESCE(SUM(n), 0) FROM access_log_hourly WHERE hour >= ?",
+                (today_start,),
             )
             today = cursor.fetchone()[0]
 
             # สแกนต่อห้อง
-            cursor.execute(
-                """
-                SELECT room, COUNT(*) as count
-                FROM access_logs
-                WHERE room IS NOT NULL AND room != ''
-                GROUP BY room
-                ORDER BY count DESC
-                """
-            )
             by_room = [
-                {"room": r["room"], "count": r["count"]} for r in cursor.fetchall()
+                {"room": room, "count": count}
+                for room, count in sorted(rooms.items(), key=lambda kv: -kv[1])
             ]
 
         return jsonify(
@@ -1200,9 +2406,227 @@ def get_access_log_stats():
         return jsonify({"error": str(e)}), 500
 
 
+# =====================
+# Access Log Analytics
+# =====================
+# granted / denied ต่อช่วงเวลา ต่อห้อง จาก rollup รายชั่วโมง (access_log_hourly + archived)
+# GROUP BY ใน SQL → Python แค่วางผลลงช่องของ array (ไม่ไล่ access_logs ทีละแถว)
+# t = วินาทีนับจากเที่ยงคืน (เวลาไทย) ของวัน from → bucket เป็นเลขช่องตามเวลาไทย
+_ANALYTICS_BUCKETS = {
+    "hour": "t / 3600",
+    "day": "t / 86400",
+    "hour_of_day": "t / 3600 % 24",
+    "weekday": "(t / 86400 + ?) % 7",  # 0 = จันทร์ (? = weekday ของวัน from)
+    "weekday_hour": "(t / 86400 + ?) % 7 * 24 + t / 3600 % 24",
+}
+LOG_ANALYTICS_MAX_DAYS = int(os.getenv("LOG_ANALYTICS_MAX_DAYS", "400"))
+LOG_ANALYTICS_MAX_HOURLY_DAYS = 93  # bucket=hour ยาวสุด ~1 ไตรมาส (2232 ช่อง)
+# ผลลัพธ์ที่ cache ไว้ใช้ต่อได้ถ้าไม่มี log เปลี่ยน หรือยังไม่เก่ากว่านี้ (กัน dashboard
+# หลายจอคำนวณซ้ำทุกครั้งที่มี scan เข้ามา)
+LOG_ANALYTICS_CACHE_SECONDS = float(os.getenv("LOG_ANALYTICS_CACHE_SECONDS", "15"))
+_ANALYTICS_CACHE_MAX = 64
+
+_analytics_cache_lock = threading.Lock()
+_analytics_cache = {}  # (bucket, from, to, room) -> (stamp, computed_at, body)
+
+
+def _analytics_range(args):
+    """from / to (วันที่ไทย 'YYYY-MM-DD', to ไม่รวม) → (from_date, to_date) — ValueError ถ้าผิด"""
+    today = datetime.now(TZ_THAI).date()
+    try:
+        to_date = (
+            datetime.fromisoformat(args["to"].strip()).date()
+            if args.get("to")
+            else today + timedelta(days=1)
+        )
+        from_date = (
+            datetime.fromisoformat(args["from"].strip()).date()
+            if args.get("from")
+            else to_date - timedelta(days=30)
+        )
+    except ValueError as e:
+        raise ValueError("from / to ต้องเป็น YYYY-MM-DD") from e
+    if to_date <= from_date:
+        raise ValueError("to ต้องหลัง from")
+    return from_date, to_date
+
+
+def _analytics_labels(bucket, from_date, days):
+    if bucket == "hour":
+        start = datetime(from_date.year, from_date.month, from_date.day)
+        return [(start + timedelta(hours=h)).strftime("%Y-%m-%d %H:00") for h in range(days * 24)]
+    if bucket == "day":
+        return [(from_date + timedelta(days=d)).isoformat() for d in range(days)]
+    size = {"hour_of_day": 24, "weekday": 7, "weekday_hour": 7 * 24}[bucket]
+    return list(range(size))
+
+
+def _analytics_stamp(cursor):
+    """เปลี่ยนทุกครั้งที่มี log เข้า / ออก (insert เพิ่ม MAX(id), purge / archive ลดผลรวม)"""
+    cursor.execute("SELECT MAX(id) FROM access_logs")
+    max_id = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(SUM(n), 0) FROM access_log_counts")
+    return max_id, cursor.fetchone()[0]
+
+
+def _analytics_rows(cursor, bucket, from_date, to_date, room):
+    """[(room, bucket index, granted, denied)] — รวมใน SQL จาก rollup ทั้งสองตาราง"""
+    expr = _ANALYTICS_BUCKETS[bucket]
+    start = int(
+        datetime(from_date.year, from_date.month, from_date.day, tzinfo=TZ_THAI).timestamp()
+    )
+    # ขอบเขตเป็นชั่วโมง UTC แบบเดียวกับ access_log_hourly.hour → ใช้ primary key (hour, ...)
+    lo, hi = (
+        datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%d %H:00")
+        for ts in (start, start + (to_date - from_date).days * 86400)
+    )
+    room_sql = "AND room = ?" if room else ""
+    part = [start, lo, hi] + ([room] if room else [])
+    cursor.execute(
+        f"""
+        SELECT room, {expr} AS b,
+               SUM(CASE WHEN result = 'granted' THEN n ELSE 0 END),
+               SUM(CASE WHEN result = 'denied' THEN n ELSE 0 END)
+        FROM (
+            SELECT room, result, n,
+                   CAST(strftime('%s', hour || ':00') AS INTEGER) - ? AS t
+            FROM access_log_hourly
+            WHERE hour >= ? AND hour < ? {room_sql}
+            UNION ALL
+            SELECT room, result, n,
+                   CAST(strftime('%s', hour || ':00') AS INTEGER) - ? AS t
+            FROM access_log_hourly_archived
+            WHERE hour >= ? AND hour < ? {room_sql}
+        )
+        GROUP BY room, b
+        """,
+        [from_date.weekday()] * expr.count("?") + part + part,
+    )
+    return cursor.fetchall()
+
+
+def _analytics_body(cursor, bucket, from_date, to_date, room):
+    days = (to_date - from_date).days
+    labels = _analytics_labels(bucket, from_date, days)
+    size = len(labels)
+    rooms = {}
+    total_granted, total_denied = [0] * size, [0] * size
+    for room_name, b, granted, denied in _analytics_rows(cursor, bucket, from_date, to_date, room):
+        if not 0 <= b < size:
+            continue
+        total_granted[b] += granted
+        total_denied[b] += denied
+        if not room_name:
+            continue  # log ที่ไม่มีห้อง นับแค่ใน totals (เหมือน /stats)
+        series = rooms.setdefault(room_name, {"granted": [0] * size, "denied": [0] * size})
+        series["granted"][b] += granted
+        series["denied"][b] += denied
+    return {
+        "success": True,
+        "bucket": bucket,
+        "from": from_date.isoformat(),
+        "to": to_date.isoformat(),
+        "timezone": "UTC+07:00",
+        "buckets": labels,
+        "totals": {"granted": total_granted, "denied": total_denied},
+        "rooms": [
+            {
+                "room": name,
+                "granted": series["granted"],
+                "denied": series["denied"],
+                "total": sum(series["granted"]) + sum(series["denied"]),
+            }
+            for name, series in sorted(rooms.items())
+        ],
+    }
+
+
+@app.route("/api/access-logs/analytics", methods=["GET"])
+def get_access_log_analytics():
+    """
+    granted / denied ต่อช่วงเวลา ต่อห้อง สำหรับกราฟ / heatmap — Admin only
+    Query params:
+      - bucket : 'hour' | 'day' (default) | 'hour_of_day' | 'weekday' | 'weekday_hour'
+                 hour_of_day = 0–23, weekday = 0–6 (0 = จันทร์), weekday_hour = weekday*24 + ชั่วโมง
+      - from / to : วันที่ตามเวลาไทย 'YYYY-MM-DD' — from รวม, to ไม่รวม (default: 30 วันล่าสุดรวมวันนี้)
+      - room   : เฉพาะห้องนี้
+    ตอบแบบ columnar: buckets = label ของแต่ละช่อง, rooms[].granted / denied = array ยาวเท่า buckets
+    """
+    token = None
+    auth_header = request.headers.get("Authorization", "")
+    if auth_header.startswith("Bearer "):
+        token = auth_header.split(" ")[1]
+    if not token:
+        return jsonify({"error": "Token is missing"}), 401
+    try:
+        import jwt as pyjwt
+
+        data = pyjwt.decode(token, app.config["SECRET_KEY"], algorithms=["HS256"])
+        if not data.get("email", "").endswith("@kku.ac.th"):
+            return jsonify({"error": "ไม่มีสิทธิ์เข้าถึง"}), 403
+    except Exception:
+        return jsonify({"error": "Invalid token"}), 401
+
+    bucket = request.args.get("bucket", "day")
+    room = request.args.get("room", "").strip()
+    if bucket not in _ANALYTICS_BUCKETS:
+        return jsonify({"success": False, "message": f"bucket ต้องเป็น {', '.join(_ANALYTICS_BUCKETS)}"}), 400
+    try:
+        from_date, to_date = _analytics_range(request.args)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    days = (to_date - from_date).days
+    max_days = LOG_ANALYTICS_MAX_HOURLY_DAYS if bucket == "hour" else LOG_ANALYTICS_MAX_DAYS
+    if days > max_days:
+        return jsonify({"success": False, "message": f"ช่วงเวลายาวเกิน {max_days} วัน"}), 400
+
+    key = (bucket, from_date, to_date, room)
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            stamp = _analytics_stamp(cursor)
+            now = time.monotonic()
+            with _analytics_cache_lock:
+                cached = _analytics_cache.get(key)
+            if cached and (cached[0] == stamp or now - cached[1] < LOG_ANALYTICS_CACHE_SECONDS):
+                body = cached[2]
+                hit = True
+            else:
+                body = _analytics_body(cursor, bucket, from_date, to_date, room)
+                hit = False
+                with _analytics_cache_lock:
+                    if len(_analytics_cache) >= _ANALYTICS_CACHE_MAX and key not in _analytics_cache:
+                        _analytics_cache.clear()
+                    _analytics_cache[key] = (stamp, now, body)
+    except sqlite3.Error as e:
+        print(f"[ANALYTICS] get_access_log_analytics error: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+    return jsonify({**body, "cached": hit})
+
+
+# scan ต่อวินาที (ผ่าน access_log_writer) ที่ถือว่าประตูกำลังยุ่ง → retention พักการลบ
+LOG_PURGE_BUSY_SCANS = float(os.getenv("LOG_PURGE_BUSY_SCANS", "20"))
+_scan_rate_sample = {"at": time.monotonic(), "enqueued": 0}
+
+
+def _scan_traffic_high() -> bool:
+    """อัตรา scan ตั้งแต่ครั้งก่อนที่ถาม เกิน LOG_PURGE_BUSY_SCANS หรือไม่ (ใช้โดย log rotation)"""
+    enqueued = access_log_writer.stats()["enqueued"]
+    now = time.monotonic()
+    elapsed = now - _scan_rate_sample["at"]
+    rate = (enqueued - _scan_rate_sample["enqueued"]) / elapsed if elapsed > 0 else 0.0
+    _scan_rate_sample.update({"at": now, "enqueued": enqueued})
+    return rate > LOG_PURGE_BUSY_SCANS
+
+
 @app.route("/api/access-logs/purge-old", methods=["DELETE"])
 def purge_old_logs():
-    """ลบ access_logs ที่เก่ากว่า 30 วัน (admin เท่านั้น)"""
+    """
+    archive แล้วเอาออก: ทุกเดือนที่จบไปเกิน LOG_RETENTION_DAYS (admin เท่านั้น)
+    log ที่ archive แล้วยังอ่านได้ผ่าน /api/access-logs/archives/<month>
+    ทำใน background (ลบทีละ batch) → ตอบ 202 ทันที ดูความคืบหน้าที่ /api/access-logs/purge-status
+    """
     from auth import token_required as _tr
 
     token = request.headers.get("Authorization", "").replace("Bearer ", "")
@@ -1218,40 +2642,111 @@ def purge_old_logs():
     except Exception:
         return jsonify({"error": "Invalid token"}), 401
 
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "DELETE FROM access_logs WHERE scanned_at < datetime('now', '-30 days')"
-            )
-            deleted = cursor.rowcount
-            conn.commit()
-        return jsonify({"success": True, "deleted": deleted})
-    except sqlite3.Error as e:
-        return jsonify({"error": str(e)}), 500
+    if purge_progress()["running"]:
+        return jsonify({"success": True, "started": False, "progress": purge_progress()}), 202
+    threading.Thread(target=_auto_purge_old_logs, name="log-rotation", daemon=True).start()
+    return jsonify({"success": True, "started": True, "progress": purge_progress()}), 202
+
+
+@app.route("/api/access-logs/purge-status", methods=["GET"])
+def get_purge_status():
+    """ความคืบหน้าของ retention รอบล่าสุด: เดือน, แถวที่ลบแล้ว, rows/s, เวลาที่พักรอ scan"""
+    denied = _verify_admin_token()
+    if denied:
+        return denied
+    return jsonify({"success": True, "progress": purge_progress()})
 
 
 def _auto_purge_old_logs():
-    """ลบ log เก่ากว่า 30 วันโดยอัตโนมัติ (background task)"""
+    """archive log ของเดือนที่หมด retention แล้วเอาออกจาก access_logs (background task)"""
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                "DELETE FROM access_logs WHERE scanned_at < datetime('now', '-30 days')"
-            )
-            deleted = cursor.rowcount
-            conn.commit()
+        rotated = rotate_log_partitions(busy=_scan_traffic_high)
+        deleted = sum(r["deleted"] for r in rotated)
         if deleted > 0:
-            print(f"[AUTO-PURGE] ลบ access_logs เก่า {deleted} รายการ")
+            months = ", ".join(r["month"] for r in rotated)
+            print(f"[AUTO-PURGE] archive access_logs {deleted} รายการ ({months})")
     except Exception as e:
         print(f"[AUTO-PURGE] error: {e}")
 
 
+@app.route("/api/access-logs/archives", methods=["GET"])
+def get_log_archives():
+    """รายการ partition ที่ archive แล้ว (admin only) — ใหม่ → เก่า"""
+    denied = _verify_admin_token()
+    if denied:
+        return denied
+    try:
+        return jsonify(
+            {
+                "success": True,
+                "retention_days": LOG_RETENTION_DAYS,
+                "archives": list_partitions(),
+            }
+        )
+    except sqlite3.Error as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route("/api/access-logs/archives/<month>", methods=["GET"])
+def get_archived_logs(month):
+    """
+    อ่าน log จาก partition เดือน month ('YYYY-MM') แบบ read-only (admin only)
+    query params เหมือน /api/access-logs: room, result, search, from, to, limit, cursor
+    (search เป็น LIKE — ไฟล์ archive ไม่มี FTS index, total = null ถ้ามี filter)
+    """
+    denied = _verify_admin_token()
+    if denied:
+        return denied
+
+    search = request.args.get("search", "").strip()
+    try:
+        limit = max(1, min(int(request.args.get("limit", 200)), 1000))
+    except ValueError:
+        limit = 200
+    try:
+        conditions, params = _log_filter_conditions(request.args)
+        after = (
+            _decode_log_cursor(request.args["cursor"]) if request.args.get("cursor") else None
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    partitions = {p["month"]: p for p in list_partitions()}
+    if month not in partitions:
+        return jsonify({"error": "archive not found"}), 404
+    try:
+        with open_partition(month) as conn:
+            rows = fetch_log_page(conn, conditions, params, search, after, limit + 1, use_index=False)
+    except FileNotFoundError:
+        return jsonify({"error": "archive file missing"}), 404
+    except sqlite3.Error as e:
+        return jsonify({"error": str(e)}), 500
+
+    logs = [dict(row) for row in rows]
+    next_cursor = None
+    if len(logs) > limit:
+        logs = logs[:limit]
+        next_cursor = _encode_log_cursor(logs[-1]["scanned_at"], logs[-1]["id"])
+    return jsonify(
+        {
+            "success": True,
+            "month": month,
+            "total": None if (conditions or search) else partitions[month]["rows"],
+            "logs": logs,
+            "next_cursor": next_cursor,
+        }
+    )
+
+
 if __name__ == "__main__":
     init_db()
     init_auth_db()
     init_booking_db()
     init_notification_db()
+    init_whitelist_db()
+    init_door_grants_db()
+    init_log_archive_db()
+    load_user_index()
 
     # Reminder scheduler — เช็คทุก 5 นาที
     import sched, time as _time
@@ -1259,26 +2754,51 @@ if __name__ == "__main__":
     def _reminder_loop():
         while True:
             try:
-                check_and_send_reminders()
+                with track_job("reminder"):
+                    check_and_send_reminders()
             except Exception as e:
                 print(f"[SCHEDULER] error: {e}")
             _time.sleep(300)  # 5 นาที
 
     reminder_thread = threading.Thread(target=_reminder_loop, daemon=True)
     reminder_thread.start()
+    watch_thread("reminder", reminder_thread)
     print(" Reminder scheduler started (every 5 min)")
 
     # Auto-purge scheduler — เช็คทุก 24 ชั่วโมง
     def _purge_loop():
-        _auto_purge_old_logs()  # run ทันทีตอน start
         while True:
+            try:
+                with track_job("auto_purge"):
+                    _auto_purge_old_logs()  # รอบแรก run ทันทีตอน start
+            except Exception as e:
+                print(f"[SCHEDULER] error: {e}")
             _time.sleep(86400)  # 24 ชั่วโมง
-            _auto_purge_old_logs()
 
     purge_thread = threading.Thread(target=_purge_loop, daemon=True)
     purge_thread.start()
+    watch_thread("auto_purge", purge_thread)
     print(" Auto-purge scheduler started (every 24h)")
 
+    # Door heartbeat sweeper — emit door_status เมื่อประตูเปลี่ยน online/offline
+    def _door_sweep_loop():
+        while True:
+            try:
+                sweep_door_heartbeats()
+            except Exception as e:
+                print(f"[DOOR] heartbeat sweep error: {e}")
+            _time.sleep(DOOR_SWEEP_INTERVAL)
+
+    door_sweep_thread = threading.Thread(target=_door_sweep_loop, daemon=True)
+    door_sweep_thread.start()
+    watch_thread("door_sweep", door_sweep_thread)
+    print(f" Door heartbeat sweeper started (every {DOOR_SWEEP_INTERVAL:g}s)")
+
+    # SIGTERM (docker stop) → exit ปกติ เพื่อให้ atexit drain log ที่ค้างใน queue
+    import signal, sys
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", 5000))
     debug = os.getenv("FLASK_DEBUG", "True").lower() == "true"
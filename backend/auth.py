@@ -1,27 +1,20 @@
 from flask import Blueprint, request, jsonify
 import sqlite3
-import os
 import hashlib
 from datetime import datetime, timedelta
 from functools import wraps
 import jwt
 
+from db import get_db_connection
+
 # สร้าง Blueprint
 auth_bp = Blueprint("auth", __name__)
 
-BASE_DIR = os.path.dirname(__file__)
-DB_PATH = os.path.abspath(os.path.join(BASE_DIR, "database.db"))
-
 
 # =====================
 # Database Helper
 # =====================
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
+# get_db_connection() มาจาก db.py — connection pool กลาง (DATABASE_PATH เดียวกับ app.py)
 def init_auth_db():
     with get_db_connection() as conn:
         cursor = conn.cursor()
@@ -67,6 +60,15 @@ def init_auth_db():
             )
             """
         )
+        # คำขอของ email นี้ (pending / ล่าสุด) — ไม่ต้องไล่ทั้งตาราง
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_rfid_req_email"
+            " ON rfid_register_requests(email, created_at)"
+        )
+        # ค้นหารหัสนักศึกษา (/api/user/lookup)
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_admin_users_user_id ON admin_users(user_id)"
+        )
 
         conn.commit()
 
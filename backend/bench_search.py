@@ -0,0 +1,154 @@
+"""
+bench_search.py
+===============
+วัดความเร็ว search ของ /api/access-logs — LIKE '%x%' แบบเดิม เทียบกับ FTS5 trigram index
+
+สร้าง database ชั่วคราวด้วย init_db() ของ app.py (schema + trigger เดียวกับของจริง)
+ใส่ access log ปลอม --rows แถว แล้วจับเวลา query หน้าแรกของ /api/access-logs
+(ORDER BY scanned_at DESC, id DESC LIMIT --limit) ด้วยคำค้นหาหลายแบบ:
+ชื่อ (เจอบ่อย), email / user_id (เจอน้อย), UUID (เจอไม่กี่แถว), คำที่ไม่มีเลย
+
+ใช้ stdlib อย่างเดียว (+ dependency ของ backend เพราะ import app):
+    python bench_search.py --rows 1000000
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FIRST = ["Somchai", "Anan", "Kanya", "Pimchanok", "Thanakorn", "Siriporn", "Wichai", "Nattaya"]
+LAST = ["Jaidee", "Boonmee", "Srisuk", "Wongsawat", "Chaiyaporn", "Kittikun", "Rattana"]
+ROOMS = ["EN4401", "EN4402", "EN4403", "EN4404", "EN4405"]
+
+
+def seed(conn, rows, batch=20000):
+    """ใส่ log ปลอมผ่าน INSERT เดียวกับ writer (trigger อัปเดต index/counter ให้)"""
+    import app
+
+    rng = random.Random(42)
+    start = time.time() - rows * 2
+    buf = []
+    for i in range(rows):
+        sid = 640000000 + rng.randrange(20000)
+        name = f"{rng.choice(FIRST)} {rng.choice(LAST)}"
+        buf.append(
+            (
+                f"{rng.getrandbits(32):08X}",
+                str(sid),
+                name,
+                f"{name.split()[0].lower()}.{sid}@kkumail.com",
+                "student",
+                rng.choice(ROOMS),
+                "granted" if rng.random() < 0.85 else "denied",
+                "rfid",
+                time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(start + i * 2)),
+            )
+        )
+        if len(buf) >= batch:
+            conn.executemany(app._ACCESS_LOG_INSERT_SQL, buf)
+            conn.commit()
+            buf.clear()
+    if buf:
+        conn.executemany(app._ACCESS_LOG_INSERT_SQL, buf)
+        conn.commit()
+
+
+def page_query(search_sql):
+    return f"""
+        SELECT id, uuid, user_id, name, email, role, room, result, method, scanned_at
+        FROM access_logs
+        WHERE {search_sql}
+        ORDER BY scanned_at DESC, id DESC
+        LIMIT ?
+    """
+
+
+def timed(fn, repeat):
+    samples = []
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = len(fn())
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples) * 1000, rows
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark access log search (LIKE vs FTS5 trigram)")
+    p.add_argument("--rows", type=int, default=1_000_000)
+    p.add_argument("--limit", type=int, default=50, help="ขนาดหน้า (LIMIT)")
+    p.add_argument("--repeat", type=int, default=5, help="จำนวนรอบต่อ query (ใช้ median)")
+    p.add_argument("--keep", action="store_true", help="ไม่ลบ database ชั่วคราวหลังจบ")
+    args = p.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="bench-search-")
+    os.environ["DATABASE_PATH"] = os.path.join(tmp, "bench.db")
+    sys.path.insert(0, BACKEND_DIR)
+    try:
+        import app
+        from db import get_db_connection
+
+        app.init_db()
+        if not app._log_fts_enabled:
+            print("SQLite นี้ไม่มี FTS5 trigram — ไม่มีอะไรให้เทียบ")
+            return 1
+
+        with get_db_connection() as conn:
+            started = time.perf_counter()
+            seed(conn, args.rows)
+            print(f"seeded {args.rows:,} rows in {time.perf_counter() - started:.1f}s")
+            sample = conn.execute(
+                "SELECT uuid, email FROM access_logs WHERE id = ?", (args.rows // 2,)
+            ).fetchone()
+
+            searches = [
+                ("common name", "Jaidee"),
+                ("email part", sample["email"].split("@")[0]),
+                ("uuid", sample["uuid"]),
+                ("uuid fragment", sample["uuid"][2:6]),
+                ("no match", "zzqx"),
+            ]
+            # LIKE    = query เดิมก่อนมี index
+            # FTS     = MATCH บน access_logs_fts อย่างเดียว
+            # API     = fetch_log_page() ที่ /api/access-logs ใช้จริง (LIKE ในงบจำกัด → FTS)
+            print(
+                f"\n {'search':<16}{'term':<22}{'rows':>6}{'LIKE ms':>10}{'FTS ms':>9}"
+                f"{'API ms':>9}{'speedup':>10}"
+            )
+            for label, term in searches:
+                like_sql, like_params = app.log_search_condition(term, use_index=False)
+                fts_sql, fts_params = app.log_search_condition(term)
+                like_ms, like_rows = timed(
+                    lambda: conn.execute(page_query(like_sql), like_params + [args.limit]).fetchall(),
+                    args.repeat,
+                )
+                fts_ms, fts_rows = timed(
+                    lambda: conn.execute(page_query(fts_sql), fts_params + [args.limit]).fetchall(),
+                    args.repeat,
+                )
+                api_ms, api_rows = timed(
+                    lambda: app.fetch_log_page(conn, [], [], term, limit=args.limit),
+                    args.repeat,
+                )
+                mark = "" if like_rows == fts_rows == api_rows else "  (row count differs!)"
+                print(
+                    f" {label:<16}{term[:20]:<22}{api_rows:>6}{like_ms:>10.2f}{fts_ms:>9.2f}"
+                    f"{api_ms:>9.2f}{like_ms / api_ms if api_ms else 0:>9.1f}x{mark}"
+                )
+    finally:
+        if args.keep:
+            print(f"\ndatabase kept at {os.environ['DATABASE_PATH']}")
+        else:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,26 +1,20 @@
 from flask import Blueprint, request, jsonify
 import sqlite3
-import os
-from datetime import datetime
+import time
+from datetime import datetime, timedelta, timezone
 import jwt
 from functools import wraps
+
+from db import get_db_connection
 from notifications import notify_booking_result
 
 booking_bp = Blueprint("booking", __name__)
 
-BASE_DIR = os.path.dirname(__file__)
-DB_PATH = os.path.abspath(os.path.join(BASE_DIR, "database.db"))
-
 
 # =====================
 # Database Helper
 # =====================
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
+# get_db_connection() มาจาก db.py — connection pool กลาง (DATABASE_PATH เดียวกับ app.py)
 def init_booking_db():
     """สร้างตารางสำหรับระบบจองห้อง"""
     with get_db_connection() as conn:
@@ -56,8 +50,200 @@ def init_booking_db():
         cursor.execute(
             "CREATE INDEX IF NOT EXISTS idx_bookings_room_date ON bookings(room, date)"
         )
+
+        # สิทธิ์เข้าห้องที่คำนวณไว้ล่วงหน้าจาก booking ที่ approved
+        # 1 แถวต่อ 1 booking — เวลาเป็น epoch seconds (absolute) ไม่ต้องเทียบ HH:MM
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS access_grants (
+                booking_id  INTEGER PRIMARY KEY,
+                uuid        TEXT,
+                user_email  TEXT NOT NULL,
+                room        TEXT NOT NULL,
+                starts_at   INTEGER NOT NULL,
+                ends_at     INTEGER NOT NULL
+            )
+            """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_grants_lookup ON access_grants(uuid, room, ends_at)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_grants_email ON access_grants(user_email)"
+        )
         conn.commit()
 
+    rebuild_access_grants()
+
+
+# =====================
+# Access Grants
+# =====================
+# approve_booking / reject_booking / delete_booking / admin_create_booking
+# อัปเดตตาราง access_grants ใน transaction เดียวกับ bookings
+# ทำให้การเช็คสิทธิ์ตอนสแกนเหลือ point lookup เดียว (uuid, room, เวลา)
+TZ_THAI = timezone(timedelta(hours=7))
+GRANT_KEEP_SECONDS = 24 * 3600  # เก็บ grant ที่หมดอายุแล้วไว้อีก 1 วันก่อน prune
+
+# callback ที่ถูกเรียกหลัง commit ทุกครั้งที่ access_grants เปลี่ยน
+# app.py ลงทะเบียนไว้ล้าง scan debounce cache (booking import app ไม่ได้ — circular)
+_grant_listeners = []
+
+
+def on_grants_changed(fn):
+    """ลงทะเบียน fn() ให้ถูกเรียกเมื่อ access_grants เปลี่ยน"""
+    _grant_listeners.append(fn)
+    return fn
+
+
+def _notify_grants_changed():
+    for fn in _grant_listeners:
+        try:
+            fn()
+        except Exception as e:
+            print(f"[GRANTS] listener {getattr(fn, '__name__', fn)} error: {e}")
+
+
+def _grant_window(date: str, start_time: str, end_time: str):
+    """แปลง date + HH:MM (เวลาไทย) → (starts_at, ends_at) เป็น epoch seconds"""
+    day = datetime.strptime(date, "%Y-%m-%d").replace(tzinfo=TZ_THAI)
+
+    def _at(hhmm):
+        h, m = hhmm.split(":")[:2]
+        # timedelta รองรับ "24:00" (= เที่ยงคืนของวันถัดไป)
+        return int((day + timedelta(hours=int(h), minutes=int(m))).timestamp())
+
+    return _at(start_time), _at(end_time)
+
+
+_GRANT_UUID_SQL = """
+    (SELECT ur.uuid FROM users_reg ur
+     WHERE ur.email = access_grants.user_email AND ur.is_deleted = 0
+     ORDER BY ur.id LIMIT 1)
+"""
+
+
+def _upsert_grant(cursor, booking_id: int):
+    """สร้าง/อัปเดต grant ของ booking ที่ approved (เรียกก่อน commit)"""
+    cursor.execute(
+        """
+        SELECT id, user_email, room, date, start_time, end_time, status
+        FROM bookings WHERE id = ?
+        """,
+        (booking_id,),
+    )
+    b = cursor.fetchone()
+    if not b or b["status"] != "approved":
+        _delete_grant(cursor, booking_id)
+        return
+    try:
+        starts_at, ends_at = _grant_window(b["date"], b["start_time"], b["end_time"])
+    except (ValueError, TypeError) as e:
+        print(f"[GRANTS] booking {booking_id} has invalid date/time: {e}")
+        _delete_grant(cursor, booking_id)
+        return
+    cursor.execute(
+        """
+        INSERT OR REPLACE INTO access_grants
+            (booking_id, user_email, room, starts_at, ends_at)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        (booking_id, b["user_email"], b["room"], starts_at, ends_at),
+    )
+    cursor.execute(
+        f"UPDATE access_grants SET uuid = {_GRANT_UUID_SQL} WHERE booking_id = ?",
+        (booking_id,),
+    )
+
+
+def _delete_grant(cursor, booking_id: int):
+    cursor.execute("DELETE FROM access_grants WHERE booking_id = ?", (booking_id,))
+
+
+def sync_grant_uuids():
+    """
+    ผูก UUID บัตรกับ grant ใหม่ตาม users_reg — เรียกจาก app.py
+    หลังเพิ่ม/แก้ไข/ลบ user (บัตรใหม่, เปลี่ยน email, ลบบัตร)
+    และ prune grant ที่หมดอายุนานแล้วไปพร้อมกัน
+    """
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "DELETE FROM access_grants WHERE ends_at < ?",
+                (int(time.time()) - GRANT_KEEP_SECONDS,),
+            )
+            cursor.execute(f"UPDATE access_grants SET uuid = {_GRANT_UUID_SQL}")
+            conn.commit()
+        _notify_grants_changed()
+    except sqlite3.Error as e:
+        print(f"[GRANTS] sync_grant_uuids error: {e}")
+
+
+def rebuild_access_grants():
+    """สร้าง access_grants ใหม่ทั้งหมดจาก bookings ที่ approved และยังไม่หมดอายุ"""
+    cutoff = int(time.time()) - GRANT_KEEP_SECONDS
+    since = datetime.fromtimestamp(cutoff, TZ_THAI).strftime("%Y-%m-%d")
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                SELECT id, user_email, room, date, start_time, end_time
+                FROM bookings
+                WHERE status = 'approved' AND date >= ?
+                """,
+                (since,),
+            )
+            grants = []
+            for b in cursor.fetchall():
+                try:
+                    starts_at, ends_at = _grant_window(
+                        b["date"], b["start_time"], b["end_time"]
+                    )
+                except (ValueError, TypeError):
+                    continue
+                if ends_at >= cutoff:
+                    grants.append(
+                        (b["id"], b["user_email"], b["room"], starts_at, ends_at)
+                    )
+
+            cursor.execute("DELETE FROM access_grants")
+            cursor.executemany(
+                """
+                INSERT INTO access_grants
+                    (booking_id, user_email, room, starts_at, ends_at)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                grants,
+            )
+            cursor.execute(f"UPDATE access_grants SET uuid = {_GRANT_UUID_SQL}")
+            conn.commit()
+        _notify_grants_changed()
+        print(f"[GRANTS] rebuilt {len(grants)} access grants")
+    except sqlite3.Error as e:
+        print(f"[GRANTS] rebuild_access_grants error: {e}")
+
+
+def has_access_grant(uuid: str, room: str, at: float = None, cursor=None) -> bool:
+    """
+    เช็คว่าบัตร uuid มีสิทธิ์เข้าห้อง room ณ เวลา at (epoch, default = ตอนนี้)
+    ส่ง cursor มาได้ถ้าต้องการเช็คหลายใบใน transaction เดียว (เช่น batch scan)
+    """
+    if cursor is None:
+        with get_db_connection() as conn:
+            return has_access_grant(uuid, room, at, conn.cursor())
+    now = int(at if at is not None else time.time())
+    cursor.execute(
+        """
+        SELECT 1 FROM access_grants
+        WHERE uuid = ? AND room = ? AND ends_at > ? AND starts_at <= ?
+        LIMIT 1
+        """,
+        (uuid, room, now, now),
+    )
+    return cursor.fetchone() is not None
+
 
 # =====================
 # Authentication Decorator
@@ -380,7 +566,9 @@ def approve_booking(current_user, booking_id):
                 """,
                 (current_user["email"], remark, booking_id),
             )
+            _upsert_grant(cursor, booking_id)
             conn.commit()
+        _notify_grants_changed()
 
         # ส่ง notification หลัง commit สำเร็จ
         notify_booking_result(booking_id=booking_id, status="approved", remark=remark)
@@ -432,7 +620,9 @@ def reject_booking(current_user, booking_id):
                 """,
                 (current_user["email"], remark, booking_id),
             )
+            _delete_grant(cursor, booking_id)
             conn.commit()
+        _notify_grants_changed()
 
         # ส่ง notification หลัง commit สำเร็จ
         notify_booking_result(booking_id=booking_id, status="rejected", remark=remark)
@@ -463,7 +653,9 @@ def delete_booking(current_user, booking_id):
                 return jsonify({"success": False, "message": "ไม่มีสิทธิ์ในการลบ"}), 403
 
             cursor.execute("DELETE FROM bookings WHERE id = ?", (booking_id,))
+            _delete_grant(cursor, booking_id)
             conn.commit()
+        _notify_grants_changed()
 
         return jsonify({"success": True, "message": "ลบการจองสำเร็จ"})
 
@@ -560,7 +752,9 @@ def admin_create_booking(current_user):
                 ),
             )
             booking_id = cursor.lastrowid
+            _upsert_grant(cursor, booking_id)
             conn.commit()
+        _notify_grants_changed()
 
         return jsonify(
             {"success": True, "message": "จองห้องสำเร็จ", "booking_id": booking_id}
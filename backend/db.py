@@ -0,0 +1,260 @@
+"""
+db.py
+=====
+Connection management กลางของ backend (app / auth / booking / notifications ใช้ร่วมกัน)
+
+- get_db_connection() คืน connection จาก pool แทนการ sqlite3.connect ใหม่ทุกครั้ง
+  ใช้แบบเดิมได้เลย: `with get_db_connection() as conn:` → ออกจาก with แล้ว
+  commit/rollback ตามปกติ และคืน connection เข้า pool อัตโนมัติ
+- ทุก connection ตั้ง pragma ตาม env: WAL, synchronous=NORMAL, busy_timeout,
+  mmap_size, cache_size → reader ไม่ block writer และไม่ต้องเสีย setup ทุก query
+- pool_stats() รายงานจำนวน connection ที่สร้างใหม่ / reuse / ใช้งานอยู่
+- ทุก execute/executemany ถูกจับเวลาเข้า sqlite_query_duration_seconds (metrics.py)
+"""
+
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from metrics import Gauge, Histogram
+
+# ถูก import ก่อน app.py เรียก load_dotenv() → โหลด .env เองก่อนอ่าน config
+load_dotenv()
+
+BASE_DIR = os.path.dirname(__file__)
+DB_PATH = os.path.abspath(
+    os.path.join(BASE_DIR, os.getenv("DATABASE_PATH", "database.db"))
+)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+DB_CONFIG = {
+    # มีผลกับ database ใหม่ — ไฟล์เดิม ensure_auto_vacuum() VACUUM ให้ครั้งเดียวตอน init
+    "auto_vacuum": os.getenv("SQLITE_AUTO_VACUUM", "INCREMENTAL"),
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout_ms": _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000),
+    "mmap_size": _env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+    "cache_size": _env_int("SQLITE_CACHE_SIZE", -16000),  # ค่าลบ = KiB
+    "pool_size": _env_int("SQLITE_POOL_SIZE", 8),
+}
+
+
+_AUTO_VACUUM_MODES = {"NONE": 0, "0": 0, "FULL": 1, "1": 1, "INCREMENTAL": 2, "2": 2}
+
+
+def ensure_auto_vacuum():
+    """
+    PRAGMA auto_vacuum มีผลกับ database ใหม่เท่านั้น — ไฟล์เดิม (เช่น database.db ที่มากับ repo
+    เป็น NONE) ต้อง VACUUM หนึ่งครั้งถึงจะเปลี่ยนโหมด → ทำตอน init ถ้ายังไม่ตรง DB_CONFIG
+    (ครั้งเดียว รอบถัดไปโหมดตรงแล้วไม่ทำซ้ำ)
+    """
+    want = _AUTO_VACUUM_MODES.get(str(DB_CONFIG["auto_vacuum"]).upper())
+    conn = connect()
+    try:
+        current = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if want is None or current == want:
+            return
+        started = time.perf_counter()
+        conn.execute("VACUUM")  # connect() ตั้ง PRAGMA auto_vacuum ไว้แล้ว
+        print(
+            f"[DB] auto_vacuum {current} -> {want}: VACUUM took "
+            f"{time.perf_counter() - started:.1f}s"
+        )
+    finally:
+        conn.close()
+
+
+def _apply_pragmas(conn):
+    conn.execute(f"PRAGMA auto_vacuum = {DB_CONFIG['auto_vacuum']}")
+    conn.execute(f"PRAGMA journal_mode = {DB_CONFIG['journal_mode']}")
+    conn.execute(f"PRAGMA synchronous = {DB_CONFIG['synchronous']}")
+    conn.execute(f"PRAGMA busy_timeout = {int(DB_CONFIG['busy_timeout_ms'])}")
+    conn.execute(f"PRAGMA mmap_size = {int(DB_CONFIG['mmap_size'])}")
+    conn.execute(f"PRAGMA cache_size = {int(DB_CONFIG['cache_size'])}")
+
+
+# =====================
+# Query timing
+# =====================
+query_duration = Histogram(
+    "sqlite_query_duration_seconds",
+    "SQLite statement execution time",
+    ("op", "table"),
+)
+_TABLE_RE = re.compile(
+    r"\b(?:FROM|INTO|UPDATE|TABLE|ON)\s+([A-Za-z_][A-Za-z0-9_]*)", re.I
+)
+
+
+def _statement_labels(sql: str):
+    """label ของ statement = คำสั่งแรก + ตารางแรกที่อ้างถึง (จำกัด cardinality)"""
+    text = sql.lstrip()
+    op = text.split(None, 1)[0].upper() if text else "?"
+    if op in ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE"):
+        m = _TABLE_RE.search(text)
+        return op, m.group(1).lower() if m else ""
+    return op, ""
+
+
+class TimedCursor(sqlite3.Cursor):
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            op, table = _statement_labels(sql)
+            query_duration.observe(time.perf_counter() - started, op=op, table=table)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            op, table = _statement_labels(sql)
+            query_duration.observe(time.perf_counter() - started, op=op, table=table)
+
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3.Connection ที่ cursor / execute ทุกตัวผ่าน TimedCursor"""
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+def connect(path: str = None):
+    """เปิด connection ใหม่ (ไม่ผ่าน pool) พร้อม pragma — สำหรับงานที่ถือ connection นาน"""
+    conn = sqlite3.connect(
+        path or DB_PATH,
+        timeout=DB_CONFIG["busy_timeout_ms"] / 1000.0,
+        check_same_thread=False,
+        factory=TimedConnection,
+    )
+    conn.row_factory = sqlite3.Row
+    _apply_pragmas(conn)
+    return conn
+
+
+class PooledConnection(TimedConnection):
+    """sqlite3.Connection ที่คืนตัวเองเข้า pool ตอนออกจาก with-block"""
+
+    _pool = None
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            return super().__exit__(exc_type, exc, tb)
+        finally:
+            if self._pool is not None:
+                self._pool.release(self)
+
+
+class ConnectionPool:
+    def __init__(self, path: str, max_idle: int):
+        self.path = path
+        self.max_idle = max(max_idle, 1)
+        self._idle = []
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "reused": 0, "released": 0, "discarded": 0}
+        self._in_use = 0
+
+    def _open(self):
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_CONFIG["busy_timeout_ms"] / 1000.0,
+            check_same_thread=False,  # connection ย้าย thread ได้ผ่าน pool
+            factory=PooledConnection,
+        )
+        conn.row_factory = sqlite3.Row
+        _apply_pragmas(conn)
+        conn._pool = self
+        return conn
+
+    def acquire(self):
+        with self._lock:
+            self._in_use += 1
+            if self._idle:
+                self._stats["reused"] += 1
+                return self._idle.pop()
+            self._stats["created"] += 1
+        try:
+            return self._open()
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+                self._stats["created"] -= 1
+            raise
+
+    def release(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # connection เสีย → ทิ้งไป ไม่คืน pool
+            with self._lock:
+                self._in_use -= 1
+                self._stats["discarded"] += 1
+            return
+        with self._lock:
+            self._in_use -= 1
+            self._stats["released"] += 1
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+            self._stats["discarded"] += 1
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        with self._lock:
+            acquired = self._stats["created"] + self._stats["reused"]
+            return {
+                **self._stats,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "max_idle": self.max_idle,
+                "reuse_ratio": (
+                    round(self._stats["reused"] / acquired, 4) if acquired else None
+                ),
+                "config": {k: v for k, v in DB_CONFIG.items()},
+            }
+
+
+_pool = ConnectionPool(DB_PATH, DB_CONFIG["pool_size"])
+
+
+def get_db_connection():
+    return _pool.acquire()
+
+
+def pool_stats():
+    return _pool.stats()
+
+
+_pool_gauge = Gauge(
+    "sqlite_pool_connections",
+    "Connection pool counters (created / reused / in_use / idle)",
+    ("state",),
+)
+for _state in ("created", "reused", "in_use", "idle", "discarded"):
+    _pool_gauge.set_function(lambda s=_state: _pool.stats()[s], state=_state)
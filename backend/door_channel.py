@@ -0,0 +1,268 @@
+"""
+door_channel.py
+===============
+คิวคำสั่งเปิด/ปิดประตูจาก web ไปยัง ESP32_Door (long-poll + sequence + ack)
+
+แต่ละห้องมีคิวคำสั่งของตัวเอง (threading.Condition ต่อห้อง):
+- post(room, cmd)                 : door_open / door_close วางคำสั่ง ได้เลข seq ของห้องกลับไป
+                                    แล้วปลุก request ที่ long-poll อยู่
+- take(room, wait, ack=None)      : /api/door/command คืนคำสั่งเก่าสุดที่ยังไม่ส่ง พร้อม seq
+                                    ถือ request ไว้สูงสุด wait วินาทีถ้ายังไม่มี (wait=0 = ตอบทันที)
+- ack(room, seq)                  : ประตูยืนยันว่าทำคำสั่ง seq แล้ว (ส่งมากับ poll ถัดไป ?ack=seq)
+
+คำสั่งส่งแบบ at-most-once: ส่งแล้วจะไม่ส่งซ้ำ แต่ยังค้างในคิวจนกว่าจะ ack หรือหมดอายุ
+การหมดอายุใช้ timer wheel (ช่องละ tick วินาที) ที่ sweeper thread หมุนทีละช่อง
+→ post / take / ack เป็น O(1) ไม่ต้องคำนวณอายุคำสั่งทุกครั้งที่ poll
+คิวต่อห้องจำกัด max_pending (เต็มแล้วทิ้งคำสั่งเก่าสุด) และห้องที่ว่างนานถูกลบออกจาก memory
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+from metrics import Counter, Histogram
+
+IDLE = "idle"
+
+commands_total = Counter(
+    "door_commands_total",
+    "Door commands by lifecycle event (posted / delivered / acked / expired / dropped)",
+    ("status",),
+)
+delivery_seconds = Histogram(
+    "door_command_delivery_seconds",
+    "Time from a web command being posted to a door receiving it",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0),
+)
+ack_seconds = Histogram(
+    "door_command_ack_seconds",
+    "Time from a web command being posted to the door acknowledging it",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0),
+)
+
+
+class _Command:
+    __slots__ = ("seq", "command", "posted_at", "delivered_at", "slot")
+
+    def __init__(self, seq, command, posted_at, slot):
+        self.seq = seq
+        self.command = command
+        self.posted_at = posted_at
+        self.delivered_at = None
+        self.slot = slot
+
+
+class _RoomQueue:
+    __slots__ = ("cond", "commands", "next_seq", "waiters", "refs", "idle_since")
+
+    def __init__(self, cond):
+        self.cond = cond
+        self.commands = OrderedDict()  # seq -> _Command (pending + delivered ที่รอ ack)
+        self.next_seq = 1
+        self.waiters = 0
+        self.refs = 0  # request ที่ถือ queue นี้อยู่ (กันไม่ให้ sweeper ลบระหว่างใช้)
+        self.idle_since = 0
+
+
+class DoorCommandChannel:
+    def __init__(
+        self,
+        ttl_seconds: float = 10.0,
+        tick_seconds: float = 1.0,
+        max_pending: int = 8,
+        idle_evict_seconds: float = 600.0,
+    ):
+        self.ttl = ttl_seconds
+        self.tick = tick_seconds
+        self.max_pending = max(max_pending, 1)
+        self._ttl_ticks = max(1, math.ceil(ttl_seconds / tick_seconds))
+        self._evict_ticks = max(1, math.ceil(idle_evict_seconds / tick_seconds))
+        self._wheel = [set() for _ in range(self._ttl_ticks + 1)]
+        self._now_tick = 0
+
+        self._rooms = {}
+        self._lock = threading.Lock()  # ป้องกัน _rooms, timer wheel และ stats
+        self._thread = None
+        self._stats = {
+            "posted": 0,
+            "delivered": 0,
+            "acked": 0,
+            "expired": 0,
+            "expired_unacked": 0,
+            "dropped": 0,
+            "timeouts": 0,
+            "evicted_rooms": 0,
+        }
+
+    # ---------- room lifecycle ----------
+    def _acquire(self, room: str) -> _RoomQueue:
+        with self._lock:
+            q = self._rooms.get(room)
+            if q is None:
+                # ทุกห้องใช้ lock ตัวเดียวกับ channel → wheel/expiry แก้คิวได้ไม่ต้องซ้อน lock
+                q = self._rooms[room] = _RoomQueue(threading.Condition(self._lock))
+            q.refs += 1
+            self._ensure_started()
+            return q
+
+    def _release(self, q: _RoomQueue):
+        # เรียกภายใต้ self._lock
+        q.refs -= 1
+        q.idle_since = self._now_tick
+
+    def _ensure_started(self):
+        # เรียกภายใต้ self._lock — start sweeper ตอนมีห้องแรก
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="door-command-wheel", daemon=True
+            )
+            self._thread.start()
+
+    # ---------- web side ----------
+    def post(self, room: str, command: str) -> int:
+        """วางคำสั่งท้ายคิวของห้อง คืน seq — คิวเต็มจะทิ้งคำสั่งเก่าสุด"""
+        q = self._acquire(room)
+        with self._lock:
+            try:
+                while len(q.commands) >= self.max_pending:
+                    _, old = q.commands.popitem(last=False)
+                    self._wheel[old.slot].discard((room, old.seq))
+                    self._count("dropped")
+                seq = q.next_seq
+                q.next_seq += 1
+                slot = (self._now_tick + self._ttl_ticks) % len(self._wheel)
+                q.commands[seq] = _Command(seq, command, time.monotonic(), slot)
+                self._wheel[slot].add((room, seq))
+                self._count("posted")
+                q.cond.notify_all()
+                return seq
+            finally:
+                self._release(q)
+
+    # ---------- door side ----------
+    def _next_pending(self, q: _RoomQueue):
+        # เรียกภายใต้ self._lock — คิวยาวไม่เกิน max_pending
+        for cmd in q.commands.values():
+            if cmd.delivered_at is None:
+                return cmd
+        return None
+
+    def take(self, room: str, wait: float = 0.0, ack: int = None):
+        """
+        คืน (command, seq) ของคำสั่งเก่าสุดที่ยังไม่ถูกส่ง หรือ ("idle", seq ล่าสุดที่ออกไป)
+        ถ้า wait > 0 จะ block สูงสุด wait วินาทีเพื่อรอคำสั่งใหม่
+        ack = seq ที่ประตูทำเสร็จแล้ว (piggyback มากับ poll)
+        """
+        q = self._acquire(room)
+        with self._lock:
+            try:
+                if ack is not None:
+                    self._ack_locked(room, q, ack)
+                cmd = self._next_pending(q)
+                if cmd is None and wait > 0:
+                    deadline = time.monotonic() + wait
+                    q.waiters += 1
+                    try:
+                        while cmd is None:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                self._count("timeouts")
+                                break
+                            q.cond.wait(remaining)
+                            cmd = self._next_pending(q)
+                    finally:
+                        q.waiters -= 1
+                if cmd is None:
+                    return IDLE, q.next_seq - 1
+                cmd.delivered_at = time.monotonic()
+                delivery_seconds.observe(cmd.delivered_at - cmd.posted_at)
+                self._count("delivered")
+                return cmd.command, cmd.seq
+            finally:
+                self._release(q)
+
+    def ack(self, room: str, seq: int) -> bool:
+        """ประตูยืนยันคำสั่ง seq — คืน True ถ้าคำสั่งยังอยู่ในคิว (ยังไม่หมดอายุ)"""
+        q = self._acquire(room)
+        with self._lock:
+            try:
+                return self._ack_locked(room, q, seq)
+            finally:
+                self._release(q)
+
+    def _ack_locked(self, room, q, seq):
+        cmd = q.commands.get(seq)
+        if cmd is None or cmd.delivered_at is None:
+            return False
+        del q.commands[seq]
+        self._wheel[cmd.slot].discard((room, seq))
+        ack_seconds.observe(time.monotonic() - cmd.posted_at)
+        self._count("acked")
+        return True
+
+    def waiting(self, room: str) -> int:
+        """จำนวน request ของห้องนี้ที่กำลัง long-poll อยู่ (ประตูที่ online แน่นอน)"""
+        q = self._rooms.get(room)
+        return q.waiters if q else 0
+
+    # ---------- timer wheel ----------
+    def _run(self):
+        while True:
+            time.sleep(self.tick)
+            self.advance()
+
+    def advance(self):
+        """หมุน wheel หนึ่ง tick — คำสั่งในช่องนี้ครบ ttl แล้ว (ส่งหรือไม่ส่งก็ตาม)"""
+        with self._lock:
+            self._now_tick += 1
+            slot = self._wheel[self._now_tick % len(self._wheel)]
+            for room, seq in slot:
+                q = self._rooms.get(room)
+                cmd = q.commands.pop(seq, None) if q else None
+                if cmd is None:
+                    continue
+                self._count("expired" if cmd.delivered_at is None else "expired_unacked")
+            slot.clear()
+            if self._now_tick % self._evict_ticks == 0:
+                self._evict_idle_rooms()
+
+    def _evict_idle_rooms(self):
+        # เรียกภายใต้ self._lock — ลบห้องที่ไม่มีคำสั่ง ไม่มีใครใช้ และว่างมานาน
+        for room, q in list(self._rooms.items()):
+            if (
+                not q.commands
+                and q.refs == 0
+                and self._now_tick - q.idle_since >= self._evict_ticks
+            ):
+                del self._rooms[room]
+                self._stats["evicted_rooms"] += 1
+
+    # ---------- stats ----------
+    def _count(self, status):
+        # เรียกภายใต้ self._lock
+        self._stats[status] += 1
+        commands_total.inc(status=status)
+
+    def stats(self):
+        with self._lock:
+            pending = {
+                room: [
+                    {
+                        "seq": c.seq,
+                        "command": c.command,
+                        "state": "pending" if c.delivered_at is None else "delivered",
+                    }
+                    for c in q.commands.values()
+                ]
+                for room, q in self._rooms.items()
+                if q.commands
+            }
+            return {
+                **self._stats,
+                "rooms": len(self._rooms),
+                "waiting": sum(q.waiters for q in self._rooms.values()),
+                "queued": pending,
+                "ttl_seconds": self.ttl,
+                "max_pending": self.max_pending,
+            }
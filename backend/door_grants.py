@@ -0,0 +1,251 @@
+"""
+door_grants.py
+==============
+Offline grant bundle ต่อห้อง สำหรับ ESP32_Door (/api/door/grants)
+
+- ประตูดึงสิทธิ์จาก booking ที่ approved ของห้องตัวเองล่วงหน้า N ชั่วโมง
+  (มาจาก access_grants = bookings ⨝ users_reg ที่ booking.py maintain ไว้แล้ว)
+  → ตอน server ล่ม นักศึกษาที่จองไว้ยังเข้าห้องได้ แล้วประตูค่อย upload log
+  ผ่าน /api/send_uuid/batch ทีหลัง
+- version ต่อห้อง — trigger บน access_grants เพิ่ม grant_versions.version
+  ทุกครั้งที่ grant ของห้องนั้นเพิ่ม/ลบ/เปลี่ยน (approve, reject, ผูกบัตรใหม่ ฯลฯ)
+- หน้าต่างเวลาเริ่มที่ต้นชั่วโมง → ETag = (version ของห้อง, ชั่วโมง, hours)
+  ESP32 ส่ง If-None-Match มา ถ้าไม่มีอะไรเปลี่ยนได้ 304
+- UUID ส่งเป็น hash แบบเดียวกับ binary whitelist (whitelist.uuid_hash)
+- Accept: application/octet-stream (หรือ ?format=bin) → binary ให้ binary-search ได้เลย
+"""
+
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+
+from flask import Blueprint, Response, jsonify, request
+
+from db import get_db_connection
+from whitelist import WHITELIST_BIN_MIME, uuid_hash
+
+door_grants_bp = Blueprint("door_grants", __name__)
+
+# ค่า default / สูงสุดของ ?hours=
+GRANT_BUNDLE_HOURS = int(os.getenv("GRANT_BUNDLE_HOURS", "24"))
+GRANT_BUNDLE_MAX_HOURS = 72
+GRANT_BUNDLE_MAX_ENTRIES = 4096
+GRANT_BIN_MAGIC = b"GRB1"
+# bit บนสุดของ count ใน header = bundle ถูกตัดเหลือ GRANT_BUNDLE_MAX_ENTRIES
+GRANT_BIN_TRUNCATED = 0x80000000
+
+_BUMP_SQL = """
+    INSERT INTO grant_versions (room, version) VALUES ({room}, 1)
+    ON CONFLICT(room) DO UPDATE SET version = version + 1;
+"""
+
+
+def init_door_grants_db():
+    """สร้างตาราง grant_versions + trigger บน access_grants (ต้องเรียกหลัง init_booking_db)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS grant_versions (
+                room     TEXT PRIMARY KEY,
+                version  INTEGER NOT NULL
+            )
+            """
+        )
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_grants_insert
+            AFTER INSERT ON access_grants
+            BEGIN
+                {_BUMP_SQL.format(room="NEW.room")}
+            END
+            """
+        )
+        # sync_grant_uuids UPDATE ทุกแถว — bump เฉพาะแถวที่ค่าเปลี่ยนจริง
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_grants_update
+            AFTER UPDATE ON access_grants
+            WHEN OLD.uuid IS NOT NEW.uuid
+              OR OLD.room IS NOT NEW.room
+              OR OLD.starts_at IS NOT NEW.starts_at
+              OR OLD.ends_at IS NOT NEW.ends_at
+            BEGIN
+                {_BUMP_SQL.format(room="OLD.room")}
+                {_BUMP_SQL.format(room="NEW.room")}
+            END
+            """
+        )
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_grants_delete
+            AFTER DELETE ON access_grants
+            BEGIN
+                {_BUMP_SQL.format(room="OLD.room")}
+            END
+            """
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_grants_room_window ON access_grants(room, ends_at)"
+        )
+        conn.commit()
+
+
+# =====================
+# Bundle
+# =====================
+_cache_lock = threading.Lock()
+_bundle_cache = {}  # (room, hours) -> (version, window_start, (entries, covered_until))
+_BUNDLE_CACHE_MAX = 256
+
+
+def room_version(cursor, room: str) -> int:
+    cursor.execute("SELECT version FROM grant_versions WHERE room = ?", (room,))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+
+def _load_entries(cursor, room: str, window_start: int, window_end: int):
+    """
+    ([(hash, starts_at, ends_at), ...], covered_until) — entries เรียงตาม hash แล้วเวลาเริ่ม
+    ซ้ำกันตัดทิ้ง
+
+    ถ้าเกิน GRANT_BUNDLE_MAX_ENTRIES เก็บ booking ที่เริ่มเร็วสุดไว้ก่อน (ตัดตาม hash
+    จะทิ้ง booking ที่กำลังใช้อยู่ของบางคนแบบสุ่ม) แล้ว covered_until = starts_at
+    ของตัวแรกที่ถูกตัด — หลังเวลานั้น bundle ไม่ครบ ไม่ถูกตัดก็คือ window_end
+    """
+    cursor.execute(
+        """
+        SELECT uuid, starts_at, ends_at FROM access_grants
+        WHERE room = ? AND ends_at > ? AND starts_at < ? AND uuid IS NOT NULL
+        """,
+        (room, window_start, window_end),
+    )
+    entries = {(uuid_hash(r["uuid"]), r["starts_at"], r["ends_at"]) for r in cursor.fetchall()}
+    covered_until = window_end
+    if len(entries) > GRANT_BUNDLE_MAX_ENTRIES:
+        by_start = sorted(entries, key=lambda g: (g[1], g[2], g[0]))
+        covered_until = max(by_start[GRANT_BUNDLE_MAX_ENTRIES][1], window_start)
+        entries = by_start[:GRANT_BUNDLE_MAX_ENTRIES]
+        print(f"[GRANTS] {room}: bundle truncated to {len(entries)} grants, covers until {covered_until}")
+    return sorted(entries), covered_until
+
+
+def _bundle_entries(cursor, room: str, hours: int, version: int, window_start: int):
+    """
+    (entries, covered_until) ของ (ห้อง, version, ชั่วโมง)
+    query ครั้งเดียวจนกว่า version/ชั่วโมงจะเปลี่ยน
+    """
+    key = (room, hours)
+    with _cache_lock:
+        cached = _bundle_cache.get(key)
+        if cached and cached[0] == version and cached[1] == window_start:
+            return cached[2]
+    bundle = _load_entries(cursor, room, window_start, window_start + hours * 3600)
+    with _cache_lock:
+        if len(_bundle_cache) >= _BUNDLE_CACHE_MAX and key not in _bundle_cache:
+            _bundle_cache.clear()  # ?room= มาจาก client — กันไม่ให้ cache โตไม่จำกัด
+        _bundle_cache[key] = (version, window_start, bundle)
+    return bundle
+
+
+def _build_binary(version, server_time, window_end, entries, truncated=False) -> bytes:
+    """
+    Layout (little-endian เหมือน ESP32):
+        0   magic        4 bytes  "GRB1"
+        4   version      uint32
+        8   server_time  uint32   epoch ตอนตอบ — ประตูที่ไม่มี RTC ใช้ตั้งนาฬิกา
+        12  window_end   uint32   หลังเวลานี้ bundle ไม่ครอบคลุมแล้ว (ถูกตัด = starts_at
+                                  ของ booking แรกที่ไม่ได้ส่งมา)
+        16  count        uint32   bit 31 = GRANT_BIN_TRUNCATED, bit 0-30 = จำนวน entries
+        20  crc32        uint32   ของส่วน entries
+        24  entries      count x 16 bytes — hash 8 + starts_at uint32 + ends_at uint32
+                         เรียงตาม hash (memcmp) แล้ว starts_at
+    """
+    body = b"".join(struct.pack("<8sII", h, s, e) for h, s, e in entries)
+    header = struct.pack(
+        "<4sIIIII",
+        GRANT_BIN_MAGIC,
+        version,
+        server_time,
+        window_end,
+        len(entries) | (GRANT_BIN_TRUNCATED if truncated else 0),
+        zlib.crc32(body),
+    )
+    return header + body
+
+
+def _wants_binary() -> bool:
+    if request.args.get("format") == "bin":
+        return True
+    best = request.accept_mimetypes.best_match(["application/json", WHITELIST_BIN_MIME])
+    return best == WHITELIST_BIN_MIME
+
+
+# =====================
+# Route
+# =====================
+@door_grants_bp.route("/api/door/grants", methods=["GET"])
+def get_door_grants():
+    """
+    สิทธิ์เข้าห้องจาก booking ที่ approved ของ ?room= ตั้งแต่ต้นชั่วโมงนี้ไป ?hours= ชั่วโมง
+    ไม่ต้อง auth token เพราะ ESP32 ไม่มี session (UUID ส่งเป็น hash)
+
+    - If-None-Match ตรงกับ ETag ปัจจุบัน → 304
+    - JSON: {"room", "version", "server_time", "window_start", "window_end",
+             "count", "truncated", "grants": [[hash_hex, starts_at, ends_at], ...]}
+    - truncated = มี booking เกิน GRANT_BUNDLE_MAX_ENTRIES → ส่งเฉพาะที่เริ่มเร็วสุด
+      และ window_end ถูกเลื่อนมาที่ starts_at ของตัวแรกที่ถูกตัด
+    """
+    room = (request.args.get("room") or "").strip()
+    if not room:
+        return jsonify({"success": False, "message": "room required"}), 400
+    hours = request.args.get("hours", GRANT_BUNDLE_HOURS, type=int)
+    hours = max(1, min(hours, GRANT_BUNDLE_MAX_HOURS))
+    binary = _wants_binary()
+
+    now = int(time.time())
+    window_start = now - now % 3600
+    window_end = window_start + hours * 3600
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            version = room_version(cursor, room)
+            etag = f'"gr-{version}-{window_start}-{hours}{".bin" if binary else ""}"'
+            if request.headers.get("If-None-Match") == etag:
+                return Response(status=304, headers={"ETag": etag, "Vary": "Accept"})
+            entries, covered_until = _bundle_entries(cursor, room, hours, version, window_start)
+    except sqlite3.Error as e:
+        print(f"[GRANTS] get_door_grants error: {e}")
+        return jsonify({"success": False, "message": str(e)}), 500
+
+    truncated = covered_until < window_end
+    if truncated:
+        window_end = covered_until
+
+    if binary:
+        return Response(
+            _build_binary(version, now, window_end, entries, truncated),
+            mimetype=WHITELIST_BIN_MIME,
+            headers={"ETag": etag, "Vary": "Accept"},
+        )
+
+    resp = jsonify(
+        {
+            "success": True,
+            "room": room,
+            "version": version,
+            "server_time": now,
+            "window_start": window_start,
+            "window_end": window_end,
+            "count": len(entries),
+            "truncated": truncated,
+            "grants": [[h.hex(), s, e] for h, s, e in entries],
+        }
+    )
+    resp.headers["ETag"] = etag
+    resp.headers["Vary"] = "Accept"
+    return resp
@@ -0,0 +1,507 @@
+"""
+loadtest.py
+===========
+Load generator จำลอง ESP32_Door หลายตัว + Admin Dashboard ยิงใส่ backend
+
+แต่ละ door (1 thread ต่อ 1 ประตู เหมือนอุปกรณ์จริง):
+  - poll  GET  /api/door/command?room=<room>   ทุก --command-interval วิ (default 1)
+          หรือ long-poll ?wait=N ต่อเนื่องใน thread แยก ถ้าใส่ --command-wait N (แบบ firmware ใหม่)
+  - pull  GET  /api/whitelist                  ทุก --whitelist-interval วิ (default 300) ส่ง If-None-Match
+  - scan  POST /api/send_uuid                  เฉลี่ย --scan-rate ครั้ง/นาที (Poisson)
+แต่ละ dashboard:
+  - poll  GET  /api/door/status?room=<room>    ทุก --status-interval วิ (default 3)
+          หรือ GET /api/door/status/all ถ้าใส่ --status-all (แบบหน้า dashboard ใหม่)
+
+default จะ start `python app.py` เองบน database ชั่วคราว (seed ห้อง / ผู้ใช้ / booking
+ที่ approved แล้ว) แล้วรายงาน throughput, p50/p95/p99 latency และ error rate ต่อ endpoint
+ใช้ --url เพื่อยิงใส่ server ที่รันอยู่แล้วแทน (ไม่ seed ข้อมูล)
+
+ใช้ stdlib อย่างเดียว:
+    python loadtest.py --doors 50 --dashboards 5 --duration 60
+    python loadtest.py --doors 200 --scan-rate 12 --json report.json
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+TZ_THAI = timezone(timedelta(hours=7))
+
+
+# =====================
+# Latency recording
+# =====================
+class Recorder:
+    """เก็บ latency / status ของ request — 1 ตัวต่อ thread แล้วค่อย merge ตอนจบ"""
+
+    def __init__(self):
+        self.samples = {}  # endpoint -> [latency_s, ...]
+        self.statuses = {}  # endpoint -> {status: count}
+        self.errors = {}  # endpoint -> count (exception / 5xx)
+
+    def record(self, endpoint, latency, status):
+        self.samples.setdefault(endpoint, []).append(latency)
+        by_status = self.statuses.setdefault(endpoint, {})
+        by_status[status] = by_status.get(status, 0) + 1
+        if status == "error" or (isinstance(status, int) and status >= 500):
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+
+    def merge(self, other):
+        for ep, values in other.samples.items():
+            self.samples.setdefault(ep, []).extend(values)
+        for ep, by_status in other.statuses.items():
+            mine = self.statuses.setdefault(ep, {})
+            for status, n in by_status.items():
+                mine[status] = mine.get(status, 0) + n
+        for ep, n in other.errors.items():
+            self.errors[ep] = self.errors.get(ep, 0) + n
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def build_report(recorder, elapsed):
+    endpoints = {}
+    total = total_errors = 0
+    for ep in sorted(recorder.samples):
+        values = sorted(recorder.samples[ep])
+        n = len(values)
+        errors = recorder.errors.get(ep, 0)
+        total += n
+        total_errors += errors
+        endpoints[ep] = {
+            "requests": n,
+            "rps": round(n / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(_percentile(values, 50) * 1000, 2),
+            "p95_ms": round(_percentile(values, 95) * 1000, 2),
+            "p99_ms": round(_percentile(values, 99) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+            "errors": errors,
+            "error_rate": round(errors / n, 4) if n else 0.0,
+            "status": {str(k): v for k, v in sorted(recorder.statuses[ep].items(), key=str)},
+        }
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "requests": total,
+        "rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "errors": total_errors,
+        "error_rate": round(total_errors / total, 4) if total else 0.0,
+        "endpoints": endpoints,
+    }
+
+
+def print_report(report, config):
+    print("\n" + "=" * 96)
+    print(
+        f" doors={config['doors']} dashboards={config['dashboards']} "
+        f"scan_rate={config['scan_rate']}/min/door duration={report['elapsed_s']}s"
+    )
+    print("=" * 96)
+    print(
+        f" {'endpoint':<28}{'reqs':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}"
+        f"{'p99 ms':>10}{'max ms':>10}{'err %':>8}"
+    )
+    for ep, s in report["endpoints"].items():
+        print(
+            f" {ep:<28}{s['requests']:>8}{s['rps']:>9.1f}{s['p50_ms']:>10.2f}"
+            f"{s['p95_ms']:>10.2f}{s['p99_ms']:>10.2f}{s['max_ms']:>10.2f}"
+            f"{s['error_rate'] * 100:>8.2f}"
+        )
+    print("-" * 96)
+    print(
+        f" {'total':<28}{report['requests']:>8}{report['rps']:>9.1f}"
+        f"{'':>40}{report['error_rate'] * 100:>8.2f}"
+    )
+    for ep, s in report["endpoints"].items():
+        print(f"   {ep}: status {s['status']}")
+
+
+# =====================
+# HTTP client (1 connection ต่อ thread)
+# =====================
+class Client:
+    def __init__(self, base_url, recorder, timeout=10.0):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.recorder = recorder
+        self.timeout = timeout
+        self.conn = None
+        self.last_headers = {}
+
+    def request(self, endpoint, method, path, body=None, extra_headers=None):
+        headers = {"Connection": "keep-alive", **(extra_headers or {})}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body).encode()
+            headers["Content-Type"] = "application/json"
+        started = time.perf_counter()
+        try:
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(
+                    self.host, self.port, timeout=self.timeout
+                )
+            self.conn.request(method, path, body=payload, headers=headers)
+            resp = self.conn.getresponse()
+            resp.read()
+            status = resp.status
+            self.last_headers = dict(resp.getheaders())
+            if resp.will_close:
+                self.close()
+        except (OSError, http.client.HTTPException):
+            status = "error"
+            self.close()
+        self.recorder.record(endpoint, time.perf_counter() - started, status)
+        return status
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+# =====================
+# Simulated devices
+# =====================
+def door_worker(base_url, room, uuids, args, stop_event, recorder):
+    """จำลอง ESP32_Door หนึ่งตัว — ทุกงานใช้ connection เดียวกันแบบอุปกรณ์จริง"""
+    client = Client(base_url, recorder)
+    rng = random.Random()
+    now = time.monotonic()
+    # กระจายจังหวะเริ่มต้น ไม่ให้ทุกประตู poll พร้อมกันเป๊ะ
+    next_command = (
+        now + rng.uniform(0, args.command_interval)
+        if args.command_wait <= 0
+        else math.inf  # long-poll อยู่ใน command_longpoll_worker
+    )
+    next_whitelist = now + rng.uniform(0, min(args.whitelist_interval, 5.0))
+    whitelist_etag = None
+    scan_gap = 60.0 / args.scan_rate if args.scan_rate > 0 else None
+    next_scan = now + rng.expovariate(1.0 / scan_gap) if scan_gap else math.inf
+
+    while not stop_event.is_set():
+        now = time.monotonic()
+        if now >= next_whitelist:
+            # ส่ง ETag ที่ได้ล่าสุดแบบ firmware → ส่วนใหญ่ได้ 304
+            headers = {"If-None-Match": whitelist_etag} if whitelist_etag else None
+            status = client.request(
+                "GET /api/whitelist", "GET", "/api/whitelist", extra_headers=headers
+            )
+            if status == 200:
+                whitelist_etag = client.last_headers.get("ETag")
+            next_whitelist = now + args.whitelist_interval
+        if now >= next_command:
+            client.request(
+                "GET /api/door/command", "GET", f"/api/door/command?room={room}"
+            )
+            next_command = now + args.command_interval
+        if now >= next_scan:
+            client.request(
+                "POST /api/send_uuid",
+                "POST",
+                "/api/send_uuid",
+                {"uuid": rng.choice(uuids), "room": room, "source": "door"},
+            )
+            next_scan = now + rng.expovariate(1.0 / scan_gap)
+        wait = min(next_command, next_whitelist, next_scan) - time.monotonic()
+        if wait > 0:
+            stop_event.wait(wait)
+    client.close()
+
+
+def command_longpoll_worker(base_url, room, args, stop_event, recorder):
+    """จำลอง doorCommandTask ของ firmware — long-poll ต่อกันไม่มีช่วงว่าง"""
+    client = Client(base_url, recorder, timeout=args.command_wait + 10)
+    path = f"/api/door/command?room={room}&wait={args.command_wait:g}"
+    while not stop_event.is_set():
+        if client.request("GET /api/door/command", "GET", path) == "error":
+            stop_event.wait(1.0)
+    client.close()
+
+
+def dashboard_worker(base_url, rooms, args, stop_event, recorder):
+    """จำลองหน้า Admin Dashboard ที่เปิดค้างไว้ — poll สถานะประตูของห้องที่เลือก"""
+    client = Client(base_url, recorder)
+    rng = random.Random()
+    room = rng.choice(rooms)
+    stop_event.wait(rng.uniform(0, args.status_interval))
+    while not stop_event.is_set():
+        started = time.monotonic()
+        if args.status_all:
+            client.request("GET /api/door/status/all", "GET", "/api/door/status/all")
+        else:
+            client.request(
+                "GET /api/door/status", "GET", f"/api/door/status?room={room}"
+            )
+        if rng.random() < 0.1:
+            room = rng.choice(rooms)  # admin สลับห้องบ้าง
+        stop_event.wait(max(0.0, args.status_interval - (time.monotonic() - started)))
+    client.close()
+
+
+# =====================
+# Local server on a temp database
+# =====================
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def seed_database(db_path, rooms, n_users, n_admins, booked_ratio):
+    """
+    ใส่ห้อง + users_reg + booking approved ของวันนี้ (ทั้งวัน) ให้ student ส่วนหนึ่ง
+    access_grants ถูก rebuild เองตอน server start (init_booking_db)
+    คืน list ของ uuid ที่ใช้สแกน (รวม uuid ที่ไม่ได้ลงทะเบียนด้วย ~10%)
+    """
+    today = datetime.now(TZ_THAI).strftime("%Y-%m-%d")
+    conn = sqlite3.connect(db_path)
+    cur = conn.cursor()
+    cur.executemany("INSERT OR IGNORE INTO rooms (name) VALUES (?)", [(r,) for r in rooms])
+    users, bookings = [], []
+    for i in range(n_users):
+        role = "admin" if i < n_admins else "student"
+        email = f"load{i:05d}@kkumail.com" if role == "student" else f"load{i:05d}@kku.ac.th"
+        users.append(
+            (f"LT{i:08X}", f"{i:09d}", "Load", f"User{i}", f"Load User{i}", email, role)
+        )
+        if role == "student" and random.random() < booked_ratio:
+            bookings.append((i + 1, email, random.choice(rooms), today))
+    cur.executemany(
+        """
+        INSERT INTO users_reg (uuid, user_id, first_name, last_name, name, email, role)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        users,
+    )
+    cur.executemany(
+        """
+        INSERT INTO bookings (user_id, user_email, room, date, start_time, end_time, detail, status, approved_by)
+        VALUES (?, ?, ?, ?, '00:00', '24:00', 'loadtest', 'approved', 'loadtest@kku.ac.th')
+        """,
+        bookings,
+    )
+    conn.commit()
+    conn.close()
+    unknown = [f"UNKNOWN{i:04d}" for i in range(max(1, n_users // 10))]
+    return [u[0] for u in users] + unknown
+
+
+def server_env(workdir, port):
+    env = dict(os.environ)
+    env.update(
+        {
+            "DATABASE_PATH": os.path.join(workdir, "loadtest.db"),
+            "UPLOAD_FOLDER": os.path.join(workdir, "photos"),
+            "HOST": "127.0.0.1",
+            "PORT": str(port),
+            "FLASK_DEBUG": "False",
+            "PYTHONUNBUFFERED": "1",
+        }
+    )
+    return env
+
+
+def init_schema(env):
+    """สร้างตารางด้วย init function ของ backend เอง (ไม่ copy schema มาไว้ที่นี่)"""
+    subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import app; app.init_db(); app.init_auth_db(); "
+            "app.init_booking_db(); app.init_notification_db(); app.init_whitelist_db(); "
+            "app.init_door_grants_db()",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+        check=True,
+        stdout=subprocess.DEVNULL,
+    )
+
+
+def wait_ready(base_url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    parts = urlsplit(base_url)
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=1.0)
+            conn.request("GET", "/api/rooms")
+            if conn.getresponse().status == 200:
+                conn.close()
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+# =====================
+# Main
+# =====================
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description="Door fleet load test for the RFID backend")
+    p.add_argument("--doors", type=int, default=20, help="จำนวน ESP32_Door จำลอง")
+    p.add_argument("--dashboards", type=int, default=3, help="จำนวน Admin Dashboard ที่เปิดอยู่")
+    p.add_argument("--duration", type=float, default=30.0, help="ระยะเวลาทดสอบ (วินาที)")
+    p.add_argument("--scan-rate", type=float, default=6.0, help="scan ต่อนาทีต่อประตู (เฉลี่ย)")
+    p.add_argument("--command-interval", type=float, default=1.0)
+    p.add_argument(
+        "--command-wait", type=float, default=0.0,
+        help="ถ้า > 0 ใช้ long-poll ?wait=N แทน poll ทุก --command-interval",
+    )
+    p.add_argument("--whitelist-interval", type=float, default=300.0)
+    p.add_argument("--status-interval", type=float, default=3.0)
+    p.add_argument(
+        "--status-all", action="store_true",
+        help="dashboard ดึง /api/door/status/all (ทุกห้องใน request เดียว) แทนทีละห้อง",
+    )
+    p.add_argument("--users", type=int, default=500, help="จำนวน users_reg ที่ seed")
+    p.add_argument("--admins", type=int, default=10, help="จำนวน admin ในนั้น (whitelist)")
+    p.add_argument("--booked-ratio", type=float, default=0.5, help="สัดส่วน student ที่มี booking วันนี้")
+    p.add_argument("--url", help="ยิงใส่ server ที่รันอยู่แล้ว เช่น http://127.0.0.1:5000 (ไม่ seed)")
+    p.add_argument("--rooms", help="ชื่อห้องคั่นด้วย comma (default LOAD-0001..)")
+    p.add_argument("--json", help="เขียน report เป็น JSON ลงไฟล์นี้")
+    p.add_argument("--keep", action="store_true", help="ไม่ลบ temp directory (ดู server log / db)")
+    return p.parse_args(argv)
+
+
+def run(args):
+    rooms = (
+        [r.strip() for r in args.rooms.split(",") if r.strip()]
+        if args.rooms
+        else [f"LOAD-{i + 1:04d}" for i in range(args.doors)]
+    )
+    server = None
+    workdir = None
+    uuids = [f"UNKNOWN{i:04d}" for i in range(100)]
+    base_url = args.url
+
+    if not base_url:
+        workdir = tempfile.mkdtemp(prefix="rfid-loadtest-")
+        port = _free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        env = server_env(workdir, port)
+        print(f"[LOADTEST] init temp database in {workdir}")
+        init_schema(env)
+        uuids = seed_database(
+            env["DATABASE_PATH"], rooms, args.users, args.admins, args.booked_ratio
+        )
+        log_path = os.path.join(workdir, "server.log")
+        log = open(log_path, "w")
+        server = subprocess.Popen(
+            [sys.executable, "app.py"],
+            cwd=BACKEND_DIR,
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        if not wait_ready(base_url):
+            server.terminate()
+            print(f"[LOADTEST] server did not start — see {log_path}")
+            return None
+        print(f"[LOADTEST] server ready at {base_url} (log: {log_path})")
+
+    stop_event = threading.Event()
+    recorders, threads = [], []
+    for i in range(args.doors):
+        rec = Recorder()
+        recorders.append(rec)
+        threads.append(
+            threading.Thread(
+                target=door_worker,
+                args=(base_url, rooms[i % len(rooms)], uuids, args, stop_event, rec),
+                daemon=True,
+            )
+        )
+        if args.command_wait > 0:
+            rec = Recorder()
+            recorders.append(rec)
+            threads.append(
+                threading.Thread(
+                    target=command_longpoll_worker,
+                    args=(base_url, rooms[i % len(rooms)], args, stop_event, rec),
+                    daemon=True,
+                )
+            )
+    for _ in range(args.dashboards):
+        rec = Recorder()
+        recorders.append(rec)
+        threads.append(
+            threading.Thread(
+                target=dashboard_worker,
+                args=(base_url, rooms, args, stop_event, rec),
+                daemon=True,
+            )
+        )
+
+    print(
+        f"[LOADTEST] {args.doors} doors + {args.dashboards} dashboards "
+        f"for {args.duration:.0f}s ..."
+    )
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    try:
+        stop_event.wait(args.duration)
+    except KeyboardInterrupt:
+        print("[LOADTEST] interrupted — reporting partial results")
+    stop_event.set()
+    for t in threads:
+        t.join(15 + args.command_wait)
+    elapsed = time.monotonic() - started
+
+    total = Recorder()
+    for rec in recorders:
+        total.merge(rec)
+    report = build_report(total, elapsed)
+    config = {
+        "doors": args.doors,
+        "dashboards": args.dashboards,
+        "scan_rate": args.scan_rate,
+        "command_interval": args.command_interval,
+        "command_wait": args.command_wait,
+        "whitelist_interval": args.whitelist_interval,
+        "status_interval": args.status_interval,
+        "target": base_url,
+    }
+    print_report(report, config)
+
+    if server is not None:
+        server.terminate()  # SIGTERM → server drain log queue ก่อนออก
+        try:
+            server.wait(15)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        if args.keep:
+            print(f"[LOADTEST] kept {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"config": config, **report}, f, indent=2)
+        print(f"[LOADTEST] report written to {args.json}")
+    return report
+
+
+if __name__ == "__main__":
+    result = run(parse_args())
+    sys.exit(0 if result is not None and result["errors"] == 0 else 1)
@@ -0,0 +1,487 @@
+"""
+log_archive.py
+==============
+Retention ของ access_logs แบบ "archive ทั้งเดือน แล้วค่อยเอาออก" แทน
+DELETE ... WHERE scanned_at < now - 30 days ครั้งเดียว
+
+- partition = เดือนปฏิทิน (UTC ตาม scanned_at) — เดือนที่จบไปแล้วเกิน LOG_RETENTION_DAYS
+  ถูก copy ออกเป็นไฟล์ SQLite ของเดือนนั้น แล้ว gzip เก็บใน LOG_ARCHIVE_DIR
+  (access_logs_YYYY_MM.db.gz) — ตรวจว่าทุกแถวอยู่ในไฟล์แล้วจึงเอาออกจาก access_logs
+- การ copy อ่าน main database ผ่าน ATTACH → ไม่ถือ write lock ของ access_logs
+- rollup รายชั่วโมงของเดือนนั้นย้ายไป access_log_hourly_archived → สถิติย้อนหลังไม่หาย
+- log_archives = รายการ partition (จำนวนแถว, ช่วงเวลา, ขนาดไฟล์)
+- open_partition() แตกไฟล์ไว้ใน cache แล้วเปิดแบบ read-only สำหรับ audit
+- log ที่ upload มาช้า (offline batch) ของเดือนที่ archive ไปแล้ว → รอบถัดไป merge เข้าไฟล์เดิม
+- การเอาออกจาก access_logs ทำทีละ batch ตามช่วง rowid พร้อมพักระหว่าง batch
+  และหยุดรอเมื่อ scan เข้ามาถี่ → door request ไม่ต้องรอ write lock นาน (purge_progress())
+"""
+
+import gzip
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from db import DB_PATH, connect, ensure_auto_vacuum, get_db_connection
+from metrics import Counter
+
+LOG_RETENTION_DAYS = int(os.getenv("LOG_RETENTION_DAYS", "30"))
+LOG_ARCHIVE_DIR = os.path.abspath(
+    os.getenv("LOG_ARCHIVE_DIR", os.path.join(os.path.dirname(DB_PATH), "archive"))
+)
+_CACHE_DIR = os.path.join(LOG_ARCHIVE_DIR, ".cache")
+
+# ลบออกจาก access_logs ทีละ batch — ระหว่าง batch พัก LOG_PURGE_PAUSE_MS
+# ถ้า scan เข้ามาถี่ (busy) รอทีละ LOG_PURGE_BUSY_WAIT วินาที สูงสุด LOG_PURGE_MAX_WAIT ต่อ batch
+LOG_PURGE_BATCH = max(int(os.getenv("LOG_PURGE_BATCH", "1000")), 1)
+LOG_PURGE_PAUSE_MS = int(os.getenv("LOG_PURGE_PAUSE_MS", "50"))
+LOG_PURGE_BUSY_WAIT = 0.5
+LOG_PURGE_MAX_WAIT = float(os.getenv("LOG_PURGE_MAX_WAIT", "30"))
+LOG_PURGE_VACUUM_PAGES = 1000
+LOG_PURGE_REPORT_EVERY = 25  # print ความคืบหน้าทุกกี่ batch
+
+purge_rows_total = Counter(
+    "log_purge_rows_total", "Access log rows moved out of access_logs by retention"
+)
+
+_LOG_COLUMNS = "id, uuid, user_id, name, email, role, room, result, method, scanned_at"
+
+# schema ของไฟล์ partition — column เดียวกับ access_logs + index ที่ keyset query ใช้
+_PARTITION_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS access_logs (
+        id          INTEGER PRIMARY KEY,
+        uuid        TEXT NOT NULL,
+        user_id     TEXT,
+        name        TEXT,
+        email       TEXT,
+        role        TEXT,
+        room        TEXT,
+        result      TEXT NOT NULL,
+        method      TEXT NOT NULL,
+        scanned_at  TIMESTAMP
+    );
+    CREATE INDEX IF NOT EXISTS idx_logs_scanned_at ON access_logs(scanned_at);
+    CREATE INDEX IF NOT EXISTS idx_logs_room_time ON access_logs(room, scanned_at);
+    CREATE INDEX IF NOT EXISTS idx_logs_result_time ON access_logs(result, scanned_at);
+    CREATE INDEX IF NOT EXISTS idx_logs_uuid ON access_logs(uuid);
+"""
+
+_rotate_lock = threading.Lock()
+_cache_lock = threading.Lock()
+
+
+def init_log_archive_db():
+    """
+    สร้างตาราง log_archives + access_log_hourly_archived (ต้องเรียกหลัง init_db)
+    และเปิด auto_vacuum = INCREMENTAL ให้ database เดิม (ensure_auto_vacuum)
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS log_archives (
+                month        TEXT PRIMARY KEY,   -- 'YYYY-MM' (UTC)
+                file         TEXT NOT NULL,      -- ชื่อไฟล์ใน LOG_ARCHIVE_DIR
+                rows         INTEGER NOT NULL,
+                first_at     TIMESTAMP,
+                last_at      TIMESTAMP,
+                bytes        INTEGER NOT NULL,
+                archived_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        # รูปเดียวกับ access_log_hourly แต่ไม่มี trigger — เพิ่มตอน rotate เท่านั้น
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS access_log_hourly_archived (
+                hour    TEXT NOT NULL,
+                room    TEXT NOT NULL,
+                result  TEXT NOT NULL,
+                n       INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (hour, room, result)
+            )
+            """
+        )
+        conn.commit()
+    # database เดิมที่ยังเป็น auto_vacuum = NONE → แปลงครั้งเดียว ให้ rotation คืนพื้นที่ได้
+    ensure_auto_vacuum()
+
+
+# =====================
+# Partition files
+# =====================
+def _month_bounds(month: str):
+    """'YYYY-MM' → (scanned_at เริ่มเดือน, scanned_at เริ่มเดือนถัดไป)"""
+    start = datetime.strptime(month, "%Y-%m")
+    end = (start + timedelta(days=32)).replace(day=1)
+    return start.strftime("%Y-%m-%d %H:%M:%S"), end.strftime("%Y-%m-%d %H:%M:%S")
+
+
+def partition_file(month: str) -> str:
+    """ชื่อไฟล์ของ partition — ValueError ถ้า month ไม่ใช่ 'YYYY-MM'"""
+    if not re.fullmatch(r"\d{4}-(0[1-9]|1[0-2])", month or ""):
+        raise ValueError(f"invalid month: {month}")
+    return f"access_logs_{month.replace('-', '_')}.db.gz"
+
+
+def _gunzip(src: str, dst: str):
+    with gzip.open(src, "rb") as f_in, open(dst, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+
+
+def _gzip(src: str, dst: str):
+    tmp = dst + ".tmp"
+    with open(src, "rb") as f_in, gzip.open(tmp, "wb", compresslevel=6) as f_out:
+        shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+    with open(tmp, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, dst)  # ไฟล์เดิม (ถ้ามี) ถูกแทนทีเดียว ไม่มีช่วงที่ไฟล์ครึ่ง ๆ
+
+
+def _write_partition(month: str, start: str, end: str):
+    """
+    copy log ของเดือนนี้จาก access_logs ลงไฟล์ partition (merge กับไฟล์เดิมถ้ามี)
+    คืน (max_id ที่อยู่ในไฟล์แล้ว, stats ของไฟล์) — max_id = None ถ้าไม่มีอะไรให้ย้าย
+    """
+    os.makedirs(LOG_ARCHIVE_DIR, exist_ok=True)
+    gz_path = os.path.join(LOG_ARCHIVE_DIR, partition_file(month))
+    work = gz_path[: -len(".gz")] + ".work"
+    if os.path.exists(work):
+        os.remove(work)
+    if os.path.exists(gz_path):
+        _gunzip(gz_path, work)
+
+    part = sqlite3.connect(work)
+    try:
+        part.executescript(_PARTITION_SCHEMA)
+    finally:
+        part.close()
+
+    conn = connect()
+    try:
+        conn.execute("ATTACH DATABASE ? AS part", (work,))
+        conn.execute(
+            f"""
+            INSERT OR IGNORE INTO part.access_logs ({_LOG_COLUMNS})
+            SELECT {_LOG_COLUMNS} FROM main.access_logs
+            WHERE scanned_at >= ? AND scanned_at < ?
+            """,
+            (start, end),
+        )
+        conn.commit()
+        # แถวที่ยังไม่อยู่ในไฟล์ต้องเป็น 0 ก่อนจะยอมลบจาก access_logs
+        max_id, missing = conn.execute(
+            """
+            SELECT MAX(m.id),
+                   SUM(NOT EXISTS (SELECT 1 FROM part.access_logs p WHERE p.id = m.id))
+            FROM main.access_logs m
+            WHERE m.scanned_at >= ? AND m.scanned_at < ?
+            """,
+            (start, end),
+        ).fetchone()
+        stats = conn.execute(
+            "SELECT COUNT(*), MIN(scanned_at), MAX(scanned_at) FROM part.access_logs"
+        ).fetchone()
+        conn.commit()
+        conn.execute("DETACH DATABASE part")
+    finally:
+        conn.close()
+
+    if missing:
+        os.remove(work)
+        raise RuntimeError(f"partition {month}: {missing} rows not copied")
+    if max_id is None:
+        os.remove(work)
+        return None, None
+    _gzip(work, gz_path)
+    os.remove(work)
+    return max_id, {
+        "rows": stats[0],
+        "first_at": stats[1],
+        "last_at": stats[2],
+        "bytes": os.path.getsize(gz_path),
+    }
+
+
+def _record_partition(month: str, stats: dict):
+    with get_db_connection() as conn:
+        conn.execute(
+            """
+            INSERT INTO log_archives (month, file, rows, first_at, last_at, bytes)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(month) DO UPDATE SET
+                rows = excluded.rows, first_at = excluded.first_at,
+                last_at = excluded.last_at, bytes = excluded.bytes,
+                archived_at = CURRENT_TIMESTAMP
+            """,
+            (month, partition_file(month), stats["rows"], stats["first_at"],
+             stats["last_at"], stats["bytes"]),
+        )
+        conn.commit()
+
+
+def _throttle(busy):
+    """พักระหว่าง batch — ถ้า scan เข้ามาถี่ (busy() เป็นจริง) รอต่อได้ถึง LOG_PURGE_MAX_WAIT"""
+    time.sleep(LOG_PURGE_PAUSE_MS / 1000.0)
+    waited = 0.0
+    while busy is not None and waited < LOG_PURGE_MAX_WAIT and busy():
+        time.sleep(LOG_PURGE_BUSY_WAIT)
+        waited += LOG_PURGE_BUSY_WAIT
+    if waited:
+        with _progress_lock:
+            _progress["paused_seconds"] = round(_progress["paused_seconds"] + waited, 1)
+
+
+def _drop_from_hot(month: str, start: str, end: str, max_id: int, busy=None) -> int:
+    """
+    เอาแถวที่อยู่ในไฟล์แล้ว (id <= max_id) ออกจาก access_logs ทีละช่วง rowid
+    ไม่เกิน LOG_PURGE_BATCH แถวต่อ transaction — write lock ถูกถือแค่ช่วงสั้น ๆ
+    แล้วปล่อยให้ log writer / door request เข้าก่อนระหว่าง batch (_throttle)
+
+    rollup รายชั่วโมงของแถวใน batch ย้ายไป access_log_hourly_archived ใน transaction
+    เดียวกับการลบ → หยุดกลางทางก็ไม่นับซ้ำ รอบถัดไปทำต่อจากที่ค้างได้เลย
+    log ที่เพิ่งเข้ามาระหว่าง copy มี id ใหม่กว่า max_id เสมอ จึงไม่ถูกลบ
+    """
+    with get_db_connection() as conn:
+        lo, todo = conn.execute(
+            """
+            SELECT MIN(id) - 1, COUNT(*) FROM access_logs
+            WHERE scanned_at >= ? AND scanned_at < ? AND id <= ?
+            """,
+            (start, end, max_id),
+        ).fetchone()
+    with _progress_lock:
+        _progress.update({"month": month, "month_total": todo, "month_deleted": 0})
+    if not todo:
+        return 0
+
+    # "+scanned_at" = ไม่ให้ใช้ idx_logs_scanned_at → SQLite เดินตาม rowid ในช่วง (lo, hi]
+    # แทนการไล่ index ของทั้งเดือนใหม่ทุก batch
+    in_month = "+scanned_at >= ? AND +scanned_at < ?"
+    deleted = 0
+    while lo < max_id:
+        with get_db_connection() as conn:
+            # ขอบบนของ batch = id ลำดับที่ LOG_PURGE_BATCH ของเดือนนี้ถัดจาก lo (เดิน rowid)
+            row = conn.execute(
+                f"""
+                SELECT id FROM access_logs
+                WHERE id > ? AND id <= ? AND {in_month}
+                ORDER BY id LIMIT 1 OFFSET ?
+                """,
+                (lo, max_id, start, end, LOG_PURGE_BATCH - 1),
+            ).fetchone()
+            hi = row[0] if row else max_id
+            window = (lo, hi, start, end)
+            conn.execute(
+                f"""
+                INSERT INTO access_log_hourly_archived (hour, room, result, n)
+                SELECT strftime('%Y-%m-%d %H:00', scanned_at), COALESCE(room, ''), result,
+                       COUNT(*)
+                FROM access_logs
+                WHERE id > ? AND id <= ? AND {in_month}
+                GROUP BY 1, 2, 3
+                ON CONFLICT(hour, room, result) DO UPDATE SET n = n + excluded.n
+                """,
+                window,
+            )
+            n = conn.execute(
+                f"DELETE FROM access_logs WHERE id > ? AND id <= ? AND {in_month}", window
+            ).rowcount
+            conn.commit()
+        lo = hi
+        deleted += n
+        _record_progress(month, n)
+        if lo < max_id:
+            _throttle(busy)
+
+    with get_db_connection() as conn:
+        # trigger ลด n ของ rollup ไปแล้ว — ชั่วโมงที่ไม่เหลือ log ลบทิ้ง
+        conn.execute("DELETE FROM access_log_hourly WHERE n <= 0")
+        conn.commit()
+    return deleted
+
+
+def _release_free_pages(busy=None):
+    """
+    คืนพื้นที่ไฟล์ทีละ LOG_PURGE_VACUUM_PAGES page (เฉพาะ auto_vacuum = INCREMENTAL)
+    แล้วพัก (_throttle) ระหว่างแต่ละก้อน
+    """
+    while True:
+        with get_db_connection() as conn:
+            if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                return
+            if conn.execute("PRAGMA freelist_count").fetchone()[0] == 0:
+                return
+            # incremental_vacuum คืน page ทีละ step — execute() (และ fetchall()) ของ sqlite3
+            # เดินแค่ step แรก = 1 page; executescript() รัน statement จนจบ = N page
+            conn.executescript(f"PRAGMA incremental_vacuum({int(LOG_PURGE_VACUUM_PAGES)});")
+        _throttle(busy)
+
+
+def _retention_cutoff(retention_days: int, now: datetime = None) -> str:
+    """ต้นเดือนของ (now - retention) — เดือนก่อนหน้านั้นจบไปแล้วเกิน retention ทั้งเดือน"""
+    now = now or datetime.now(timezone.utc)
+    edge = now - timedelta(days=retention_days)
+    return edge.strftime("%Y-%m-01 00:00:00")
+
+
+def rotate_log_partitions(retention_days: int = None, now: datetime = None, busy=None):
+    """
+    archive ทุกเดือนที่หมด retention แล้ว → [{"month", "rows", "deleted"}, ...]
+    busy = callable คืน True เมื่อ scan เข้ามาถี่ → หยุดลบชั่วคราว (ดู _throttle)
+    เรียกซ้อนกันไม่ได้ (thread อื่นที่เรียกระหว่างนี้ได้ [] กลับไป) — ดูความคืบหน้าที่ purge_progress()
+    """
+    if retention_days is None:
+        retention_days = LOG_RETENTION_DAYS
+    cutoff = _retention_cutoff(retention_days, now)
+    if not _rotate_lock.acquire(blocking=False):
+        return []
+    rotated = []
+    _start_progress()
+    try:
+        while True:
+            with get_db_connection() as conn:
+                row = conn.execute(
+                    "SELECT MIN(scanned_at) FROM access_logs WHERE scanned_at < ?", (cutoff,)
+                ).fetchone()
+            if not row[0]:
+                break
+            month = row[0][:7]
+            try:
+                start, end = _month_bounds(month)
+                partition_file(month)
+            except ValueError:
+                print(f"[ARCHIVE] skip: unexpected scanned_at format {row[0]!r}")
+                break
+            max_id, stats = _write_partition(month, start, end)
+            if max_id is None:
+                break
+            # บันทึกไฟล์ก่อนเริ่มลบ — ถ้าหยุดกลางทาง partition ยังอยู่ในรายการ
+            _record_partition(month, stats)
+            deleted = _drop_from_hot(month, start, end, max_id, busy)
+            rotated.append({"month": month, "rows": stats["rows"], "deleted": deleted})
+            print(f"[ARCHIVE] {month}: archived {deleted} logs ({stats['bytes']} bytes gz)")
+            if not deleted:
+                break
+        if rotated:
+            _release_free_pages(busy)
+    finally:
+        _finish_progress(rotated)
+        _rotate_lock.release()
+    return rotated
+
+
+# =====================
+# Progress
+# =====================
+_progress_lock = threading.Lock()
+_progress = {
+    "running": False,
+    "started_at": None,
+    "finished_at": None,
+    "month": None,
+    "month_total": 0,
+    "month_deleted": 0,
+    "deleted": 0,
+    "batches": 0,
+    "rows_per_sec": 0.0,
+    "paused_seconds": 0.0,
+    "last_run": None,
+}
+_started_mono = 0.0  # time.monotonic() ตอนเริ่มรอบปัจจุบัน
+
+
+def _start_progress():
+    global _started_mono
+    _started_mono = time.monotonic()
+    with _progress_lock:
+        _progress.update(
+            {
+                "running": True,
+                "started_at": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+                "finished_at": None,
+                "month": None,
+                "month_total": 0,
+                "month_deleted": 0,
+                "deleted": 0,
+                "batches": 0,
+                "rows_per_sec": 0.0,
+                "paused_seconds": 0.0,
+            }
+        )
+
+
+def _record_progress(month: str, n: int):
+    purge_rows_total.inc(n)
+    elapsed = time.monotonic() - _started_mono
+    with _progress_lock:
+        _progress["month_deleted"] += n
+        _progress["deleted"] += n
+        _progress["batches"] += 1
+        _progress["rows_per_sec"] = round(_progress["deleted"] / elapsed, 1) if elapsed else 0.0
+        p = dict(_progress)
+    if p["batches"] % LOG_PURGE_REPORT_EVERY == 0:
+        print(
+            f"[ARCHIVE] {month}: {p['month_deleted']}/{p['month_total']} rows "
+            f"({p['rows_per_sec']} rows/s, paused {p['paused_seconds']}s)"
+        )
+
+
+def _finish_progress(rotated):
+    with _progress_lock:
+        _progress["running"] = False
+        _progress["finished_at"] = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        _progress["last_run"] = rotated
+
+
+def purge_progress() -> dict:
+    """สถานะรอบ rotate ล่าสุด (หรือที่กำลังทำอยู่) — rows_per_sec รวมเวลาที่พักด้วย"""
+    with _progress_lock:
+        return dict(_progress)
+
+
+# =====================
+# Read-only access
+# =====================
+def list_partitions():
+    with get_db_connection() as conn:
+        rows = conn.execute(
+            """
+            SELECT month, file, rows, first_at, last_at, bytes, archived_at
+            FROM log_archives ORDER BY month DESC
+            """
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def _cached_partition(month: str) -> str:
+    """path ของไฟล์ที่แตกแล้วใน cache — แตกใหม่ถ้า .gz ใหม่กว่า (มีการ merge)"""
+    gz_path = os.path.join(LOG_ARCHIVE_DIR, partition_file(month))
+    if not os.path.exists(gz_path):
+        raise FileNotFoundError(month)
+    path = os.path.join(_CACHE_DIR, partition_file(month)[: -len(".gz")])
+    with _cache_lock:
+        if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(gz_path):
+            os.makedirs(_CACHE_DIR, exist_ok=True)
+            _gunzip(gz_path, path + ".tmp")
+            os.replace(path + ".tmp", path)
+    return path
+
+
+@contextmanager
+def open_partition(month: str):
+    """
+    connection แบบ read-only ของ partition เดือน month ('YYYY-MM')
+    ใช้แบบ `with open_partition("2026-01") as conn:` — FileNotFoundError ถ้าไม่มี
+    """
+    path = _cached_partition(month)
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
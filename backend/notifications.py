@@ -21,21 +21,16 @@ from email.mime.text import MIMEText
 from functools import wraps
 import jwt
 
-notif_bp = Blueprint("notifications", __name__)
+from db import get_db_connection
+from writeback import BatchWriter
 
-BASE_DIR = os.path.dirname(__file__)
-DB_PATH = os.path.abspath(os.path.join(BASE_DIR, "database.db"))
+notif_bp = Blueprint("notifications", __name__)
 
 
 # =====================
 # DB Helper
 # =====================
-def get_db_connection():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-
+# get_db_connection() มาจาก db.py — connection pool กลาง (DATABASE_PATH เดียวกับ app.py)
 def init_notification_db():
     """สร้างตาราง notifications"""
     with get_db_connection() as conn:
@@ -55,11 +50,17 @@ def init_notification_db():
             )
             """
         )
+        # รายการของผู้ใช้เรียงตามเวลา + partial index เฉพาะที่ยังไม่อ่าน (badge / ?unread=true)
+        # แทน idx_notif_user / idx_notif_read ที่ SQLite เลือกใช้ได้ทีละตัว
+        cursor.execute("DROP INDEX IF EXISTS idx_notif_user")
+        cursor.execute("DROP INDEX IF EXISTS idx_notif_read")
         cursor.execute(
-            "CREATE INDEX IF NOT EXISTS idx_notif_user  ON notifications(user_email)"
+            "CREATE INDEX IF NOT EXISTS idx_notif_user_time"
+            " ON notifications(user_email, created_at)"
         )
         cursor.execute(
-            "CREATE INDEX IF NOT EXISTS idx_notif_read  ON notifications(is_read)"
+            "CREATE INDEX IF NOT EXISTS idx_notif_unread"
+            " ON notifications(user_email, created_at) WHERE is_read = 0"
         )
         conn.commit()
 
@@ -296,28 +297,51 @@ def notify_booking_result(booking_id: int, status: str, remark: str = ""):
 # =====================
 # Trigger 3: RFID Denied — แจ้ง Admin ทุกคน
 # =====================
-def notify_rfid_denied(uuid: str, room: str):
-    """เรียกจาก app.py เมื่อ RFID scan denied"""
-    try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT email FROM admin_users WHERE is_active = 1")
-            admins = [row["email"] for row in cursor.fetchall()]
+# ไม่ทำใน request thread: notify_rfid_denied แค่ enqueue แล้ว dispatcher
+# (background) จะดึงรายชื่อ admin ครั้งเดียวต่อ batch และ insert ทุกแถว
+# (ทุก scan × ทุก admin) ด้วย executemany ใน transaction เดียว
+def _rfid_denied_message(uuid: str, room: str):
+    title = "⚠️ RFID Scan Denied"
+    message = f"UUID: {uuid} พยายามเข้าห้อง {room or 'ไม่ระบุ'} แต่ยังไม่ได้ลงทะเบียน"
+    return title, message
 
+
+def _flush_rfid_denied(events):
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT email FROM admin_users WHERE is_active = 1")
+        admins = [row["email"] for row in cursor.fetchall()]
         if not admins:
             return
 
-        title = "⚠️ RFID Scan Denied"
-        message = f"UUID: {uuid} พยายามเข้าห้อง {room or 'ไม่ระบุ'} แต่ยังไม่ได้ลงทะเบียน"
-
-        for admin_email in admins:
-            create_notification(
-                user_email=admin_email,
-                notif_type="rfid_denied",
-                title=title,
-                message=message,
+        rows = []
+        for uuid, room in events:
+            title, message = _rfid_denied_message(uuid, room)
+            rows.extend(
+                (admin_email, "rfid_denied", title, message) for admin_email in admins
             )
+        cursor.executemany(
+            """
+            INSERT INTO notifications (user_email, type, title, message)
+            VALUES (?, ?, ?, ?)
+            """,
+            rows,
+        )
+        conn.commit()
 
+
+rfid_denied_dispatcher = BatchWriter(
+    "rfid-denied",
+    _flush_rfid_denied,
+    flush_interval_ms=int(os.getenv("NOTIF_FLUSH_INTERVAL_MS", "50")),
+    max_batch=int(os.getenv("NOTIF_FLUSH_BATCH", "100")),
+)
+
+
+def notify_rfid_denied(uuid: str, room: str):
+    """เรียกจาก app.py เมื่อ RFID scan denied — enqueue แล้ว return ทันที"""
+    try:
+        rfid_denied_dispatcher.put((uuid, room))
     except Exception as e:
         print(f"[NOTIF] notify_rfid_denied error: {e}")
 
@@ -0,0 +1,491 @@
+"""
+state.py
+========
+Runtime state ที่ทุก worker process ต้องเห็นตรงกัน (ไม่ใช่ข้อมูลถาวรใน database.db)
+
+- คิวคำสั่งประตู (door_open / door_close → /api/door/command)
+- heartbeat ของประตู (last_seen, กำลัง long-poll อยู่หรือไม่)
+- UUID ล่าสุดของเครื่อง register (/api/latest_uuid)
+- version ของข้อมูลที่ cache ไว้ใน process (เช่น UUID index) — bump แล้วทุก process reload
+
+เลือก backend ด้วย STATE_BACKEND:
+  memory (default) : เก็บใน process — เร็วสุด ใช้ได้เมื่อรัน worker เดียว
+  sqlite           : เก็บในไฟล์ SQLite แยก (STATE_DB_PATH, WAL) ที่ทุก process บนเครื่องเดียวกันใช้ร่วมกัน
+                     → รัน app.py หลาย worker ได้โดยประตู / dashboard เห็น state เดียวกัน
+ทั้งสองแบบมี method ชุดเดียวกัน app.py เรียกผ่าน runtime_state เท่านั้น
+"""
+
+import itertools
+import os
+import threading
+import time
+
+import db
+from door_channel import IDLE, DoorCommandChannel, ack_seconds, commands_total, delivery_seconds
+
+
+class MemoryStateBackend:
+    """state ใน process เดียว — คิวคำสั่งใช้ DoorCommandChannel (timer wheel)"""
+
+    name = "memory"
+
+    def __init__(self, command_ttl: float = 10.0, max_pending: int = 8):
+        self.commands = DoorCommandChannel(ttl_seconds=command_ttl, max_pending=max_pending)
+        self._lock = threading.Lock()
+        self._last_seen = {}  # room -> epoch seconds
+        self._online = {}  # room -> (online, decided_at) ของ transition ล่าสุด
+        self._latest_uuid = None
+        self._versions = {}
+
+    # ---------- door commands ----------
+    def post_command(self, room, command):
+        return self.commands.post(room, command)
+
+    def take_command(self, room, wait=0.0, ack=None):
+        return self.commands.take(room, wait, ack)
+
+    def ack_command(self, room, seq):
+        return self.commands.ack(room, seq)
+
+    def command_stats(self):
+        return self.commands.stats()
+
+    # ---------- door heartbeat ----------
+    def touch_room(self, room):
+        self._last_seen[room] = time.time()
+
+    def room_last_seen(self, room):
+        return self._last_seen.get(room)
+
+    def rooms_last_seen(self):
+        return dict(self._last_seen)
+
+    def waiting(self, room):
+        return self.commands.waiting(room)
+
+    def record_door_online(self, room, online, at):
+        """บันทึกสถานะ online ที่ประเมิน ณ เวลา at — True ถ้าเป็น transition ใหม่ (ต้อง emit)"""
+        with self._lock:
+            prev = self._online.get(room)
+            if prev is not None and (prev[0] == online or at < prev[1]):
+                return False
+            self._online[room] = (online, at)
+            return True
+
+    # ---------- registration station ----------
+    def get_latest_uuid(self):
+        with self._lock:
+            return self._latest_uuid
+
+    def set_latest_uuid(self, value):
+        with self._lock:
+            self._latest_uuid = value
+
+    # ---------- cache versions ----------
+    def bump_version(self, name):
+        with self._lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+            return self._versions[name]
+
+    def version(self, name):
+        return self._versions.get(name, 0)
+
+    def stats(self):
+        return {"backend": self.name, "rooms_seen": len(self._last_seen)}
+
+
+class SqliteStateBackend:
+    """
+    state ในไฟล์ SQLite ที่หลาย process ใช้ร่วมกัน
+    - คำสั่งถูกส่งแบบ at-most-once ด้วย UPDATE ... RETURNING คำสั่งเดียว (atomic ข้าม process)
+    - long-poll รอด้วย Condition ใน process (post จาก process เดียวกันปลุกทันที)
+      และ poll ตารางทุก poll_interval วินาที (post จาก process อื่น)
+    - request ที่ long-poll อยู่ = 1 แถวใน door_waiters (หลาย request ต่อห้องได้)
+      มี until กำกับ → process ที่ตายกลางคันไม่ทำให้ห้องดู online ค้าง
+    - connection มาจาก ConnectionPool ของไฟล์นี้ (Flask-SocketIO threading mode
+      เปิด thread ใหม่ทุก request → connection ต่อ thread แทบไม่ได้ reuse)
+    - คำสั่งหมดอายุตาม posted_at; sweeper thread ลบแถวที่หมดอายุทุก 1 วินาที
+    """
+
+    name = "sqlite"
+
+    SCHEMA = (
+        """
+        CREATE TABLE IF NOT EXISTS state_kv (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS state_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS room_heartbeats (
+            room TEXT PRIMARY KEY,
+            last_seen REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS door_waiters (
+            room TEXT NOT NULL,
+            waiter TEXT NOT NULL,
+            until REAL NOT NULL,
+            PRIMARY KEY (room, waiter)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS door_online (
+            room TEXT PRIMARY KEY,
+            online INTEGER NOT NULL,
+            decided_at REAL NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS door_command_seq (
+            room TEXT PRIMARY KEY,
+            next_seq INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS door_command_queue (
+            room TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            command TEXT NOT NULL,
+            posted_at REAL NOT NULL,
+            delivered_at REAL,
+            PRIMARY KEY (room, seq)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_door_command_posted ON door_command_queue(posted_at)",
+    )
+
+    def __init__(
+        self,
+        path: str,
+        command_ttl: float = 10.0,
+        max_pending: int = 8,
+        poll_interval: float = 0.1,
+        version_check_interval: float = 1.0,
+    ):
+        self.path = path
+        self.ttl = command_ttl
+        self.max_pending = max(max_pending, 1)
+        self.poll_interval = poll_interval
+        self.version_check_interval = version_check_interval
+        self._pool = db.ConnectionPool(path, db.DB_CONFIG["pool_size"])
+        self._waiter_ids = itertools.count(1)
+        self._cond = threading.Condition()  # ปลุก long-poll ใน process นี้เมื่อ post
+        self._versions = {}  # name -> (version, checked_at) cache ใน process
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stats = {
+            "posted": 0,
+            "delivered": 0,
+            "acked": 0,
+            "expired": 0,
+            "expired_unacked": 0,
+            "dropped": 0,
+            "timeouts": 0,
+        }
+        with self._conn() as conn:
+            for sql in self.SCHEMA:
+                conn.execute(sql)
+
+    def _conn(self):
+        # pool แยกของไฟล์ state (pool ของ database.db ชี้คนละไฟล์) — ใช้ใน with เสมอ
+        return self._pool.acquire()
+
+    def _count(self, status, n=1):
+        if n:
+            self._stats[status] += n
+            commands_total.inc(n, status=status)
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._thread_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._run, name="state-sweeper", daemon=True
+                    )
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(1.0)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[STATE] sweep error: {e}")
+
+    def sweep(self):
+        """ลบคำสั่งที่หมดอายุ (ส่งแล้วแต่ไม่ ack หรือไม่มีประตูมารับ) และ waiter ที่ค้างจาก process ที่ตาย"""
+        now = time.time()
+        cutoff = now - self.ttl
+        with self._conn() as conn:
+            conn.execute("DELETE FROM door_waiters WHERE until < ?", (now,))
+            cur = conn.execute(
+                "DELETE FROM door_command_queue WHERE posted_at < ? AND delivered_at IS NULL",
+                (cutoff,),
+            )
+            self._count("expired", cur.rowcount)
+            cur = conn.execute(
+                "DELETE FROM door_command_queue WHERE posted_at < ?", (cutoff,)
+            )
+            self._count("expired_unacked", cur.rowcount)
+
+    # ---------- door commands ----------
+    def post_command(self, room, command):
+        self._ensure_started()
+        now = time.time()
+        with self._conn() as conn:
+            seq = conn.execute(
+                """
+                INSERT INTO door_command_seq (room, next_seq) VALUES (?, 2)
+                ON CONFLICT(room) DO UPDATE SET next_seq = next_seq + 1
+                RETURNING next_seq - 1
+                """,
+                (room,),
+            ).fetchall()[0][0]
+            cur = conn.execute(
+                "DELETE FROM door_command_queue WHERE room = ? AND seq <= ?",
+                (room, seq - self.max_pending),
+            )
+            self._count("dropped", cur.rowcount)
+            conn.execute(
+                """
+                INSERT INTO door_command_queue (room, seq, command, posted_at)
+                VALUES (?, ?, ?, ?)
+                """,
+                (room, seq, command, now),
+            )
+        self._count("posted")
+        with self._cond:
+            self._cond.notify_all()
+        return seq
+
+    def _claim(self, room):
+        """ส่งคำสั่งเก่าสุดที่ยังไม่ส่งและยังไม่หมดอายุ — atomic ข้าม process"""
+        now = time.time()
+        with self._conn() as conn:
+            rows = conn.execute(
+                """
+                UPDATE door_command_queue SET delivered_at = ?
+                WHERE room = ? AND seq = (
+                    SELECT MIN(seq) FROM door_command_queue
+                    WHERE room = ? AND delivered_at IS NULL AND posted_at >= ?
+                )
+                RETURNING command, seq, posted_at
+                """,
+                (now, room, room, now - self.ttl),
+            ).fetchall()
+        if not rows:
+            return None
+        row = rows[0]
+        delivery_seconds.observe(max(0.0, now - row["posted_at"]))
+        self._count("delivered")
+        return row["command"], row["seq"]
+
+    def _last_seq(self, room):
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT next_seq FROM door_command_seq WHERE room = ?", (room,)
+            ).fetchone()
+        return row["next_seq"] - 1 if row else 0
+
+    def take_command(self, room, wait=0.0, ack=None):
+        self._ensure_started()
+        if ack is not None:
+            self.ack_command(room, ack)
+        claimed = self._claim(room)
+        if claimed is not None or wait <= 0:
+            return claimed or (IDLE, self._last_seq(room))
+
+        deadline = time.time() + wait
+        waiter = f"{os.getpid()}:{next(self._waiter_ids)}"
+        self._set_waiting(room, waiter, deadline)
+        try:
+            while True:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self._count("timeouts")
+                    return IDLE, self._last_seq(room)
+                with self._cond:
+                    self._cond.wait(min(self.poll_interval, remaining))
+                claimed = self._claim(room)
+                if claimed is not None:
+                    return claimed
+        finally:
+            self._set_waiting(room, waiter, None)
+
+    def ack_command(self, room, seq):
+        with self._conn() as conn:
+            rows = conn.execute(
+                """
+                DELETE FROM door_command_queue
+                WHERE room = ? AND seq = ? AND delivered_at IS NOT NULL
+                RETURNING posted_at
+                """,
+                (room, seq),
+            ).fetchall()
+        if not rows:
+            return False
+        ack_seconds.observe(max(0.0, time.time() - rows[0]["posted_at"]))
+        self._count("acked")
+        return True
+
+    def command_stats(self):
+        queued = {}
+        with self._conn() as conn:
+            for r in conn.execute(
+                "SELECT room, seq, command, delivered_at FROM door_command_queue ORDER BY room, seq"
+            ):
+                queued.setdefault(r["room"], []).append(
+                    {
+                        "seq": r["seq"],
+                        "command": r["command"],
+                        "state": "pending" if r["delivered_at"] is None else "delivered",
+                    }
+                )
+            waiting = conn.execute(
+                "SELECT COUNT(*) FROM door_waiters WHERE until > ?", (time.time(),)
+            ).fetchone()[0]
+            rooms = conn.execute("SELECT COUNT(*) FROM door_command_seq").fetchone()[0]
+        return {
+            **self._stats,  # ตัวนับของ process นี้
+            "rooms": rooms,
+            "waiting": waiting,
+            "queued": queued,
+            "ttl_seconds": self.ttl,
+            "max_pending": self.max_pending,
+        }
+
+    # ---------- door heartbeat ----------
+    def touch_room(self, room):
+        with self._conn() as conn:
+            conn.execute(
+                """
+                INSERT INTO room_heartbeats (room, last_seen) VALUES (?, ?)
+                ON CONFLICT(room) DO UPDATE SET last_seen = excluded.last_seen
+                """,
+                (room, time.time()),
+            )
+
+    def _set_waiting(self, room, waiter, until):
+        """เพิ่ม / ลบแถวของ request นี้ (until=None) — waiter อื่นของห้องเดียวกันไม่ถูกแตะ"""
+        with self._conn() as conn:
+            if until is None:
+                conn.execute(
+                    "DELETE FROM door_waiters WHERE room = ? AND waiter = ?", (room, waiter)
+                )
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO door_waiters (room, waiter, until) VALUES (?, ?, ?)",
+                    (room, waiter, until),
+                )
+
+    def room_last_seen(self, room):
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT last_seen FROM room_heartbeats WHERE room = ?", (room,)
+            ).fetchone()
+        return row["last_seen"] if row else None
+
+    def rooms_last_seen(self):
+        with self._conn() as conn:
+            rows = conn.execute("SELECT room, last_seen FROM room_heartbeats").fetchall()
+        return {r["room"]: r["last_seen"] for r in rows}
+
+    def waiting(self, room):
+        """จำนวน request ของห้องนี้ที่กำลัง long-poll อยู่ (ทุก process)"""
+        with self._conn() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM door_waiters WHERE room = ? AND until > ?",
+                (room, time.time()),
+            ).fetchone()[0]
+
+    def record_door_online(self, room, online, at):
+        """
+        บันทึกสถานะ online ที่ประเมิน ณ เวลา at — True ถ้าเป็น transition ใหม่ (ต้อง emit)
+        UPSERT เดียว → ทุก worker รัน sweeper ได้ แต่ transition หนึ่งครั้งมี worker เดียวที่ได้ True
+        ผลที่ประเมินก่อน transition ล่าสุด (worker ที่ช้ากว่า) ถูกทิ้ง ไม่ emit สลับกลับ
+        """
+        with self._conn() as conn:
+            cur = conn.execute(
+                """
+                INSERT INTO door_online (room, online, decided_at) VALUES (?, ?, ?)
+                ON CONFLICT(room) DO UPDATE
+                SET online = excluded.online, decided_at = excluded.decided_at
+                WHERE online != excluded.online AND decided_at <= excluded.decided_at
+                """,
+                (room, 1 if online else 0, at),
+            )
+            return cur.rowcount == 1
+
+    # ---------- registration station ----------
+    def get_latest_uuid(self):
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT value FROM state_kv WHERE key = 'latest_uuid'"
+            ).fetchone()
+        return row["value"] if row else None
+
+    def set_latest_uuid(self, value):
+        with self._conn() as conn:
+            if value is None:
+                conn.execute("DELETE FROM state_kv WHERE key = 'latest_uuid'")
+            else:
+                conn.execute(
+                    "INSERT OR REPLACE INTO state_kv (key, value) VALUES ('latest_uuid', ?)",
+                    (value,),
+                )
+
+    # ---------- cache versions ----------
+    def bump_version(self, name):
+        with self._conn() as conn:
+            version = conn.execute(
+                """
+                INSERT INTO state_versions (name, version) VALUES (?, 1)
+                ON CONFLICT(name) DO UPDATE SET version = version + 1
+                RETURNING version
+                """,
+                (name,),
+            ).fetchall()[0][0]
+        self._versions[name] = (version, time.monotonic())
+        return version
+
+    def version(self, name):
+        """version ล่าสุด — อ่านจากไฟล์ไม่เกินทุก version_check_interval วินาที"""
+        cached = self._versions.get(name)
+        now = time.monotonic()
+        if cached and now - cached[1] < self.version_check_interval:
+            return cached[0]
+        with self._conn() as conn:
+            row = conn.execute(
+                "SELECT version FROM state_versions WHERE name = ?", (name,)
+            ).fetchone()
+        version = row["version"] if row else 0
+        self._versions[name] = (version, now)
+        return version
+
+    def stats(self):
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "pid": os.getpid(),
+            "pool": self._pool.stats(),
+        }
+
+
+def create_state_backend(command_ttl: float = 10.0, max_pending: int = 8):
+    """สร้าง backend ตาม STATE_BACKEND (memory | sqlite)"""
+    kind = os.getenv("STATE_BACKEND", "memory").lower()
+    if kind == "sqlite":
+        path = os.getenv("STATE_DB_PATH") or os.path.splitext(db.DB_PATH)[0] + ".state.db"
+        print(f"[STATE] using shared SQLite state at {path}")
+        return SqliteStateBackend(path, command_ttl=command_ttl, max_pending=max_pending)
+    if kind != "memory":
+        print(f"[STATE] unknown STATE_BACKEND={kind!r} — using memory")
+    return MemoryStateBackend(command_ttl=command_ttl, max_pending=max_pending)
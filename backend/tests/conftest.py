@@ -0,0 +1,119 @@
+"""
+conftest.py
+===========
+hook / fixture กลางของ backend tests
+
+- database ชั่วคราวของทั้ง session — ตั้ง env ตรงนี้ก่อนเทสต์ไฟล์ไหน import โมดูลของ backend
+  (db.py / log_archive.py อ่าน env ตอน import) ทุกไฟล์จึงเห็น database เดียวกัน
+  เทสต์พฤติกรรมใช้ห้อง / UUID / อีเมลของตัวเอง ไม่ชนกับข้อมูล seed ของ test_query_plans.py
+- fixture backend: app + test client + header ของ admin หลัง init_*() ครบทุกตาราง
+- register_card / insert_booking: เตรียมบัตรและ booking ของเทสต์พฤติกรรม
+- สรุป statement ที่ช้าที่สุดท้าย session (test_query_plans.py)
+"""
+
+import datetime
+import os
+import shutil
+import sys
+import tempfile
+from collections import namedtuple
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEST_TMP_DIR = tempfile.mkdtemp(prefix="backend-tests-")
+os.environ["DATABASE_PATH"] = os.path.join(TEST_TMP_DIR, "database.db")
+os.environ["LOG_ARCHIVE_DIR"] = os.path.join(TEST_TMP_DIR, "archive")
+os.environ["LOG_PURGE_PAUSE_MS"] = "0"
+os.environ.setdefault("STATE_BACKEND", "memory")
+sys.path.insert(0, BACKEND_DIR)
+
+# [(ms, ที่มา, sql)] ที่ test_query_plans.py จับเวลาไว้
+query_timings_key = pytest.StashKey[list]()
+QUERY_TIMINGS_SHOWN = 15
+
+
+def pytest_configure(config):
+    config.stash[query_timings_key] = []
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(TEST_TMP_DIR, ignore_errors=True)
+
+
+Backend = namedtuple("Backend", "app client admin")
+
+TZ_THAI = datetime.timezone(datetime.timedelta(hours=7))
+
+
+def register_card(backend, uuid, email, role="student"):
+    """เพิ่มบัตรใน users_reg แล้ว sync index / grant เหมือน add_user — คืน id ของแถว"""
+    with backend.app.get_db_connection() as conn:
+        row_id = conn.execute(
+            """
+            INSERT INTO users_reg (uuid, user_id, first_name, last_name, name, email, role)
+            VALUES (?, ?, 'Test', 'Card', 'Test Card', ?, ?)
+            """,
+            (uuid, f"ID-{uuid}", email, role),
+        ).lastrowid
+        conn.commit()
+    backend.app._on_users_reg_changed(row_id)
+    return row_id
+
+
+def insert_booking(email, room, date=None, start_time="00:00", end_time="24:00",
+                   status="pending"):
+    """เพิ่ม booking ตรงลงตาราง (default = ทั้งวันนี้ตามเวลาไทย, ยังไม่ approve)"""
+    from db import get_db_connection
+
+    date = date or datetime.datetime.now(TZ_THAI).strftime("%Y-%m-%d")
+    with get_db_connection() as conn:
+        booking_id = conn.execute(
+            """
+            INSERT INTO bookings (user_id, user_email, room, date, start_time, end_time, status)
+            VALUES (1, ?, ?, ?, ?, ?, ?)
+            """,
+            (email, room, date, start_time, end_time, status),
+        ).lastrowid
+        conn.commit()
+    return booking_id
+
+
+def auth_header(secret, email, user_id=1, role="admin"):
+    import jwt
+
+    exp = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+    payload = {"user_id": user_id, "email": email, "role": role, "exp": exp}
+    return {"Authorization": "Bearer " + jwt.encode(payload, secret, algorithm="HS256")}
+
+
+@pytest.fixture(scope="session")
+def backend():
+    import app
+    import auth
+    import booking
+    import log_archive
+    import notifications
+    import whitelist
+
+    app.init_db()
+    auth.init_auth_db()
+    booking.init_booking_db()
+    notifications.init_notification_db()
+    whitelist.init_whitelist_db()
+    app.init_door_grants_db()
+    log_archive.init_log_archive_db()
+    app.load_user_index()
+    yield Backend(
+        app, app.app.test_client(), auth_header(app.app.config["SECRET_KEY"], "tester@kku.ac.th")
+    )
+    app.access_log_writer.flush()
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    rows = config.stash.get(query_timings_key, [])
+    if not rows:
+        return
+    terminalreporter.write_sep("=", f"slowest {QUERY_TIMINGS_SHOWN} queries")
+    for ms, origin, sql in sorted(rows, key=lambda r: r[0], reverse=True)[:QUERY_TIMINGS_SHOWN]:
+        terminalreporter.write_line(f"{ms:9.2f} ms  {origin:<45} {' '.join(sql.split())[:70]}")
@@ -0,0 +1,133 @@
+"""
+test_access_grants.py
+=====================
+พฤติกรรมของ access_grants (สิทธิ์เข้าห้องจาก booking ที่ approved)
+
+- approve / admin-create สร้าง grant ตามช่วงเวลาของ booking (เวลาไทย) — reject / ลบ ไม่เหลือ grant
+- สแกนที่ประตูผ่านเฉพาะห้องและช่วงเวลาที่จองไว้
+- บัตรที่ลงทะเบียนหลัง approve / เปลี่ยน email ถูกผูกกับ grant ใหม่ (sync_grant_uuids)
+- rebuild_access_grants สร้างตารางใหม่จาก bookings ได้ตรงกับของเดิม
+"""
+
+from datetime import datetime
+
+import pytest
+
+import booking
+import db
+from conftest import TZ_THAI, insert_booking, register_card
+
+FUTURE = "2030-01-15"
+
+
+def _epoch(hhmm, date=FUTURE):
+    return datetime.strptime(f"{date} {hhmm}", "%Y-%m-%d %H:%M").replace(tzinfo=TZ_THAI).timestamp()
+
+
+def _grant(booking_id):
+    with db.get_db_connection() as conn:
+        row = conn.execute(
+            "SELECT uuid, room, starts_at, ends_at FROM access_grants WHERE booking_id = ?",
+            (booking_id,),
+        ).fetchone()
+    return dict(row) if row else None
+
+
+def _grants_of_this_file():
+    with db.get_db_connection() as conn:
+        return [tuple(r) for r in conn.execute(
+            "SELECT * FROM access_grants WHERE room LIKE 'T-GRANT-%' ORDER BY booking_id"
+        )]
+
+
+def _approve(backend, booking_id):
+    resp = backend.client.post(f"/api/bookings/{booking_id}/approve", json={},
+                               headers=backend.admin)
+    assert resp.status_code == 200
+
+
+@pytest.fixture
+def no_debounce(backend, monkeypatch):
+    monkeypatch.setattr(backend.app, "SCAN_DEBOUNCE_SECONDS", 0)
+
+
+def test_approve_creates_grant_for_booked_window(backend):
+    register_card(backend, "GRANT-WINDOW", "grant-window@kkumail.com")
+    booking_id = insert_booking("grant-window@kkumail.com", "T-GRANT-A", FUTURE, "10:00", "11:30")
+    assert _grant(booking_id) is None  # pending ยังไม่มีสิทธิ์
+
+    _approve(backend, booking_id)
+    grant = _grant(booking_id)
+    assert grant == {"uuid": "GRANT-WINDOW", "room": "T-GRANT-A",
+                     "starts_at": _epoch("10:00"), "ends_at": _epoch("11:30")}
+
+    check = booking.has_access_grant
+    assert check("GRANT-WINDOW", "T-GRANT-A", _epoch("10:00"))
+    assert check("GRANT-WINDOW", "T-GRANT-A", _epoch("11:29"))
+    assert not check("GRANT-WINDOW", "T-GRANT-A", _epoch("11:30"))  # ends_at ไม่รวม
+    assert not check("GRANT-WINDOW", "T-GRANT-A", _epoch("09:59"))
+    assert not check("GRANT-WINDOW", "T-GRANT-B", _epoch("10:30"))
+    assert not check("GRANT-OTHER", "T-GRANT-A", _epoch("10:30"))
+
+
+def test_door_scan_follows_grants(backend, no_debounce):
+    register_card(backend, "GRANT-SCAN", "grant-scan@kkumail.com")
+    room = "T-GRANT-SCAN"
+
+    def scan():
+        return backend.client.post(
+            "/api/send_uuid", json={"uuid": "GRANT-SCAN", "room": room, "source": "door"}
+        ).status_code
+
+    assert scan() == 403
+    booking_id = insert_booking("grant-scan@kkumail.com", room)  # ทั้งวันนี้
+    _approve(backend, booking_id)
+    assert scan() == 200
+    resp = backend.client.delete(f"/api/bookings/{booking_id}/delete", headers=backend.admin)
+    assert resp.status_code == 200
+    assert _grant(booking_id) is None
+    assert scan() == 403
+
+
+def test_reject_leaves_no_grant(backend):
+    booking_id = insert_booking("grant-reject@kkumail.com", "T-GRANT-R", FUTURE, "08:00", "09:00")
+    resp = backend.client.post(f"/api/bookings/{booking_id}/reject", json={"remark": "full"},
+                               headers=backend.admin)
+    assert resp.status_code == 200
+    assert _grant(booking_id) is None
+
+
+def test_admin_create_grants_immediately(backend):
+    resp = backend.client.post("/api/bookings/admin-create", headers=backend.admin, json={
+        "booking": {"room": "T-GRANT-ADMIN", "date": FUTURE,
+                    "start_time": "13:00", "end_time": "24:00"},
+    })
+    grant = _grant(resp.get_json()["booking_id"])
+    assert (grant["starts_at"], grant["ends_at"]) == (_epoch("13:00"), _epoch("00:00", "2030-01-16"))
+
+
+def test_card_registered_after_approval_is_bound(backend):
+    email = "grant-late@kkumail.com"
+    booking_id = insert_booking(email, "T-GRANT-LATE", FUTURE, "10:00", "11:00")
+    _approve(backend, booking_id)
+    assert _grant(booking_id)["uuid"] is None  # ยังไม่มีบัตร
+
+    row_id = register_card(backend, "GRANT-LATE", email)
+    assert _grant(booking_id)["uuid"] == "GRANT-LATE"
+
+    # เปลี่ยน email ของบัตร → ไม่ใช่เจ้าของ booking แล้ว
+    with db.get_db_connection() as conn:
+        conn.execute("UPDATE users_reg SET email = 'moved@kkumail.com' WHERE id = ?", (row_id,))
+        conn.commit()
+    backend.app._on_users_reg_changed(row_id)
+    assert _grant(booking_id)["uuid"] is None
+
+
+def test_rebuild_matches_incremental(backend):
+    register_card(backend, "GRANT-REBUILD", "grant-rebuild@kkumail.com")
+    booking_id = insert_booking("grant-rebuild@kkumail.com", "T-GRANT-RB", FUTURE, "15:00", "16:00")
+    _approve(backend, booking_id)
+    before = _grants_of_this_file()
+    booking.rebuild_access_grants()
+    assert _grants_of_this_file() == before
+    assert _grant(booking_id)["uuid"] == "GRANT-REBUILD"
@@ -0,0 +1,89 @@
+"""
+test_access_logs.py
+===================
+พฤติกรรมของ /api/access-logs (keyset pagination + total จาก access_log_counts)
+
+แต่ละเทสต์ใส่ log ของห้องตัวเองแล้วกรอง ?room= → ไม่ชนกับข้อมูลของไฟล์อื่น
+"""
+
+import itertools
+
+import pytest
+
+_rooms = itertools.count()
+
+
+@pytest.fixture
+def room_logs(backend):
+    """ห้องใหม่ + log 25 แถว — scanned_at ซ้ำกันทีละ 3 แถว (ทดสอบ tie-break ด้วย id)"""
+    room = f"T-LOGS-{next(_rooms)}"
+    rows = [
+        (f"UID{i:04d}", f"S{i}", f"User {i}", f"u{i}@kkumail.com", "student", room,
+         "granted" if i % 4 else "denied", "rfid", f"2024-05-01 08:{i // 3:02d}:00")
+        for i in range(25)
+    ]
+    with backend.app.get_db_connection() as conn:
+        conn.executemany(backend.app._ACCESS_LOG_INSERT_SQL, rows)
+        conn.commit()
+    return room
+
+
+def _page(backend, **params):
+    resp = backend.client.get("/api/access-logs", query_string=params, headers=backend.admin)
+    assert resp.status_code == 200
+    return resp.get_json()
+
+
+def test_keyset_pages_cover_every_row_once(backend, room_logs):
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {"room": room_logs, "limit": 10}
+        if cursor:
+            params["cursor"] = cursor
+        body = _page(backend, **params)
+        seen += [(log["scanned_at"], log["id"]) for log in body["logs"]]
+        cursor = body["next_cursor"]
+        pages += 1
+        if not cursor:
+            break
+    assert pages == 3
+    assert len(seen) == 25 == len(set(seen))
+    assert seen == sorted(seen, reverse=True)
+
+
+def test_next_page_stable_when_new_logs_arrive(backend, room_logs):
+    first = _page(backend, room=room_logs, limit=10)
+    with backend.app.get_db_connection() as conn:
+        conn.execute(
+            backend.app._ACCESS_LOG_INSERT_SQL,
+            ("NEW", "S-new", "New", "new@kkumail.com", "student", room_logs,
+             "granted", "rfid", "2024-05-02 00:00:00"),
+        )
+        conn.commit()
+    second = _page(backend, room=room_logs, limit=10, cursor=first["next_cursor"])
+    assert second["logs"][0]["id"] == first["logs"][-1]["id"] - 1
+    assert {log["id"] for log in first["logs"]}.isdisjoint(log["id"] for log in second["logs"])
+
+
+def test_total_from_counters(backend, room_logs):
+    assert _page(backend, room=room_logs, limit=5)["total"] == 25
+    assert _page(backend, room=room_logs, result="denied", limit=5)["total"] == 7
+    # มี from/to → auto ไม่นับ (null), exact นับตาม filter
+    ranged = {"room": room_logs, "from": "2024-05-01 08:05:00", "limit": 5}
+    assert _page(backend, **ranged)["total"] is None
+    assert _page(backend, total="exact", **ranged)["total"] == 10
+
+
+@pytest.mark.parametrize("limit", ["0", "-1"])
+def test_non_positive_limit(backend, room_logs, limit):
+    body = _page(backend, room=room_logs, limit=limit)
+    assert len(body["logs"]) == 1
+    assert body["next_cursor"]
+
+
+def test_invalid_cursor(backend, room_logs):
+    resp = backend.client.get(
+        "/api/access-logs", query_string={"room": room_logs, "cursor": "garbage"},
+        headers=backend.admin,
+    )
+    assert resp.status_code == 400
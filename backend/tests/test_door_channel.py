@@ -0,0 +1,125 @@
+"""
+test_door_channel.py
+====================
+พฤติกรรมของ DoorCommandChannel (คิวคำสั่งประตูของ MemoryStateBackend)
+
+- seq ต่อห้อง, ส่งแบบ at-most-once, ack (แยก / piggyback มากับ take)
+- หมดอายุตาม timer wheel — tick_seconds ตั้งยาวมากให้ sweeper thread ไม่หมุนเอง
+  แล้วเรียก advance() ในเทสต์แทน (ไม่ต้อง sleep รอ ttl); idle_evict_seconds ยาวกว่า ttl
+  ห้องจึงไม่ถูกลบ (seq ไม่เริ่มใหม่) ระหว่างเทสต์
+- max_pending ทิ้งคำสั่งเก่าสุด, long-poll ถูกปลุกทันทีที่มี post
+"""
+
+import threading
+import time
+
+import pytest
+
+from door_channel import IDLE, DoorCommandChannel
+
+TTL_TICKS = 3
+
+
+@pytest.fixture
+def channel():
+    return DoorCommandChannel(
+        ttl_seconds=TTL_TICKS * 3600.0,
+        tick_seconds=3600.0,
+        max_pending=4,
+        idle_evict_seconds=100 * 3600.0,
+    )
+
+
+def test_seq_per_room(channel):
+    assert [channel.post("A", "open") for _ in range(3)] == [1, 2, 3]
+    assert channel.post("B", "close") == 1
+    assert channel.take("B") == ("close", 1)
+    assert channel.take("A") == ("open", 1)
+
+
+def test_delivered_at_most_once(channel):
+    channel.post("A", "open")
+    channel.post("A", "close")
+    assert channel.take("A") == ("open", 1)
+    assert channel.take("A") == ("close", 2)
+    # ส่งครบแล้ว → idle พร้อม seq ล่าสุดที่ออกไป (ยังรอ ack อยู่ก็ไม่ส่งซ้ำ)
+    assert channel.take("A") == (IDLE, 2)
+    assert channel.take("empty") == (IDLE, 0)
+
+
+def test_ack(channel):
+    seq = channel.post("A", "open")
+    assert channel.ack("A", seq) is False  # ยังไม่ได้ส่ง
+    channel.take("A")
+    assert channel.ack("A", seq) is True
+    assert channel.ack("A", seq) is False
+    assert channel.stats()["queued"] == {}
+
+
+def test_ack_piggybacked_on_take(channel):
+    first = channel.post("A", "open")
+    channel.post("A", "close")
+    channel.take("A")
+    assert channel.take("A", ack=first) == ("close", 2)
+    assert [c["seq"] for c in channel.stats()["queued"]["A"]] == [2]
+
+
+def test_expiry(channel):
+    channel.post("A", "open")
+    channel.post("A", "close")
+    channel.take("A")  # open ส่งแล้วแต่ไม่ ack, close ยังไม่ส่ง
+    for _ in range(TTL_TICKS - 1):
+        channel.advance()
+    assert len(channel.stats()["queued"]["A"]) == 2
+    channel.advance()
+    stats = channel.stats()
+    assert stats["queued"] == {}
+    assert (stats["expired"], stats["expired_unacked"]) == (1, 1)
+    assert channel.take("A") == (IDLE, 2)
+    assert channel.ack("A", 1) is False
+
+
+def test_acked_command_leaves_the_wheel(channel):
+    seq = channel.post("A", "open")
+    channel.take("A", ack=None)
+    channel.ack("A", seq)
+    for _ in range(TTL_TICKS):
+        channel.advance()
+    assert channel.stats()["expired_unacked"] == 0
+
+
+def test_max_pending_drops_oldest(channel):
+    for i in range(6):
+        channel.post("A", f"cmd{i}")
+    stats = channel.stats()
+    assert stats["dropped"] == 2
+    assert [c["seq"] for c in stats["queued"]["A"]] == [3, 4, 5, 6]
+    assert channel.take("A") == ("cmd2", 3)
+
+
+def test_long_poll_wakes_on_post(channel):
+    result = {}
+
+    def poll():
+        started = time.monotonic()
+        result["cmd"] = channel.take("A", wait=5.0)
+        result["elapsed"] = time.monotonic() - started
+
+    t = threading.Thread(target=poll)
+    t.start()
+    deadline = time.monotonic() + 2.0
+    while channel.waiting("A") == 0 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert channel.waiting("A") == 1
+    channel.post("A", "open")
+    t.join(2.0)
+    assert result["cmd"] == ("open", 1)
+    assert result["elapsed"] < 1.0
+    assert channel.waiting("A") == 0
+
+
+def test_long_poll_timeout(channel):
+    started = time.monotonic()
+    assert channel.take("A", wait=0.05) == (IDLE, 0)
+    assert time.monotonic() - started >= 0.05
+    assert channel.stats()["timeouts"] == 1
@@ -0,0 +1,145 @@
+"""
+test_door_grants.py
+===================
+พฤติกรรมของ /api/door/grants (offline grant bundle ต่อห้องของ ESP32_Door)
+
+- ส่งเฉพาะ grant ของห้องที่ทับช่วง [ต้นชั่วโมงนี้, + hours) และผูกบัตรแล้ว — เรียงตาม hash
+- ETag ตาม version ของห้อง: 304 จนกว่า access_grants ของห้องนั้นเปลี่ยน
+- เกิน GRANT_BUNDLE_MAX_ENTRIES → เก็บที่เริ่มเร็วสุด, truncated + window_end เลื่อนมา
+  ที่ starts_at ของตัวแรกที่ถูกตัด (binary: bit 31 ของ count)
+
+เทสต์ใส่แถวลง access_grants ตรง ๆ (booking_id ไม่ชนกับ booking จริง) ห้องละเทสต์
+"""
+
+import itertools
+import struct
+import time
+import zlib
+
+import pytest
+
+import db
+import door_grants
+from whitelist import uuid_hash
+
+HOUR = 3600
+_booking_ids = itertools.count(10_000_000)
+
+
+@pytest.fixture
+def window_start():
+    now = int(time.time())
+    start = now - now % HOUR
+    if now - start > HOUR - 5:  # ใกล้ขึ้นชั่วโมงใหม่ — รอให้ทั้งเทสต์อยู่ในชั่วโมงเดียว
+        time.sleep(HOUR - (now - start))
+        return start + HOUR
+    return start
+
+
+def _add_grants(room, grants):
+    """grants = [(uuid, starts_at, ends_at), ...]"""
+    with db.get_db_connection() as conn:
+        conn.executemany(
+            """
+            INSERT INTO access_grants (booking_id, uuid, user_email, room, starts_at, ends_at)
+            VALUES (?, ?, 'door-grants@kkumail.com', ?, ?, ?)
+            """,
+            [(next(_booking_ids), u, room, s, e) for u, s, e in grants],
+        )
+        conn.commit()
+
+
+def _get(backend, headers=None, **params):
+    return backend.client.get("/api/door/grants", query_string=params, headers=headers or {})
+
+
+def _parse_bin(data):
+    magic, version, server_time, window_end, count, crc = struct.unpack_from("<4sIIIII", data)
+    body = data[24:]
+    assert magic == b"GRB1"
+    assert zlib.crc32(body) == crc
+    n = count & ~door_grants.GRANT_BIN_TRUNCATED
+    entries = [struct.unpack_from("<8sII", body, i * 16) for i in range(n)]
+    assert len(body) == n * 16
+    return version, window_end, bool(count & door_grants.GRANT_BIN_TRUNCATED), entries
+
+
+def test_bundle_covers_window(backend, window_start):
+    room = "T-DOOR-WINDOW"
+    end = window_start + 2 * HOUR
+    _add_grants(room, [
+        ("DG-NOW", window_start - HOUR, window_start + 600),  # กำลังใช้อยู่
+        ("DG-LATER", window_start + HOUR, window_start + 90 * 60),
+        ("DG-TOMORROW", end, end + HOUR),  # เริ่มหลัง window
+        ("DG-PAST", window_start - 2 * HOUR, window_start),  # จบแล้ว
+        (None, window_start, window_start + HOUR),  # ยังไม่ผูกบัตร
+    ])
+    _add_grants("T-DOOR-OTHER", [("DG-OTHER", window_start, window_start + HOUR)])
+
+    body = _get(backend, room=room, hours=2).get_json()
+    assert (body["window_start"], body["window_end"]) == (window_start, end)
+    assert (body["count"], body["truncated"]) == (2, False)
+    expected = sorted([
+        (uuid_hash("DG-NOW"), window_start - HOUR, window_start + 600),
+        (uuid_hash("DG-LATER"), window_start + HOUR, window_start + 90 * 60),
+    ])
+    assert body["grants"] == [[h.hex(), s, e] for h, s, e in expected]
+
+    version, window_end, truncated, entries = _parse_bin(
+        _get(backend, room=room, hours=2, format="bin").data
+    )
+    assert (version, window_end, truncated) == (body["version"], end, False)
+    assert entries == expected
+
+
+def test_hours_clamped_and_room_required(backend, window_start):
+    assert _get(backend).status_code == 400
+    assert _get(backend, room="T-DOOR-HOURS", hours=0).get_json()["window_end"] == window_start + HOUR
+    body = _get(backend, room="T-DOOR-HOURS", hours=1000).get_json()
+    assert body["window_end"] == window_start + door_grants.GRANT_BUNDLE_MAX_HOURS * HOUR
+
+
+def test_etag_follows_room_version(backend, window_start):
+    room = "T-DOOR-ETAG"
+    _add_grants(room, [("DG-ETAG-1", window_start, window_start + HOUR)])
+    first = _get(backend, room=room)
+    etag = first.headers["ETag"]
+    assert _get(backend, {"If-None-Match": etag}, room=room).status_code == 304
+
+    _add_grants("T-DOOR-ETAG-OTHER", [("DG-ETAG-X", window_start, window_start + HOUR)])
+    assert _get(backend, {"If-None-Match": etag}, room=room).status_code == 304
+
+    _add_grants(room, [("DG-ETAG-2", window_start, window_start + HOUR)])
+    changed = _get(backend, {"If-None-Match": etag}, room=room)
+    assert changed.status_code == 200
+    assert changed.get_json()["count"] == 2
+    assert changed.get_json()["version"] > first.get_json()["version"]
+
+    # ETag ของ JSON ใช้กับ binary ไม่ได้
+    bin_resp = _get(backend, {"If-None-Match": changed.headers["ETag"]}, room=room, format="bin")
+    assert bin_resp.status_code == 200
+
+
+def test_truncation_keeps_soonest(backend, window_start, monkeypatch):
+    room = "T-DOOR-TRUNC"
+    monkeypatch.setattr(door_grants, "GRANT_BUNDLE_MAX_ENTRIES", 3)
+    starts = [window_start + m * 60 for m in (50, 10, 40, 0, 20)]
+    _add_grants(room, [(f"DG-TRUNC-{i}", s, s + HOUR) for i, s in enumerate(starts)])
+
+    body = _get(backend, room=room).get_json()
+    assert (body["count"], body["truncated"]) == (3, True)
+    assert sorted(s for _, s, _ in body["grants"]) == sorted(starts)[:3]
+    assert body["window_end"] == sorted(starts)[3]  # booking แรกที่ไม่ได้ส่ง
+
+    _, window_end, truncated, entries = _parse_bin(_get(backend, room=room, format="bin").data)
+    assert (window_end, truncated, len(entries)) == (sorted(starts)[3], True, 3)
+    assert entries == sorted(entries)
+
+
+def test_truncated_window_end_not_before_window_start(backend, window_start, monkeypatch):
+    room = "T-DOOR-TRUNC-NOW"
+    monkeypatch.setattr(door_grants, "GRANT_BUNDLE_MAX_ENTRIES", 1)
+    _add_grants(room, [(f"DG-TN-{i}", window_start - HOUR, window_start + HOUR) for i in range(2)])
+    body = _get(backend, room=room).get_json()
+    assert (body["count"], body["truncated"]) == (1, True)
+    assert body["window_end"] == window_start
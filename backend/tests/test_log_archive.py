@@ -0,0 +1,198 @@
+"""
+test_log_archive.py
+===================
+พฤติกรรมของ log_archive.py (archive รายเดือน + เอาออกจาก access_logs ทีละ batch)
+
+- เดือนที่หมด retention ถูกย้ายลงไฟล์ partition ครบทุกแถว แล้วเอาออกจาก access_logs
+  rollup รายชั่วโมงย้ายไป access_log_hourly_archived, log ที่มาช้า merge เข้าไฟล์เดิม
+- อ่านย้อนหลังผ่าน /api/access-logs/archives/<month> (cursor, limit)
+- ลบจาก access_logs ทีละ LOG_PURGE_BATCH แถว พักเมื่อ busy() และรายงาน purge_progress()
+- _release_free_pages คืนพื้นที่ทีละ LOG_PURGE_VACUUM_PAGES page ต่อรอบ (ไม่ใช่ทีละ page)
+
+rotate_log_partitions() ย้ายทุกเดือนที่เก่ากว่า cutoff ของ database ทั้งก้อน
+→ แต่ละเทสต์ใช้เดือนของตัวเอง (ก่อน 2022 — ไม่ชนกับ log ของไฟล์อื่น) และห้องของตัวเอง
+"""
+
+import sqlite3
+from datetime import datetime, timezone
+
+import db
+import log_archive
+
+
+def _insert_logs(backend, room, times):
+    rows = [
+        (f"UID-{room}-{i}", f"S{i}", f"User {i}", f"u{i}@kkumail.com", "student", room,
+         "granted" if i % 3 else "denied", "rfid", at)
+        for i, at in enumerate(times)
+    ]
+    with db.get_db_connection() as conn:
+        conn.executemany(backend.app._ACCESS_LOG_INSERT_SQL, rows)
+        conn.commit()
+
+
+def _hot_count(room):
+    with db.get_db_connection() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM access_logs WHERE room = ?", (room,)
+        ).fetchone()[0]
+
+
+def _partition(month):
+    return {p["month"]: p for p in log_archive.list_partitions()}.get(month)
+
+
+def test_rotation_moves_expired_months(backend):
+    room = "T-ARCHIVE-ROTATE"
+    nov = [f"2020-11-{d:02d} 10:{m:02d}:00" for d in range(1, 11) for m in (0, 30)]
+    dec = [f"2020-12-{d:02d} 09:00:00" for d in range(1, 6)]
+    feb = ["2021-02-10 12:00:00"]
+    _insert_logs(backend, room, nov + dec + feb)
+
+    now = datetime(2021, 3, 15, tzinfo=timezone.utc)
+    rotated = log_archive.rotate_log_partitions(retention_days=30, now=now)
+    months = {r["month"]: r for r in rotated}
+    assert months["2020-11"]["deleted"] == 20
+    assert months["2020-12"]["deleted"] == 5
+    assert "2021-02" not in months  # ยังไม่จบเกิน 30 วัน
+    assert _hot_count(room) == 1
+    assert _partition("2020-11")["rows"] == 20
+
+    with log_archive.open_partition("2020-11") as conn:
+        assert conn.execute(
+            "SELECT COUNT(*) FROM access_logs WHERE room = ?", (room,)
+        ).fetchone()[0] == 20
+    with db.get_db_connection() as conn:
+        archived = conn.execute(
+            "SELECT SUM(n) FROM access_log_hourly_archived WHERE room = ?", (room,)
+        ).fetchone()[0]
+        hot = conn.execute(
+            "SELECT SUM(n) FROM access_log_hourly WHERE room = ?", (room,)
+        ).fetchone()[0]
+    assert (archived, hot) == (25, 1)
+
+
+def test_late_logs_merge_into_existing_partition(backend):
+    room = "T-ARCHIVE-LATE"
+    now = datetime(2019, 8, 15, tzinfo=timezone.utc)
+    _insert_logs(backend, room, ["2019-06-03 08:00:00", "2019-06-04 08:00:00"])
+    log_archive.rotate_log_partitions(retention_days=30, now=now)
+    assert _partition("2019-06")["rows"] == 2
+
+    # offline batch upload ของเดือนที่ archive ไปแล้ว
+    _insert_logs(backend, room, ["2019-06-05 08:00:00"])
+    rotated = log_archive.rotate_log_partitions(retention_days=30, now=now)
+    assert rotated == [{"month": "2019-06", "rows": 3, "deleted": 1}]
+    assert _partition("2019-06")["rows"] == 3
+    assert _hot_count(room) == 0
+
+
+def test_archive_route_pages(backend):
+    room = "T-ARCHIVE-ROUTE"
+    _insert_logs(backend, room, [f"2018-03-{d:02d} 07:00:00" for d in range(1, 13)])
+    log_archive.rotate_log_partitions(
+        retention_days=30, now=datetime(2018, 5, 15, tzinfo=timezone.utc)
+    )
+
+    url = "/api/access-logs/archives/2018-03"
+    seen, cursor = [], None
+    while True:
+        params = {"room": room, "limit": 5, **({"cursor": cursor} if cursor else {})}
+        body = backend.client.get(url, query_string=params, headers=backend.admin).get_json()
+        seen += [log["id"] for log in body["logs"]]
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+    assert len(seen) == 12 == len(set(seen))
+
+    for limit in ("0", "-5"):
+        resp = backend.client.get(
+            url, query_string={"room": room, "limit": limit}, headers=backend.admin
+        )
+        assert resp.status_code == 200
+        assert len(resp.get_json()["logs"]) == 1
+
+    assert backend.client.get(
+        "/api/access-logs/archives/2018-04", headers=backend.admin
+    ).status_code == 404
+    listed = backend.client.get("/api/access-logs/archives", headers=backend.admin).get_json()
+    assert "2018-03" in [p["month"] for p in listed["archives"]]
+
+
+def test_drop_in_batches_with_busy_pauses(backend, monkeypatch):
+    room = "T-ARCHIVE-BATCH"
+    _insert_logs(backend, room, [f"2017-01-{d:02d} 06:00:00" for d in range(1, 11)])
+    monkeypatch.setattr(log_archive, "LOG_PURGE_BATCH", 4)
+    monkeypatch.setattr(log_archive, "LOG_PURGE_BUSY_WAIT", 0.05)
+    calls = []
+
+    def busy():
+        calls.append(1)
+        return len(calls) <= 2  # scan เข้ามาถี่ 2 ครั้งแรกที่ถาม
+
+    rotated = log_archive.rotate_log_partitions(
+        retention_days=30, now=datetime(2017, 3, 15, tzinfo=timezone.utc), busy=busy
+    )
+    assert rotated == [{"month": "2017-01", "rows": 10, "deleted": 10}]
+    progress = log_archive.purge_progress()
+    assert progress["running"] is False
+    assert (progress["deleted"], progress["batches"]) == (10, 3)  # 4 + 4 + 2
+    assert progress["paused_seconds"] > 0
+    assert len(calls) >= 3
+    assert progress["last_run"] == rotated
+
+    status = backend.client.get("/api/access-logs/purge-status", headers=backend.admin)
+    assert status.get_json()["progress"]["batches"] == 3
+
+
+def test_rotation_does_not_run_twice_at_once(backend):
+    assert log_archive._rotate_lock.acquire(blocking=False)
+    try:
+        assert log_archive.rotate_log_partitions(retention_days=30) == []
+    finally:
+        log_archive._rotate_lock.release()
+
+
+def test_ensure_auto_vacuum_converts_existing_file(tmp_path, monkeypatch):
+    path = str(tmp_path / "legacy.db")
+    legacy = sqlite3.connect(path)
+    legacy.execute("CREATE TABLE t (x)")
+    legacy.commit()
+    assert legacy.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    legacy.close()
+
+    monkeypatch.setattr(db, "DB_PATH", path)
+    db.ensure_auto_vacuum()
+    conn = db.connect(path)
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    conn.close()
+
+
+def test_release_free_pages_in_chunks(tmp_path, monkeypatch):
+    path = str(tmp_path / "vacuum.db")
+    conn = db.connect(path)  # auto_vacuum = INCREMENTAL ตั้งก่อนสร้างตาราง
+    assert conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    conn.execute("CREATE TABLE filler (data BLOB)")
+    conn.executemany("INSERT INTO filler VALUES (?)", [(b"x" * 4000,) for _ in range(600)])
+    conn.commit()
+    conn.execute("DELETE FROM filler")
+    conn.commit()
+    free = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    assert free >= 500
+
+    chunk = 100
+    seen = []
+    monkeypatch.setattr(log_archive, "LOG_PURGE_VACUUM_PAGES", chunk)
+    monkeypatch.setattr(log_archive, "get_db_connection", lambda: db.connect(path))
+    monkeypatch.setattr(
+        log_archive,
+        "_throttle",
+        lambda busy: seen.append(conn.execute("PRAGMA freelist_count").fetchone()[0]),
+    )
+    log_archive._release_free_pages()
+
+    assert seen[-1] == 0
+    assert len(seen) == -(-free // chunk)
+    drops = [a - b for a, b in zip([free] + seen, seen)]
+    assert all(d == chunk for d in drops[:-1])
+    conn.close()
@@ -0,0 +1,123 @@
+"""
+test_log_export.py
+==================
+พฤติกรรมของ /api/access-logs/export (stream CSV / NDJSON ทีละ chunk)
+
+- ได้ทุกแถวที่ตรง filter ครบครั้งเดียว เรียงใหม่ → เก่า ข้ามขอบ chunk ได้ถูก
+- CSV มี BOM + header, NDJSON หนึ่งแถวต่อบรรทัด (ชื่อภาษาไทยไม่ถูก escape)
+- ?gzip=1 → ไฟล์ .gz, Accept-Encoding: gzip → Content-Encoding: gzip
+- ?archive=YYYY-MM อ่านจาก partition, เดือนที่ไม่มี → 404, format ผิด → 400
+"""
+
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import log_archive
+
+ROOM = "T-EXPORT"
+ROWS = 7
+
+
+@pytest.fixture(scope="module")
+def export_logs(backend):
+    rows = [
+        (f"EXP-{i}", f"S{i}", f"ผู้ใช้ {i}", f"exp{i}@kkumail.com", "student", ROOM,
+         "granted" if i % 2 else "denied", "rfid", f"2024-06-01 09:{i // 2:02d}:00")
+        for i in range(ROWS)
+    ]
+    with backend.app.get_db_connection() as conn:
+        conn.executemany(backend.app._ACCESS_LOG_INSERT_SQL, rows)
+        conn.commit()
+    return rows
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(backend, monkeypatch):
+    monkeypatch.setattr(backend.app, "EXPORT_CHUNK_ROWS", 3)
+
+
+def _export(backend, headers=None, **params):
+    return backend.client.get(
+        "/api/access-logs/export", query_string=params,
+        headers={**backend.admin, **(headers or {})},
+    )
+
+
+def _csv_rows(data):
+    text = data.decode()
+    assert text.startswith("\ufeff")
+    return list(csv.DictReader(io.StringIO(text[1:])))
+
+
+def test_csv_has_every_row_newest_first(backend, export_logs):
+    resp = _export(backend, room=ROOM)
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/csv"
+    assert resp.headers["Content-Disposition"].endswith('.csv"')
+    rows = _csv_rows(resp.data)
+    assert list(rows[0]) == list(backend.app.EXPORT_COLUMNS)
+    assert len(rows) == ROWS
+    keys = [(r["scanned_at"], int(r["id"])) for r in rows]
+    assert keys == sorted(keys, reverse=True)
+    assert rows[-1]["name"] == "ผู้ใช้ 0"
+
+
+def test_filters_and_exact_chunk_multiple(backend, export_logs):
+    rows = _csv_rows(_export(backend, room=ROOM, result="denied").data)
+    assert len(rows) == 4  # 0, 2, 4, 6
+    assert {r["result"] for r in rows} == {"denied"}
+    rows = _csv_rows(_export(backend, room=ROOM, result="granted").data)
+    assert len(rows) == 3  # เท่ากับ chunk พอดี — chunk ว่างถัดไปต้องจบ stream
+
+
+def test_ndjson(backend, export_logs):
+    resp = _export(backend, room=ROOM, format="ndjson")
+    assert resp.mimetype == "application/x-ndjson"
+    assert "ผู้ใช้" in resp.data.decode()
+    lines = [json.loads(line) for line in resp.data.decode().splitlines()]
+    assert len(lines) == ROWS
+    assert set(lines[0]) == set(backend.app.EXPORT_COLUMNS)
+    assert len({line["id"] for line in lines}) == ROWS
+
+
+def test_gzip(backend, export_logs):
+    resp = _export(backend, room=ROOM, gzip="1")
+    assert resp.mimetype == "application/gzip"
+    assert resp.headers["Content-Disposition"].endswith('.csv.gz"')
+    assert "Content-Encoding" not in resp.headers
+    assert len(_csv_rows(gzip.decompress(resp.data))) == ROWS
+
+    resp = _export(backend, {"Accept-Encoding": "gzip"}, room=ROOM, format="ndjson")
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert len(gzip.decompress(resp.data).decode().splitlines()) == ROWS
+
+
+def test_archive(backend):
+    room = "T-EXPORT-ARCHIVE"
+    rows = [
+        (f"EXPA-{i}", f"S{i}", f"User {i}", f"expa{i}@kkumail.com", "student", room,
+         "granted", "rfid", f"2016-05-{i + 1:02d} 10:00:00")
+        for i in range(5)
+    ]
+    with backend.app.get_db_connection() as conn:
+        conn.executemany(backend.app._ACCESS_LOG_INSERT_SQL, rows)
+        conn.commit()
+    log_archive.rotate_log_partitions(
+        retention_days=30, now=datetime(2016, 7, 15, tzinfo=timezone.utc)
+    )
+    assert _csv_rows(_export(backend, room=room).data) == []  # ออกจาก access_logs แล้ว
+
+    resp = _export(backend, room=room, archive="2016-05")
+    assert resp.headers["Content-Disposition"] == 'attachment; filename="access_logs_2016-05.csv"'
+    assert [r["uuid"] for r in _csv_rows(resp.data)] == [f"EXPA-{i}" for i in range(4, -1, -1)]
+
+
+def test_errors(backend):
+    assert backend.client.get("/api/access-logs/export").status_code == 401
+    assert _export(backend, format="xlsx").status_code == 400
+    assert _export(backend, archive="1999-01").status_code == 404
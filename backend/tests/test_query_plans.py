@@ -0,0 +1,611 @@
+"""
+test_query_plans.py
+===================
+Query-plan regression suite ของ SQL ทุก statement ใน backend
+
+- ดึง SQL ที่เป็น string คงที่จาก .execute() / .executemany() ทุกจุดใน MODULES ด้วย ast
+  (รวม f-string ที่ประกอบจากค่าคงที่ของโมดูล / ฟังก์ชัน) แล้ว EXPLAIN QUERY PLAN
+  บน database ปลอมขนาดใหญ่ที่สร้างด้วย init_*() ตัวจริง (schema / index / trigger เดียวกัน)
+- SQL ที่ประกอบตอน runtime (WHERE ตาม filter, search ฯลฯ) ตรวจจาก statement ที่รันจริง
+  ตอนเรียก route ใน SCENARIOS (sqlite3 trace callback) — ทุกจุดต้องลงทะเบียนใน
+  DYNAMIC_COVERED / DYNAMIC_EXEMPT ไม่งั้น test_dynamic_sql_registered fail
+- SCAN ตารางใหญ่ทั้งตาราง = fail เว้นแต่อยู่ใน EXPECTED_SCANS พร้อมเหตุผล
+  (SCAN ผ่าน index ได้เฉพาะ query ที่มี LIMIT — เดิน index ตาม ORDER BY แล้วหยุด)
+- จับเวลาทุก statement (write รันใน SAVEPOINT แล้ว rollback) พิมพ์สรุปท้าย session
+  statement ที่ไม่อยู่ใน EXPECTED_SCANS ช้ากว่า QUERY_PLAN_BUDGET_MS = fail
+
+state.py ไม่อยู่ใน MODULES — เป็นไฟล์ state แยก ตารางเล็ก (คิวคำสั่ง / heartbeat)
+
+รัน:
+    cd backend && python -m pytest tests -q
+    QUERY_PLAN_SEED_SCALE=5 QUERY_PLAN_BUDGET_MS=250 python -m pytest tests -q
+"""
+
+import ast
+import datetime
+import os
+import random
+import re
+import sqlite3
+import time
+from collections import namedtuple
+
+import pytest
+
+from conftest import BACKEND_DIR, query_timings_key
+MODULES = (
+    "app.py",
+    "auth.py",
+    "booking.py",
+    "notifications.py",
+    "whitelist.py",
+    "door_grants.py",
+    "log_archive.py",
+)
+
+SEED_SCALE = float(os.getenv("QUERY_PLAN_SEED_SCALE", "1"))
+BUDGET_MS = float(os.getenv("QUERY_PLAN_BUDGET_MS", "100"))
+
+
+# statement ที่ไม่มี plan ให้ตรวจ
+_SKIP_KINDS = {
+    "CREATE", "DROP", "ALTER", "PRAGMA", "ATTACH", "DETACH",
+    "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "VACUUM",
+}
+
+# ตารางที่เล็กโดยธรรมชาติ (ไม่โตตามจำนวน scan / ผู้ใช้) — SCAN ได้
+SMALL_TABLES = {
+    "rooms",
+    "access_log_counts",  # 1 แถวต่อ (room, result)
+    "grant_versions",  # 1 แถวต่อห้อง
+    "log_archives",  # 1 แถวต่อเดือน
+    "sqlite_master",
+    "sqlite_schema",
+}
+
+# SCAN ที่ตั้งใจ — (ที่มา, ตาราง/alias): เหตุผล
+# ที่มา = "<module>:<function>" (SQL คงที่) หรือ "scenario:<id>" (SQL ที่ trace ได้)
+EXPECTED_SCANS = {
+    ("app.py:rebuild_csv_from_db", "users_reg"): "export ผู้ใช้ทั้งหมดลง CSV",
+    ("app.py:get_users", "users_reg"): "หน้า admin แสดงผู้ใช้ทั้งหมด",
+    ("app.py:load_user_index", "users_reg"): "โหลด UUID index ทั้งชุดตอน start / version เปลี่ยน",
+    ("app.py:check_user_index_consistency", "users_reg"): "เทียบ index ในหน่วยความจำกับทั้งตาราง",
+    ("app.py:get_all_admin_users", "au"): "หน้า admin แสดงบัญชีทั้งหมด",
+    ("auth.py:get_rfid_register_requests", "rfid_register_requests"): "หน้า admin แสดงคำขอทั้งหมด",
+    ("booking.py:get_all_bookings", "b"): "หน้า admin แสดง booking ทั้งหมด",
+    ("booking.py:sync_grant_uuids", "access_grants"): "มีแค่ grant ที่ยังไม่หมดอายุ (prune ทุก rebuild)",
+    ("booking.py:rebuild_access_grants", "access_grants"): "มีแค่ grant ที่ยังไม่หมดอายุ (prune ทุก rebuild)",
+    ("notifications.py:_flush_rfid_denied", "admin_users"): "แจ้งเตือน admin ทุกคน",
+    ("whitelist.py:_load_admins", "users_reg"): "snapshot admin ทั้งหมด — cache ต่อ version",
+    ("log_archive.py:_write_partition", "part.access_logs"): "ตรวจจำนวนแถวของทั้ง partition (1 เดือน)",
+    ("log_archive.py:_drop_from_hot", "access_log_hourly"): "ลบ bucket ที่เหลือ 0 — ตารางมีแค่ช่วง retention",
+    ("scenario:access-logs-exact", "access_logs"): "?total=exact นับทุกแถวตามที่ขอ",
+    ("scenario:access-logs-search-short", "access_logs"): "คำค้น < 3 ตัวอักษรใช้ trigram ไม่ได้ (จำกัดด้วย probe budget)",
+}
+
+# SQL ที่ประกอบตอน runtime — (module, function): scenario id prefix ที่ครอบคลุม
+DYNAMIC_COVERED = {
+    ("app.py", "_fetch_with_budget"): "access-logs-search",
+    ("app.py", "fetch_log_page"): "access-logs",
+    ("app.py", "_counted_total"): "access-logs-cursor",
+    ("app.py", "get_access_logs"): "access-logs-exact",
+    ("app.py", "get_archived_logs"): "access-logs-archive",
+    ("app.py", "_analytics_rows"): "access-logs-analytics",
+    ("notifications.py", "get_notifications"): "notifications",
+}
+# SQL ที่ประกอบตอน runtime แต่ไม่มี plan ให้ตรวจ
+DYNAMIC_EXEMPT = {
+    ("auth.py", "init_auth_db"): "ALTER TABLE migration (DDL)",
+    ("door_grants.py", "init_door_grants_db"): "CREATE TRIGGER (DDL)",
+    ("log_archive.py", "_release_free_pages"): "PRAGMA incremental_vacuum",
+}
+
+# (id, path, ใคร, จำนวนหน้าที่ตาม next_cursor) — {month} / {day} เติมจากข้อมูลที่ seed
+SCENARIOS = [
+    ("access-logs", "/api/access-logs", "admin", 1),
+    ("access-logs-filter", "/api/access-logs?room=EN4401&result=denied", "admin", 1),
+    ("access-logs-cursor", "/api/access-logs?room=EN4402&limit=100", "admin", 3),
+    ("access-logs-offset", "/api/access-logs?result=granted&offset=500&limit=50", "admin", 1),
+    ("access-logs-range", "/api/access-logs?from={day}&to={day} 12:00:00&room=EN4403", "admin", 1),
+    ("access-logs-exact", "/api/access-logs?room=EN4404&total=exact", "admin", 1),
+    ("access-logs-search-fts", "/api/access-logs?search=Boonmee", "admin", 2),
+    ("access-logs-search-rare", "/api/access-logs?search={user_id}&total=exact", "admin", 1),
+    ("access-logs-search-short", "/api/access-logs?search=ai", "admin", 1),
+    ("access-logs-export", "/api/access-logs/export?room=EN4405&from={day}", "admin", 1),
+    ("access-logs-export-search", "/api/access-logs/export?search=Srisuk&format=ndjson", "admin", 1),
+    ("access-logs-stats", "/api/access-logs/stats", "admin", 1),
+    ("access-logs-analytics", "/api/access-logs/analytics?bucket=hour&room=EN4401", "admin", 1),
+    ("access-logs-analytics-heatmap", "/api/access-logs/analytics?bucket=weekday_hour&from={month}-01", "admin", 1),
+    ("access-logs-archive", "/api/access-logs/archives/{month}?room=EN4401&limit=50", "admin", 2),
+    ("access-logs-archive-search", "/api/access-logs/archives/{month}?search=Kanya", "admin", 1),
+    ("notifications", "/api/notifications", "user", 1),
+    ("notifications-unread", "/api/notifications?unread=true&offset=20", "user", 1),
+    ("notifications-count", "/api/notifications/unread-count", "user", 1),
+]
+
+FIRST = ["Somchai", "Anan", "Kanya", "Pimchanok", "Thanakorn", "Siriporn", "Wichai", "Nattaya"]
+LAST = ["Jaidee", "Boonmee", "Srisuk", "Wongsawat", "Chaiyaporn", "Kittikun", "Rattana"]
+ROOMS = ["EN4401", "EN4402", "EN4403", "EN4404", "EN4405"]
+
+
+# =====================
+# SQL extraction (ast)
+# =====================
+Statement = namedtuple("Statement", "module line function sql")
+
+
+def _str_constants(nodes):
+    """NAME = "..." → {NAME: "..."}"""
+    out = {}
+    for node in nodes:
+        if (
+            isinstance(node, ast.Assign)
+            and len(node.targets) == 1
+            and isinstance(node.targets[0], ast.Name)
+            and isinstance(node.value, ast.Constant)
+            and isinstance(node.value.value, str)
+        ):
+            out[node.targets[0].id] = node.value.value
+    return out
+
+
+class _SqlCollector(ast.NodeVisitor):
+    def __init__(self, module, constants):
+        self.module = module
+        self.scopes = [("<module>", constants)]
+        self.statements = []
+        self.dynamic = []
+
+    def visit_FunctionDef(self, node):
+        local = {**self.scopes[-1][1], **_str_constants(ast.walk(node))}
+        self.scopes.append((node.name, local))
+        self.generic_visit(node)
+        self.scopes.pop()
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_Call(self, node):
+        func = node.func
+        if isinstance(func, ast.Attribute) and func.attr in ("execute", "executemany") and node.args:
+            name, constants = self.scopes[-1]
+            sql = self._resolve(node.args[0], constants)
+            if sql is None:
+                self.dynamic.append((self.module, name, node.lineno))
+            else:
+                self.statements.append(Statement(self.module, node.lineno, name, sql))
+        self.generic_visit(node)
+
+    @staticmethod
+    def _resolve(arg, constants):
+        if isinstance(arg, ast.Constant) and isinstance(arg.value, str):
+            return arg.value
+        if isinstance(arg, ast.Name):
+            return constants.get(arg.id)
+        if isinstance(arg, ast.JoinedStr):
+            parts = []
+            for value in arg.values:
+                if isinstance(value, ast.Constant):
+                    parts.append(value.value)
+                elif (
+                    isinstance(value, ast.FormattedValue)
+                    and isinstance(value.value, ast.Name)
+                    and value.value.id in constants
+                ):
+                    parts.append(constants[value.value.id])
+                else:
+                    return None
+            return "".join(parts)
+        return None
+
+
+def _statement_kind(sql):
+    words = sql.split()
+    return words[0].upper() if words else ""
+
+
+def collect_sql():
+    """(statement คงที่ทั้งหมด, [(module, function, line)] ของ SQL ที่ประกอบตอน runtime)"""
+    statements, dynamic = [], []
+    for module in MODULES:
+        with open(os.path.join(BACKEND_DIR, module), encoding="utf-8") as f:
+            tree = ast.parse(f.read(), module)
+        collector = _SqlCollector(module, _str_constants(tree.body))
+        collector.visit(tree)
+        statements += collector.statements
+        dynamic += collector.dynamic
+    return statements, dynamic
+
+
+STATEMENTS, DYNAMIC_SITES = collect_sql()
+PLANNED = [s for s in STATEMENTS if _statement_kind(s.sql) not in _SKIP_KINDS]
+
+
+# =====================
+# Plan helpers
+# =====================
+def explain(conn, sql, params=()):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+
+
+def _scanned_tables(plan):
+    """[(ตาราง/alias, detail)] ของบรรทัด SCAN ที่อ่านตารางจริง"""
+    out = []
+    for detail in plan:
+        if not detail.startswith("SCAN "):
+            continue
+        if "VIRTUAL TABLE" in detail or "CONSTANT ROW" in detail or "(subquery" in detail:
+            continue
+        out.append((detail.split()[1], detail))
+    return out
+
+
+def unexpected_scans(origin, sql, plan):
+    limited = re.search(r"\bLIMIT\b", sql, re.I) is not None
+    bad = []
+    for table, detail in _scanned_tables(plan):
+        if table in SMALL_TABLES or (origin, table) in EXPECTED_SCANS:
+            continue
+        if limited and " USING " in detail:
+            continue  # เดิน index ตาม ORDER BY แล้วหยุดที่ LIMIT
+        bad.append(detail)
+    return bad
+
+
+def _expected_origin(origin, plan):
+    return any(
+        (origin, table) in EXPECTED_SCANS for table, _ in _scanned_tables(plan)
+    )
+
+
+def time_statement(conn, sql, params=(), max_steps=None):
+    """
+    ms ที่ใช้รัน statement จริง (write ถูก rollback) — None ถ้ารันด้วย params นี้ไม่ได้
+    max_steps = งบ VM step แบบ _fetch_with_budget (ถูก interrupt = ใช้เวลาเท่าที่รันไป)
+    """
+    ticks = [0]
+    if max_steps:
+        ticks_limit = max_steps // 1000
+
+        def _tick():
+            ticks[0] += 1
+            return ticks[0] > ticks_limit
+
+        conn.set_progress_handler(_tick, 1000)
+    conn.execute("SAVEPOINT query_plan")
+    started = time.perf_counter()
+    try:
+        conn.execute(sql, params).fetchall()
+        return (time.perf_counter() - started) * 1000
+    except sqlite3.OperationalError as e:
+        if max_steps and "interrupt" in str(e):
+            return (time.perf_counter() - started) * 1000
+        return None
+    except sqlite3.Error:
+        return None
+    finally:
+        conn.set_progress_handler(None, 0)
+        conn.execute("ROLLBACK TO query_plan")
+        conn.execute("RELEASE query_plan")
+
+
+def _probe_steps(app, sql):
+    """LIKE ที่ fetch_log_page ลองก่อนใช้ FTS รันด้วยงบ LOG_SEARCH_PROBE_STEPS — จับเวลาแบบเดียวกัน"""
+    term = re.search(r"LIKE '%(.*?)%'", sql)
+    if term and app.log_search_uses_index(term.group(1)):
+        return app.LOG_SEARCH_PROBE_STEPS
+    return None
+
+
+# =====================
+# Seed
+# =====================
+def _seed(conn, app, rng):
+    n_users = int(5000 * SEED_SCALE)
+    n_logs = int(100_000 * SEED_SCALE)
+    n_bookings = int(20_000 * SEED_SCALE)
+    n_notifications = int(50_000 * SEED_SCALE)
+    n_requests = int(5000 * SEED_SCALE)
+    now = time.time()
+
+    users = []
+    for i in range(n_users):
+        first, last = rng.choice(FIRST), rng.choice(LAST)
+        sid = str(640000000 + i)
+        users.append(
+            (
+                f"{rng.getrandbits(32):08X}",
+                sid,
+                first,
+                last,
+                f"{first} {last}",
+                f"{first.lower()}.{sid}@kkumail.com",
+                "admin" if i % 100 == 0 else "student",
+                1 if i % 20 == 0 else 0,
+            )
+        )
+    conn.executemany(
+        """
+        INSERT INTO users_reg (uuid, user_id, first_name, last_name, name, email, role, is_deleted)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+        users,
+    )
+    conn.executemany(
+        """
+        INSERT INTO admin_users (email, first_name, last_name, password_hash, user_id, role)
+        VALUES (?, ?, ?, 'x', ?, ?)
+        """,
+        [(u[5], u[2], u[3], u[1], u[6]) for u in users],
+    )
+    conn.executemany(
+        "INSERT INTO rooms (name) VALUES (?)", [(room,) for room in ROOMS]
+    )
+    conn.executemany(
+        """
+        INSERT INTO rfid_register_requests (user_id, email, first_name, last_name, status)
+        VALUES (?, ?, ?, ?, ?)
+        """,
+        [
+            (u[1], u[5], u[2], u[3], rng.choice(["pending", "approved", "rejected"]))
+            for u in rng.choices(users, k=n_requests)
+        ],
+    )
+
+    bookings = []
+    for _ in range(n_bookings):
+        user_no = rng.randrange(n_users)
+        day = datetime.date.today() + datetime.timedelta(days=rng.randint(-180, 30))
+        hour = rng.randint(8, 18)
+        bookings.append(
+            (
+                user_no + 1,
+                users[user_no][5],
+                rng.choice(ROOMS),
+                day.isoformat(),
+                f"{hour:02d}:00",
+                f"{hour + 1:02d}:00",
+                rng.choice(["pending", "approved", "approved", "rejected"]),
+            )
+        )
+    conn.executemany(
+        """
+        INSERT INTO bookings (user_id, user_email, room, date, start_time, end_time, status)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        bookings,
+    )
+
+    # log ย้อนหลัง ~75 วัน → เดือนเก่าถูก archive ออกเป็น partition
+    span = 75 * 86400
+    logs = []
+    for i in range(n_logs):
+        u = rng.choice(users)
+        logs.append(
+            (
+                u[0],
+                u[1],
+                u[4],
+                u[5],
+                u[6],
+                rng.choice(ROOMS),
+                "granted" if rng.random() < 0.85 else "denied",
+                "rfid",
+                time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - span + i * span / n_logs)),
+            )
+        )
+    conn.executemany(app._ACCESS_LOG_INSERT_SQL, logs)
+
+    # ผู้ใช้คนแรกมี notification เยอะเป็นพิเศษ (ใช้ใน scenario notifications)
+    notifications = []
+    for i in range(n_notifications):
+        user_no = 0 if i % 25 == 0 else rng.randrange(n_users)
+        notifications.append(
+            (
+                user_no + 1,
+                users[user_no][5],
+                rng.choice(["booking_approved", "booking_rejected", "reminder"]),
+                "title",
+                "message",
+                1 if rng.random() < 0.7 else 0,
+                time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(now - rng.randrange(span))),
+            )
+        )
+    conn.executemany(
+        """
+        INSERT INTO notifications (user_id, user_email, type, title, message, is_read, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+        notifications,
+    )
+    conn.commit()
+    return users
+
+
+Env = namedtuple("Env", "app conn users headers fill")
+
+
+@pytest.fixture(scope="session")
+def plan_env():
+    import jwt
+
+    import app
+    import auth
+    import booking
+    import log_archive
+    import notifications
+    import whitelist
+    from db import DB_PATH, _pool, get_db_connection
+
+    app.init_db()
+    auth.init_auth_db()
+    booking.init_booking_db()
+    notifications.init_notification_db()
+    whitelist.init_whitelist_db()
+    app.init_door_grants_db()
+    log_archive.init_log_archive_db()
+
+    rng = random.Random(24)
+    with get_db_connection() as conn:
+        users = _seed(conn, app, rng)
+    booking.rebuild_access_grants()
+    log_archive.rotate_log_partitions()
+    months = [p["month"] for p in log_archive.list_partitions()]
+    assert months, "seed ควรมี log เก่าพอให้ archive อย่างน้อย 1 เดือน"
+
+    def token(email, user_id, role):
+        exp = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=1)
+        payload = {"user_id": user_id, "email": email, "role": role, "exp": exp}
+        return {"Authorization": "Bearer " + jwt.encode(payload, app.app.config["SECRET_KEY"], algorithm="HS256")}
+
+    headers = {
+        "admin": token("planner@kku.ac.th", 1, "admin"),
+        "user": token(users[0][5], 1, "student"),
+    }
+    fill = {
+        "month": months[0],
+        "day": time.strftime("%Y-%m-%d", time.gmtime(time.time() - 3 * 86400)),
+        "user_id": users[len(users) // 2][1],
+    }
+    # plan / เวลาวัดบน connection แยก (ไม่ผ่าน pool) — ไม่รัน ANALYZE เหมือน production
+    conn = sqlite3.connect(DB_PATH)
+    conn.isolation_level = None
+    conn.execute("ATTACH DATABASE ':memory:' AS part")
+    conn.executescript(
+        log_archive._PARTITION_SCHEMA.replace("IF NOT EXISTS ", "IF NOT EXISTS part.")
+    )
+    yield Env(app, conn, users, headers, fill)
+    conn.close()
+    _pool.close_all()
+
+
+@pytest.fixture(scope="session")
+def timings(request):
+    """[(ms, ที่มา, sql)] — conftest.py พิมพ์ statement ที่ช้าที่สุดท้าย session"""
+    return request.config.stash[query_timings_key]
+
+
+# =====================
+# Tracing (SQL ที่ประกอบตอน runtime)
+# =====================
+class _Tracer:
+    """hook sqlite3.connect → ทุก connection ใหม่ส่ง SQL ที่รัน (ค่า param แทนแล้ว) มาที่ self.captured"""
+
+    def __init__(self):
+        self.captured = []
+        self._connect = sqlite3.connect
+
+    def __enter__(self):
+        def connect(database, *args, **kwargs):
+            conn = self._connect(database, *args, **kwargs)
+            path = str(database)
+            if path.startswith("file:"):
+                path = path[len("file:"):].split("?", 1)[0]
+            conn.set_trace_callback(lambda sql: self.captured.append((path, sql)))
+            return conn
+
+        sqlite3.connect = connect
+        return self
+
+    def __exit__(self, *exc):
+        sqlite3.connect = self._connect
+
+
+# SQL ภายในของ FTS5 (อ่าน/เขียน shadow table ของ access_logs_fts เอง)
+_FTS_INTERNAL_RE = re.compile(r"'\w+'\.'\w+_fts_\w+'")
+
+
+def _traced_statements(captured):
+    seen = set()
+    for path, sql in captured:
+        text = sql.strip()
+        if text.startswith("--") or _statement_kind(text) in _SKIP_KINDS:
+            continue  # statement ใน trigger / transaction control
+        if _FTS_INTERNAL_RE.search(text):
+            continue
+        if (path, text) not in seen:
+            seen.add((path, text))
+            yield path, text
+
+
+def _run_scenario(env, path, who, pages):
+    from db import _pool
+
+    client = env.app.app.test_client()
+    _pool.close_all()  # connection เดิมใน pool ไม่มี trace callback
+    with _Tracer() as tracer:
+        for _ in range(pages):
+            resp = client.get(path, headers=env.headers[who])
+            body = resp.get_data(as_text=True)  # export เป็น stream — SQL รันตอนอ่าน body
+            assert resp.status_code == 200, body[:300]
+            cursor = (resp.get_json(silent=True) or {}).get("next_cursor")
+            if not cursor:
+                break
+            sep = "&" if "?" in path else "?"
+            path = re.sub(r"[?&]cursor=[^&]*", "", path) + f"{sep}cursor={cursor}"
+    _pool.close_all()
+    return list(_traced_statements(tracer.captured))
+
+
+# =====================
+# Tests
+# =====================
+def test_dynamic_sql_registered():
+    """SQL ที่ประกอบตอน runtime ทุกจุดต้องมี scenario ครอบคลุม หรือระบุว่าทำไมไม่ต้องตรวจ"""
+    sites = {(module, func) for module, func, _ in DYNAMIC_SITES}
+    unregistered = sorted(sites - set(DYNAMIC_COVERED) - set(DYNAMIC_EXEMPT))
+    assert not unregistered, (
+        "dynamic SQL ใหม่ — เพิ่ม scenario ใน SCENARIOS แล้วลงทะเบียนใน DYNAMIC_COVERED "
+        f"(หรือ DYNAMIC_EXEMPT พร้อมเหตุผล): {unregistered}"
+    )
+    scenario_ids = [s[0] for s in SCENARIOS]
+    for site, prefix in DYNAMIC_COVERED.items():
+        assert any(sid.startswith(prefix) for sid in scenario_ids), (site, prefix)
+
+
+@pytest.mark.parametrize(
+    "stmt", PLANNED, ids=[f"{s.module}:{s.line}:{s.function}" for s in PLANNED]
+)
+def test_static_query_plan(plan_env, timings, stmt):
+    origin = f"{stmt.module}:{stmt.function}"
+    params = [None] * stmt.sql.count("?")
+    plan = explain(plan_env.conn, stmt.sql, params)
+    if stmt.function.startswith("init_"):
+        return  # สร้าง schema / backfill ครั้งแรก
+    bad = unexpected_scans(origin, stmt.sql, plan)
+    assert not bad, f"{origin} full scan: {bad}\n{stmt.sql}"
+
+    ms = time_statement(plan_env.conn, stmt.sql, params)
+    if ms is None:
+        return
+    timings.append((ms, origin, stmt.sql))
+    if not _expected_origin(origin, plan):
+        assert ms <= BUDGET_MS, f"{origin} ใช้ {ms:.1f} ms (budget {BUDGET_MS:g})\n{stmt.sql}"
+
+
+@pytest.mark.parametrize("scenario", SCENARIOS, ids=[s[0] for s in SCENARIOS])
+def test_scenario_query_plans(plan_env, timings, scenario):
+    sid, path, who, pages = scenario
+    origin = f"scenario:{sid}"
+    statements = _run_scenario(plan_env, path.format(**plan_env.fill), who, pages)
+    assert statements, f"{sid} ไม่ได้รัน SQL เลย"
+
+    from db import DB_PATH
+
+    for db_path, sql in statements:
+        if os.path.abspath(db_path) == os.path.abspath(DB_PATH):
+            conn, close = plan_env.conn, False
+        else:  # partition ที่ open_partition() แตกไว้ใน cache
+            conn, close = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True), True
+        try:
+            plan = explain(conn, sql)
+            bad = unexpected_scans(origin, sql, plan)
+            assert not bad, f"{origin} full scan: {bad}\n{sql}"
+            ms = time_statement(conn, sql, max_steps=_probe_steps(plan_env.app, sql))
+        finally:
+            if close:
+                conn.close()
+        if ms is None:
+            continue
+        timings.append((ms, origin, sql))
+        if not _expected_origin(origin, plan):
+            assert ms <= BUDGET_MS, f"{origin} ใช้ {ms:.1f} ms (budget {BUDGET_MS:g})\n{sql}"
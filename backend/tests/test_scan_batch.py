@@ -0,0 +1,77 @@
+"""
+test_scan_batch.py
+==================
+พฤติกรรมของ /api/send_uuid/batch (ESP32_Door upload scan ที่ค้างตอน offline)
+
+- scan ที่ผิดรูปถูกปฏิเสธเป็นรายใบ (error ในผลของใบนั้น) ใบอื่นใน batch ยังถูกบันทึก
+- scanned_at / age_ms ที่ไม่ใช่ตัวเลขจำกัด หรือนอกช่วงที่รับได้ = "bad scanned_at"
+- batch ว่าง → 400, เกิน MAX_SCAN_BATCH → 413
+"""
+
+import time
+
+import db
+
+ROOM = "T-BATCH"
+
+
+def _post(backend, body):
+    return backend.client.post("/api/send_uuid/batch", json=body)
+
+
+def _logged(uuid_prefix):
+    with db.get_db_connection() as conn:
+        return conn.execute(
+            "SELECT uuid, room, method FROM access_logs WHERE uuid LIKE ? ORDER BY uuid",
+            (uuid_prefix + "%",),
+        ).fetchall()
+
+
+def test_mixed_batch_rejects_bad_scans_individually(backend):
+    now = time.time()
+    scans = [
+        {"uuid": "BATCH-OK-1", "scanned_at": now - 60},
+        {"uuid": ["BATCH", "LIST"], "scanned_at": now},
+        {"uuid": {"nested": 1}},
+        {"uuid": 12345},
+        {"uuid": "BATCH-BADROOM-1", "room": ["EN", "4401"]},
+        {"uuid": "BATCH-BADROOM-2", "room": 4401},
+        {"uuid": "BATCH-BADTIME-1", "scanned_at": 1e300},
+        {"uuid": "BATCH-BADTIME-2", "scanned_at": "yesterday"},
+        {"uuid": "BATCH-BADTIME-3", "age_ms": 1e400},
+        {"uuid": "BATCH-BADTIME-4", "scanned_at": True},
+        "not-a-scan",
+        {"uuid": "BATCH-OK-2", "age_ms": 5000, "offline": True, "room": "T-BATCH-OTHER"},
+    ]
+    resp = _post(backend, {"room": ROOM, "scans": scans})
+    assert resp.status_code == 200
+    body = resp.get_json()
+    assert (body["accepted"], body["rejected"]) == (2, 10)
+
+    errors = {r["index"]: r.get("error") for r in body["results"]}
+    assert [errors[i] for i in (1, 2, 3, 10)] == ["uuid required"] * 4
+    assert [errors[i] for i in (4, 5)] == ["bad room"] * 2
+    assert [errors[i] for i in (6, 7, 8, 9)] == ["bad scanned_at"] * 4
+    assert errors[0] is None and errors[11] is None
+    assert [r["index"] for r in body["results"]] == list(range(len(scans)))
+
+    logged = [tuple(r) for r in _logged("BATCH-")]
+    assert logged == [
+        ("BATCH-OK-1", ROOM, "rfid"),
+        ("BATCH-OK-2", "T-BATCH-OTHER", "rfid_offline"),
+    ]
+
+
+def test_scan_time_is_kept(backend):
+    at = int(time.time()) - 3600
+    body = _post(backend, {"room": ROOM, "scans": [{"uuid": "BATCH-TIME", "scanned_at": at}]})
+    result = body.get_json()["results"][0]
+    assert result["scanned_at"] == time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(at))
+    assert result["result"] == "denied"  # ไม่มีบัตรนี้ในระบบ
+
+
+def test_batch_size_limits(backend):
+    assert _post(backend, {"room": ROOM, "scans": []}).status_code == 400
+    assert _post(backend, {"room": ROOM}).status_code == 400
+    too_many = [{"uuid": f"BATCH-MANY-{i}"} for i in range(backend.app.MAX_SCAN_BATCH + 1)]
+    assert _post(backend, {"room": ROOM, "scans": too_many}).status_code == 413
@@ -0,0 +1,90 @@
+"""
+test_scan_debounce.py
+=====================
+พฤติกรรมของ scan debounce ใน /api/send_uuid (SCAN_DEBOUNCE_SECONDS)
+
+- อ่านบัตรใบเดิมซ้ำในห้องเดิมภายใน window → ผลเดิม + "debounced" ไม่เขียน access log ซ้ำ
+- approve / reject / ลบ booking ล้างผลที่ cache ไว้ทันที (ไม่ต้องรอ window หมด)
+- version "access_grants" ถูก bump จาก process อื่น → ล้าง cache ตอนอ่านครั้งถัดไป
+"""
+
+import pytest
+
+from conftest import insert_booking, register_card
+
+EMAIL = "debounce@kkumail.com"
+
+
+@pytest.fixture
+def card(backend, monkeypatch):
+    monkeypatch.setattr(backend.app, "SCAN_DEBOUNCE_SECONDS", 60.0)
+    backend.app.invalidate_scan_cache()
+    uuid = "DEBOUNCE-CARD"
+    if backend.app.get_user_by_uuid(uuid) is None:
+        register_card(backend, uuid, EMAIL)
+    return uuid
+
+
+def _scan(backend, uuid, room):
+    resp = backend.client.post(
+        "/api/send_uuid", json={"uuid": uuid, "room": room, "source": "door"}
+    )
+    return resp.status_code, resp.get_json()
+
+
+def _log_count(backend, room):
+    backend.app.access_log_writer.flush()
+    with backend.app.get_db_connection() as conn:
+        return conn.execute(
+            "SELECT COUNT(*) FROM access_logs WHERE room = ?", (room,)
+        ).fetchone()[0]
+
+
+def test_repeat_read_is_not_logged_twice(backend, card):
+    room = "T-DEBOUNCE-REPEAT"
+    status, body = _scan(backend, card, room)
+    assert (status, body.get("debounced")) == (403, None)
+    for _ in range(3):
+        status, body = _scan(backend, card, room)
+        assert (status, body["status"], body["debounced"]) == (403, "denied", True)
+    assert _log_count(backend, room) == 1
+
+    # ห้องอื่น = key อื่น
+    assert _scan(backend, card, room + "-B")[1].get("debounced") is None
+
+
+def test_approve_and_delete_invalidate(backend, card):
+    room = "T-DEBOUNCE-APPROVE"
+    assert _scan(backend, card, room)[0] == 403
+
+    booking_id = insert_booking(EMAIL, room)
+    resp = backend.client.post(f"/api/bookings/{booking_id}/approve", json={}, headers=backend.admin)
+    assert resp.status_code == 200
+    status, body = _scan(backend, card, room)
+    assert (status, body.get("debounced")) == (200, None)
+    assert _scan(backend, card, room)[1]["debounced"] is True
+
+    resp = backend.client.delete(f"/api/bookings/{booking_id}/delete", headers=backend.admin)
+    assert resp.status_code == 200
+    status, body = _scan(backend, card, room)
+    assert (status, body.get("debounced")) == (403, None)
+    assert _log_count(backend, room) == 3
+
+
+def test_reject_invalidates(backend, card):
+    room = "T-DEBOUNCE-REJECT"
+    _scan(backend, card, room)
+    booking_id = insert_booking(EMAIL, room)
+    resp = backend.client.post(
+        f"/api/bookings/{booking_id}/reject", json={"remark": "no"}, headers=backend.admin
+    )
+    assert resp.status_code == 200
+    assert _scan(backend, card, room)[1].get("debounced") is None
+
+
+def test_grant_change_from_other_process(backend, card):
+    room = "T-DEBOUNCE-REMOTE"
+    _scan(backend, card, room)
+    assert _scan(backend, card, room)[1]["debounced"] is True
+    backend.app.runtime_state.bump_version("access_grants")  # worker อื่น approve booking
+    assert _scan(backend, card, room)[1].get("debounced") is None
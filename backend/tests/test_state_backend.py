@@ -0,0 +1,185 @@
+"""
+test_state_backend.py
+=====================
+พฤติกรรมของ SqliteStateBackend (STATE_BACKEND=sqlite) — หลาย instance บนไฟล์เดียวกัน
+แทนหลาย worker process
+
+- seq ต่อห้องต่อเนื่องข้าม instance, คำสั่งถูก claim แค่ครั้งเดียวแม้หลาย thread แย่งกัน
+- ack, หมดอายุตาม posted_at + sweep(), max_pending
+- long-poll เห็น post จาก instance อื่น (poll ตารางทุก poll_interval)
+- record_door_online: transition หนึ่งครั้งมี instance เดียวที่ได้ True
+"""
+
+import threading
+import time
+
+import pytest
+
+from door_channel import IDLE
+from state import SqliteStateBackend
+
+
+@pytest.fixture
+def make_backend(tmp_path):
+    path = str(tmp_path / "state.db")
+
+    def make(**kwargs):
+        kwargs.setdefault("poll_interval", 0.01)
+        return SqliteStateBackend(path, **kwargs)
+
+    return make
+
+
+def test_seq_shared_across_instances(make_backend):
+    a, b = make_backend(), make_backend()
+    assert [a.post_command("A", "open"), b.post_command("A", "close")] == [1, 2]
+    assert b.post_command("B", "open") == 1
+    assert b.take_command("A") == ("open", 1)
+    assert a.take_command("A") == ("close", 2)
+    assert a.take_command("A") == (IDLE, 2)
+
+
+def test_claimed_at_most_once(make_backend):
+    n = 60
+    backends = [make_backend(max_pending=n) for _ in range(3)]
+    for i in range(n):
+        backends[i % 3].post_command("A", "open")
+
+    claimed = []
+    lock = threading.Lock()
+
+    def drain(backend):
+        while True:
+            cmd, seq = backend.take_command("A")
+            if cmd == IDLE:
+                return
+            with lock:
+                claimed.append(seq)
+
+    threads = [threading.Thread(target=drain, args=(b,)) for b in backends for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert sorted(claimed) == list(range(1, n + 1))
+
+
+def test_ack(make_backend):
+    a, b = make_backend(), make_backend()
+    seq = a.post_command("A", "open")
+    assert b.ack_command("A", seq) is False  # ยังไม่ได้ส่ง
+    b.take_command("A")
+    assert a.ack_command("A", seq) is True
+    assert b.ack_command("A", seq) is False
+    assert a.command_stats()["queued"] == {}
+
+
+def test_ack_piggybacked_on_take(make_backend):
+    a = make_backend()
+    first = a.post_command("A", "open")
+    a.post_command("A", "close")
+    a.take_command("A")
+    assert a.take_command("A", ack=first) == ("close", 2)
+    assert [c["seq"] for c in a.command_stats()["queued"]["A"]] == [2]
+
+
+def test_expiry(make_backend):
+    a = make_backend(command_ttl=0.05)
+    a.post_command("A", "open")
+    a.post_command("A", "close")
+    assert a.take_command("A") == ("open", 1)
+    time.sleep(0.1)
+    # หมดอายุแล้วแต่ sweeper ยังไม่ลบ → ก็ไม่ถูกส่ง
+    assert a.take_command("A") == (IDLE, 2)
+    a.sweep()
+    assert a.command_stats()["queued"] == {}
+    assert a.ack_command("A", 1) is False
+
+
+def test_max_pending_drops_oldest(make_backend):
+    a = make_backend(max_pending=4)
+    for i in range(6):
+        a.post_command("A", f"cmd{i}")
+    assert [c["seq"] for c in a.command_stats()["queued"]["A"]] == [3, 4, 5, 6]
+    assert a.take_command("A") == ("cmd2", 3)
+
+
+def test_long_poll_sees_other_instance(make_backend):
+    door, web = make_backend(), make_backend()
+    result = {}
+
+    def poll():
+        started = time.monotonic()
+        result["cmd"] = door.take_command("A", wait=5.0)
+        result["elapsed"] = time.monotonic() - started
+
+    t = threading.Thread(target=poll)
+    t.start()
+    deadline = time.monotonic() + 2.0
+    while web.waiting("A") == 0 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert web.waiting("A") == 1
+    web.post_command("A", "open")
+    t.join(2.0)
+    assert result["cmd"] == ("open", 1)
+    assert result["elapsed"] < 1.0
+    assert web.waiting("A") == 0
+
+
+def test_long_poll_timeout(make_backend):
+    a = make_backend()
+    started = time.monotonic()
+    assert a.take_command("A", wait=0.05) == (IDLE, 0)
+    assert time.monotonic() - started >= 0.05
+
+
+def test_door_online_transitions(make_backend):
+    a = make_backend()
+    assert a.record_door_online("A", True, 100.0) is True
+    assert a.record_door_online("A", True, 101.0) is False
+    assert a.record_door_online("A", False, 102.0) is True
+    # ผลที่ประเมินก่อน transition ล่าสุด (worker ที่ช้ากว่า) ไม่สลับกลับ
+    assert a.record_door_online("A", True, 101.5) is False
+    assert a.record_door_online("A", True, 103.0) is True
+
+
+def test_door_online_emitted_once_across_instances(make_backend):
+    backends = [make_backend() for _ in range(4)]
+    for online, at in ((True, 100.0), (False, 200.0), (True, 300.0)):
+        results = [b.record_door_online("A", online, at) for b in backends]
+        assert results.count(True) == 1
+
+
+def test_waiting_counts_each_long_poll(make_backend):
+    door, web = make_backend(), make_backend()
+    short = threading.Thread(target=door.take_command, args=("A",), kwargs={"wait": 0.1})
+    long = threading.Thread(target=door.take_command, args=("A",), kwargs={"wait": 5.0})
+    long.start()
+    short.start()
+    deadline = time.monotonic() + 2.0
+    while web.waiting("A") < 2 and time.monotonic() < deadline:
+        time.sleep(0.005)
+    assert web.waiting("A") == 2
+    short.join(2.0)
+    # request แรกออกไปแล้ว อีกตัวยังรออยู่ → ห้องยัง online
+    assert web.waiting("A") == 1
+    assert web.command_stats()["waiting"] == 1
+    web.post_command("A", "open")
+    long.join(2.0)
+    assert web.waiting("A") == 0
+
+
+def test_connections_reused_across_threads(make_backend):
+    a = make_backend()
+
+    def request():
+        a.touch_room("A")
+        a.take_command("A")
+
+    for _ in range(20):
+        t = threading.Thread(target=request)  # thread ใหม่ทุก request แบบ threading mode
+        t.start()
+        t.join()
+    pool = a.stats()["pool"]
+    assert pool["created"] <= 2
+    assert pool["reused"] >= 40
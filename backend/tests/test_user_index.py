@@ -0,0 +1,114 @@
+"""
+test_user_index.py
+==================
+พฤติกรรมของ UUID index (in-memory) ที่ get_user_by_uuid ใช้ตอนสแกน
+
+- hit / miss นับใน user_index_stats() — lookup ไม่แตะ DB
+- add_user / update_user / delete_user sync แถวนั้นเข้า index ทันที (ไม่ reload ทั้งก้อน)
+- UUID ที่ถูกลบแล้วลงทะเบียนใหม่ ชี้ไปที่เจ้าของใหม่
+- version "users_reg" ถูก bump จาก process อื่น → reload ตอน lookup ครั้งถัดไป
+- /api/admin/user-index: admin เท่านั้น, ?reload=true, รายงานความตรงกันกับ users_reg
+
+route ของ user เขียน users.csv ด้วย → fixture ย้าย CSV_DIR ไป tmp_path
+"""
+
+import pytest
+
+from conftest import auth_header
+
+
+@pytest.fixture
+def users(backend, tmp_path, monkeypatch):
+    monkeypatch.setattr(backend.app, "CSV_DIR", str(tmp_path))
+    monkeypatch.setattr(backend.app, "USERS_CSV", str(tmp_path / "users.csv"))
+    monkeypatch.setattr(backend.app, "ADMINS_CSV", str(tmp_path / "admins.csv"))
+    return backend
+
+
+def _add(backend, uuid, user_id, email, role="student"):
+    body = {"uuid": uuid, "user_id": user_id, "first_name": "Index", "last_name": "Test",
+            "email": email, "role": role}
+    result = backend.client.post("/api/add_user", json=body).get_json()
+    assert result["success"], result
+    return result["user_id"]
+
+
+def _status(backend, **params):
+    resp = backend.client.get("/api/admin/user-index", query_string=params,
+                              headers=backend.admin)
+    assert resp.status_code == 200
+    return resp.get_json()
+
+
+def _in_sync(backend, uuid):
+    consistency = _status(backend)["consistency"]
+    return all(uuid not in consistency[k] for k in ("missing", "stale", "mismatched"))
+
+
+def test_hit_and_miss(users):
+    app = users.app
+    _add(users, "IDX-HIT", "IDX-HIT-ID", "idx-hit@kkumail.com")
+    before = app.user_index_stats()
+    assert app.get_user_by_uuid("IDX-HIT")["email"] == "idx-hit@kkumail.com"
+    assert app.get_user_by_uuid("IDX-NOBODY") is None
+    after = app.user_index_stats()
+    assert (after["hits"] - before["hits"], after["misses"] - before["misses"]) == (1, 1)
+    assert after["reloads"] == before["reloads"]
+
+
+def test_add_update_delete_sync_without_reload(users):
+    app = users.app
+    reloads = app.user_index_stats()["reloads"]
+    row_id = _add(users, "IDX-CRUD", "IDX-CRUD-ID", "idx-crud@kkumail.com")
+    assert app.get_user_by_uuid("IDX-CRUD")["first_name"] == "Index"
+
+    resp = users.client.put(f"/api/update_user/{row_id}", json={
+        "user_id": "IDX-CRUD-ID", "first_name": "Renamed", "last_name": "Test",
+        "email": "idx-crud@kkumail.com", "role": "admin",
+    })
+    assert resp.get_json()["success"]
+    user = app.get_user_by_uuid("IDX-CRUD")
+    assert (user["first_name"], user["role"]) == ("Renamed", "admin")
+    assert _in_sync(users, "IDX-CRUD")
+
+    assert users.client.delete(f"/api/delete_user/{row_id}").get_json()["success"]
+    assert app.get_user_by_uuid("IDX-CRUD") is None
+    assert _in_sync(users, "IDX-CRUD")
+    assert app.user_index_stats()["reloads"] == reloads
+
+
+def test_reused_uuid_points_to_new_owner(users):
+    app = users.app
+    old_id = _add(users, "IDX-REUSE", "IDX-REUSE-OLD", "idx-old@kkumail.com")
+    users.client.delete(f"/api/delete_user/{old_id}")
+    _add(users, "IDX-REUSE", "IDX-REUSE-NEW", "idx-new@kkumail.com")
+    assert app.get_user_by_uuid("IDX-REUSE")["email"] == "idx-new@kkumail.com"
+
+
+def test_change_from_other_process_reloads(users):
+    app = users.app
+    with app.get_db_connection() as conn:
+        conn.execute(
+            """
+            INSERT INTO users_reg (uuid, user_id, first_name, last_name, name, email)
+            VALUES ('IDX-REMOTE', 'IDX-REMOTE-ID', 'R', 'W', 'R W', 'idx-remote@kkumail.com')
+            """
+        )
+        conn.commit()
+    assert app.get_user_by_uuid("IDX-REMOTE") is None  # ยังไม่มีใครแจ้ง
+    reloads = app.user_index_stats()["reloads"]
+    app.runtime_state.bump_version("users_reg")  # worker อื่น add_user
+    assert app.get_user_by_uuid("IDX-REMOTE")["email"] == "idx-remote@kkumail.com"
+    assert app.user_index_stats()["reloads"] == reloads + 1
+
+
+def test_status_route(users):
+    assert users.client.get("/api/admin/user-index").status_code == 401
+    student = auth_header(users.app.app.config["SECRET_KEY"], "someone@kkumail.com")
+    assert users.client.get("/api/admin/user-index", headers=student).status_code == 403
+
+    reloads = users.app.user_index_stats()["reloads"]
+    body = _status(users, reload="true")
+    assert body["stats"]["reloads"] == reloads + 1
+    assert body["stats"]["loaded"] is True
+    assert body["consistency"]["consistent"] is True  # หลัง reload ตรงกับตารางเสมอ
@@ -0,0 +1,145 @@
+"""
+test_whitelist.py
+=================
+พฤติกรรมของ /api/whitelist (admin whitelist ของ ESP32_Door)
+
+- ETag = version ของ whitelist_changes → If-None-Match ตรงได้ 304 ไม่มี body
+- ?since=<version> ได้เฉพาะ adds / removes หลัง version นั้น (uuid เดียวกันเอาสถานะล่าสุด)
+  since == version ปัจจุบัน → delta ว่าง, since ที่ใช้ไม่ได้ → ทั้งชุด ("full": true)
+- binary (WLB1): header + hash 8 ไบต์เรียงแบบ memcmp ไม่ซ้ำ, CRC32 ของ entries,
+  ETag แยกจาก JSON ("wl-N.bin")
+
+whitelist เป็นของทั้ง database → เทสต์เทียบเฉพาะ UUID ของตัวเอง (ขึ้นต้น WL-)
+"""
+
+import struct
+import zlib
+
+import db
+import whitelist
+from conftest import register_card
+
+
+def _get(backend, headers=None, **params):
+    return backend.client.get("/api/whitelist", query_string=params, headers=headers or {})
+
+
+def _version(backend):
+    return _get(backend).get_json()["version"]
+
+
+def _mine(items):
+    return [i for i in items if (i if isinstance(i, str) else i["uuid"]).startswith("WL-")]
+
+
+def _set_user(row_id, backend, **fields):
+    sets = ", ".join(f"{k} = ?" for k in fields)
+    with db.get_db_connection() as conn:
+        conn.execute(f"UPDATE users_reg SET {sets} WHERE id = ?", (*fields.values(), row_id))
+        conn.commit()
+    backend.app._on_users_reg_changed(row_id)
+
+
+def test_etag_and_not_modified(backend):
+    first = _get(backend)
+    etag = first.headers["ETag"]
+    assert etag == f'"wl-{first.get_json()["version"]}"'
+
+    cached = _get(backend, {"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.data == b""
+
+    register_card(backend, "WL-ETAG", "wl-etag@kku.ac.th", role="admin")
+    changed = _get(backend, {"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+    assert {"uuid": "WL-ETAG", "name": "Test Card"} in changed.get_json()["admins"]
+
+
+def test_delta_since_version(backend):
+    since = _version(backend)
+    keep = register_card(backend, "WL-KEEP", "wl-keep@kku.ac.th", role="admin")
+    gone = register_card(backend, "WL-GONE", "wl-gone@kku.ac.th", role="admin")
+    register_card(backend, "WL-STUDENT", "wl-student@kkumail.com")  # ไม่ใช่ admin ไม่อยู่ใน log
+    _set_user(gone, backend, is_deleted=1)
+    _set_user(keep, backend, first_name="Renamed")
+
+    body = _get(backend, since=since).get_json()
+    assert body["full"] is False
+    assert _mine(body["adds"]) == [{"uuid": "WL-KEEP", "name": "Renamed Card"}]
+    assert _mine(body["removes"]) == ["WL-GONE"]
+
+    # ลดสิทธิ์จาก admin → remove
+    since = body["version"]
+    _set_user(keep, backend, role="student")
+    body = _get(backend, since=since).get_json()
+    assert (body["adds"], body["removes"]) == ([], ["WL-KEEP"])
+
+
+def test_since_current_version_is_empty_delta(backend):
+    register_card(backend, "WL-CURRENT", "wl-current@kku.ac.th", role="admin")
+    version = _version(backend)
+    resp = _get(backend, since=version)
+    assert resp.status_code == 200
+    assert resp.get_json() == {"success": True, "version": version, "full": False,
+                               "adds": [], "removes": []}
+
+
+def test_unusable_since_gets_full_list(backend, monkeypatch):
+    register_card(backend, "WL-FULL", "wl-full@kku.ac.th", role="admin")
+    version = _version(backend)
+    for since in (0, version + 5):  # ยังไม่เคยได้ชุดเต็ม / db ฝั่ง server ถูก reset
+        body = _get(backend, since=since).get_json()
+        assert body["full"] is True
+        assert body["count"] == len(body["admins"])
+        assert "WL-FULL" in [a["uuid"] for a in body["admins"]]
+
+    # change log ถูก prune จนไม่เหลือ version ที่ client ถืออยู่
+    old = version
+    for i in range(3):
+        register_card(backend, f"WL-PRUNE-{i}", f"wl-prune-{i}@kku.ac.th", role="admin")
+    monkeypatch.setattr(whitelist, "WHITELIST_CHANGELOG_KEEP", 1)
+    _get(backend)  # response เต็มเป็นตัว prune
+    assert _get(backend, since=old).get_json()["full"] is True
+
+
+def _parse_bin(data):
+    magic, version, count, crc = struct.unpack_from("<4sIII", data)
+    entries = data[16:]
+    hashes = [entries[i:i + 8] for i in range(0, len(entries), 8)]
+    assert (magic, len(hashes)) == (b"WLB1", count)
+    assert zlib.crc32(entries) == crc
+    return version, hashes
+
+
+def test_binary_format(backend):
+    register_card(backend, "WL-BIN-A", "wl-bin-a@kku.ac.th", role="admin")
+    register_card(backend, "wl-bin-b", "wl-bin-b@kku.ac.th", role="admin")
+    json_body = _get(backend).get_json()
+
+    by_param = _get(backend, format="bin")
+    by_accept = _get(backend, {"Accept": "application/octet-stream"})
+    assert by_param.mimetype == "application/octet-stream"
+    assert by_param.data == by_accept.data
+
+    version, hashes = _parse_bin(by_param.data)
+    assert version == json_body["version"]
+    assert hashes == sorted(set(hashes))
+    assert len(hashes) == len({a["uuid"].strip().upper() for a in json_body["admins"]})
+    assert whitelist.uuid_hash("WL-BIN-A") in hashes
+    # ESP32 hash UUID ตัวใหญ่ — ตัวเล็ก / ช่องว่างได้ hash เดียวกัน
+    assert whitelist.uuid_hash(" WL-BIN-B ") == whitelist.uuid_hash("wl-bin-b") in hashes
+
+
+def test_binary_etag_is_separate(backend):
+    json_etag = _get(backend).headers["ETag"]
+    resp = _get(backend, {"If-None-Match": json_etag}, format="bin")
+    assert resp.status_code == 200  # ETag ของ JSON ใช้กับ binary ไม่ได้
+    bin_etag = resp.headers["ETag"]
+    assert bin_etag == json_etag[:-1] + '.bin"'
+    assert _get(backend, {"If-None-Match": bin_etag}, format="bin").status_code == 304
+
+    register_card(backend, "WL-BIN-NEW", "wl-bin-new@kku.ac.th", role="admin")
+    resp = _get(backend, {"If-None-Match": bin_etag}, format="bin")
+    assert resp.status_code == 200
+    assert whitelist.uuid_hash("WL-BIN-NEW") in _parse_bin(resp.data)[1]
@@ -0,0 +1,85 @@
+"""
+test_writeback.py
+=================
+พฤติกรรมของ BatchWriter (write-behind ของ access log)
+
+- รวม record เป็น batch ไม่เกิน max_batch, stop() drain ที่ค้างก่อนปิด
+- flush_fn ล้ม → retry, ล้มครบ max_retries → ทิ้ง batch แล้วนับ dropped
+- queue เต็ม (max_queue) → put() block จนกว่า flush จะตามทัน (backpressure)
+"""
+
+import itertools
+import threading
+
+from writeback import BatchWriter
+
+_names = itertools.count()
+
+
+def make_writer(flush_fn, **kwargs):
+    kwargs.setdefault("flush_interval_ms", 1)
+    return BatchWriter(f"test-{next(_names)}", flush_fn, **kwargs)
+
+
+def test_batches_and_drain_on_stop():
+    batches = []
+    writer = make_writer(batches.append, flush_interval_ms=50, max_batch=10)
+    for i in range(25):
+        writer.put(i)
+    writer.stop()
+    assert [r for b in batches for r in b] == list(range(25))
+    assert max(len(b) for b in batches) <= 10
+    stats = writer.stats()
+    assert (stats["flushed"], stats["queue_depth"], stats["running"]) == (25, 0, False)
+    # หลัง stop → เขียนตรง ไม่ค้างใน queue
+    writer.put(25)
+    assert batches[-1] == [25]
+
+
+def test_retry_then_success():
+    calls = []
+
+    def flaky(batch):
+        calls.append(list(batch))
+        if len(calls) < 3:
+            raise RuntimeError("database is locked")
+
+    writer = make_writer(flaky, max_retries=3)
+    writer.put("row")
+    writer.stop()
+    assert calls == [["row"]] * 3
+    stats = writer.stats()
+    assert (stats["errors"], stats["flushed"], stats["dropped"]) == (2, 1, 0)
+
+
+def test_dropped_after_retries():
+    def broken(batch):
+        raise RuntimeError("disk I/O error")
+
+    writer = make_writer(broken, max_retries=2)
+    writer.put("a")
+    writer.put("b")
+    writer.stop()
+    stats = writer.stats()
+    assert (stats["flushed"], stats["dropped"]) == (0, 2)
+
+
+def test_backpressure_when_queue_full():
+    release = threading.Event()
+    flushed = []
+
+    def slow(batch):
+        release.wait(5)
+        flushed.extend(batch)
+
+    writer = make_writer(slow, max_batch=2, max_queue=2)
+    producer = threading.Thread(target=lambda: [writer.put(i) for i in range(10)])
+    producer.start()
+    producer.join(0.3)
+    assert producer.is_alive()  # flush ค้าง → queue เต็ม → put() รอ
+    assert writer.stats()["queue_depth"] <= 2
+    release.set()
+    producer.join(5)
+    assert not producer.is_alive()
+    writer.stop()
+    assert flushed == list(range(10))
@@ -0,0 +1,266 @@
+"""
+whitelist.py
+============
+Admin whitelist สำหรับ offline fallback ของ ESP32_Door (/api/whitelist)
+
+- whitelist มี version — trigger บน users_reg บันทึกทุกการเพิ่ม/ลบ/แก้ admin ลง
+  whitelist_changes (version = AUTOINCREMENT) ไม่ว่าจะแก้จาก route ไหน
+- ETag = version → ESP32 ส่ง If-None-Match มา ถ้าไม่มีอะไรเปลี่ยนได้ 304 (ไม่มี body)
+- ?since=<version> → ส่งเฉพาะ adds / removes ตั้งแต่ version นั้น (delta)
+  ถ้า version เก่าเกินกว่าที่ change log เก็บไว้ → ส่งทั้งชุด ("full": true)
+- response แบบเต็มถูก cache ไว้ต่อ version ไม่ต้อง query users_reg ทุก refresh
+- Accept: application/octet-stream (หรือ ?format=bin) → binary ขนาดเล็กแทน JSON
+  ให้ ESP32 binary-search ใน buffer ได้เลยไม่ต้อง parse (ดู _build_binary)
+"""
+
+import hashlib
+import os
+import sqlite3
+import struct
+import threading
+import zlib
+
+from flask import Blueprint, Response, jsonify, request
+
+from db import get_db_connection
+
+whitelist_bp = Blueprint("whitelist", __name__)
+
+# เก็บ change log ย้อนหลังกี่ version (เก่ากว่านี้ → client ได้ทั้งชุดแทน delta)
+WHITELIST_CHANGELOG_KEEP = int(os.getenv("WHITELIST_CHANGELOG_KEEP", "1000"))
+
+WHITELIST_BIN_MIME = "application/octet-stream"
+WHITELIST_BIN_MAGIC = b"WLB1"
+WHITELIST_HASH_BYTES = 8
+
+_ADMIN_ACTIVE_OLD = "OLD.role = 'admin' AND OLD.is_deleted = 0"
+_ADMIN_ACTIVE_NEW = "NEW.role = 'admin' AND NEW.is_deleted = 0"
+
+
+def init_whitelist_db():
+    """สร้างตาราง whitelist_changes + trigger บน users_reg (ต้องเรียกหลัง init_db)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS whitelist_changes (
+                version     INTEGER PRIMARY KEY AUTOINCREMENT,
+                op          TEXT NOT NULL,          -- 'add' | 'remove'
+                uuid        TEXT NOT NULL,
+                name        TEXT,
+                changed_at  TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            """
+        )
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_whitelist_insert
+            AFTER INSERT ON users_reg
+            WHEN {_ADMIN_ACTIVE_NEW}
+            BEGIN
+                INSERT INTO whitelist_changes (op, uuid, name)
+                VALUES ('add', NEW.uuid, NEW.first_name || ' ' || NEW.last_name);
+            END
+            """
+        )
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_whitelist_update
+            AFTER UPDATE OF uuid, first_name, last_name, role, is_deleted ON users_reg
+            WHEN (({_ADMIN_ACTIVE_OLD}) OR ({_ADMIN_ACTIVE_NEW}))
+             AND (OLD.uuid IS NOT NEW.uuid
+                  OR OLD.first_name IS NOT NEW.first_name
+                  OR OLD.last_name IS NOT NEW.last_name
+                  OR OLD.role IS NOT NEW.role
+                  OR OLD.is_deleted IS NOT NEW.is_deleted)
+            BEGIN
+                INSERT INTO whitelist_changes (op, uuid, name)
+                SELECT 'remove', OLD.uuid, NULL
+                WHERE {_ADMIN_ACTIVE_OLD}
+                  AND NOT ({_ADMIN_ACTIVE_NEW} AND OLD.uuid = NEW.uuid);
+                INSERT INTO whitelist_changes (op, uuid, name)
+                SELECT 'add', NEW.uuid, NEW.first_name || ' ' || NEW.last_name
+                WHERE {_ADMIN_ACTIVE_NEW};
+            END
+            """
+        )
+        cursor.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS trg_whitelist_delete
+            AFTER DELETE ON users_reg
+            WHEN {_ADMIN_ACTIVE_OLD}
+            BEGIN
+                INSERT INTO whitelist_changes (op, uuid, name)
+                VALUES ('remove', OLD.uuid, NULL);
+            END
+            """
+        )
+        conn.commit()
+
+
+# =====================
+# Version / snapshot
+# =====================
+_cache_lock = threading.Lock()
+_full_cache = {"version": None, "admins": None}
+_bin_cache = {"version": None, "data": None}
+
+
+def current_version(cursor) -> int:
+    cursor.execute("SELECT MAX(version) FROM whitelist_changes")
+    return cursor.fetchone()[0] or 0
+
+
+def _oldest_retained_version(cursor) -> int:
+    cursor.execute("SELECT MIN(version) FROM whitelist_changes")
+    return cursor.fetchone()[0] or 0
+
+
+def _load_admins(cursor):
+    cursor.execute(
+        """
+        SELECT uuid, first_name, last_name
+        FROM users_reg
+        WHERE role = 'admin' AND is_deleted = 0
+        ORDER BY id
+        """
+    )
+    return [
+        {"uuid": r["uuid"], "name": f"{r['first_name']} {r['last_name']}"}
+        for r in cursor.fetchall()
+    ]
+
+
+def _full_snapshot(cursor, version: int):
+    """รายชื่อ admin ทั้งหมด ณ version นี้ — cache ไว้จนกว่า version จะเปลี่ยน"""
+    with _cache_lock:
+        if _full_cache["version"] == version:
+            return _full_cache["admins"]
+    admins = _load_admins(cursor)
+    with _cache_lock:
+        _full_cache["version"], _full_cache["admins"] = version, admins
+    return admins
+
+
+def uuid_hash(uuid: str) -> bytes:
+    """SHA-256 ของ UUID (hex ตัวใหญ่) ตัดเหลือ WHITELIST_HASH_BYTES ไบต์ — ESP32 คำนวณแบบเดียวกัน"""
+    return hashlib.sha256(uuid.strip().upper().encode()).digest()[:WHITELIST_HASH_BYTES]
+
+
+def _build_binary(version: int, admins) -> bytes:
+    """
+    Layout (little-endian เหมือน ESP32):
+        0   magic    4 bytes  "WLB1"
+        4   version  uint32
+        8   count    uint32
+        12  crc32    uint32   ของส่วน entries
+        16  entries  count x 8 bytes — uuid_hash() เรียงแบบ memcmp ไม่ซ้ำกัน
+    """
+    entries = b"".join(sorted({uuid_hash(a["uuid"]) for a in admins if a["uuid"]}))
+    count = len(entries) // WHITELIST_HASH_BYTES
+    header = struct.pack("<4sIII", WHITELIST_BIN_MAGIC, version, count, zlib.crc32(entries))
+    return header + entries
+
+
+def _binary_snapshot(cursor, version: int) -> bytes:
+    """binary whitelist ณ version นี้ — สร้างครั้งเดียวต่อ version"""
+    with _cache_lock:
+        if _bin_cache["version"] == version:
+            return _bin_cache["data"]
+    data = _build_binary(version, _full_snapshot(cursor, version))
+    with _cache_lock:
+        _bin_cache["version"], _bin_cache["data"] = version, data
+    return data
+
+
+def _wants_binary() -> bool:
+    if request.args.get("format") == "bin":
+        return True
+    best = request.accept_mimetypes.best_match(["application/json", WHITELIST_BIN_MIME])
+    return best == WHITELIST_BIN_MIME
+
+
+def _delta(cursor, since: int):
+    """adds / removes หลัง version since — uuid เดียวกันเอาการเปลี่ยนแปลงล่าสุด"""
+    cursor.execute(
+        "SELECT op, uuid, name FROM whitelist_changes WHERE version > ? ORDER BY version",
+        (since,),
+    )
+    last = {}
+    for row in cursor.fetchall():
+        last[row["uuid"]] = row
+    adds = [
+        {"uuid": uuid, "name": row["name"]}
+        for uuid, row in last.items()
+        if row["op"] == "add"
+    ]
+    removes = [uuid for uuid, row in last.items() if row["op"] == "remove"]
+    return adds, removes
+
+
+def _prune_changelog(cursor, version: int):
+    cursor.execute(
+        "DELETE FROM whitelist_changes WHERE version <= ?",
+        (version - WHITELIST_CHANGELOG_KEEP,),
+    )
+
+
+def _etag(version: int, binary: bool = False) -> str:
+    return f'"wl-{version}.bin"' if binary else f'"wl-{version}"'
+
+
+# =====================
+# Route
+# =====================
+@whitelist_bp.route("/api/whitelist", methods=["GET"])
+def get_whitelist():
+    """
+    คืน UUID + ชื่อของ admin ทุกคนที่ลงทะเบียน RFID แล้ว
+    ใช้โดย ESP32_Door ตอน boot และ refresh ทุก 5 นาที
+    เพื่อ sync offline fallback whitelist โดยไม่ต้อง upload firmware ใหม่
+    ไม่ต้อง auth token เพราะ ESP32 ไม่มี session
+
+    - If-None-Match ตรงกับ ETag ปัจจุบัน → 304 (?since= อย่างเดียวไม่ได้ 304)
+    - ?since=<version> → {"full": false, "adds": [...], "removes": [...]}
+    - binary (Accept: application/octet-stream / ?format=bin) → ทั้งชุดเสมอ ไม่มี delta
+    """
+    since = request.args.get("since", type=int)
+    binary = _wants_binary()
+    try:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            version = current_version(cursor)
+            etag = _etag(version, binary)
+
+            if request.headers.get("If-None-Match") == etag:
+                return Response(status=304, headers={"ETag": etag, "Vary": "Accept"})
+
+            if binary:
+                data = _binary_snapshot(cursor, version)
+                return Response(
+                    data,
+                    mimetype=WHITELIST_BIN_MIME,
+                    headers={"ETag": etag, "Vary": "Accept"},
+                )
+
+            body = {"success": True, "version": version}
+            oldest = _oldest_retained_version(cursor)
+            # since <= 0 = client ยังไม่เคยได้ชุดเต็ม → ต้องส่งทั้งชุด
+            # since == version → delta ว่าง (304 เฉพาะเมื่อส่ง If-None-Match มาตรง)
+            if since is not None and 0 < since <= version and since >= oldest - 1:
+                adds, removes = _delta(cursor, since)
+                body.update({"full": False, "adds": adds, "removes": removes})
+            else:
+                # ไม่ส่ง since / since เก่ากว่า log / since ใหม่กว่า server (db ถูก reset)
+                admins = _full_snapshot(cursor, version)
+                body.update({"full": True, "admins": admins, "count": len(admins)})
+                if version - oldest >= WHITELIST_CHANGELOG_KEEP * 2:
+                    _prune_changelog(cursor, version)
+                    conn.commit()
+        resp = jsonify(body)
+        resp.headers["ETag"] = etag
+        resp.headers["Vary"] = "Accept"
+        return resp
+    except sqlite3.Error as e:
+        print(f"[WHITELIST] get_whitelist error: {e}")
+        return jsonify({"success": False, "admins": [], "count": 0}), 500
@@ -0,0 +1,188 @@
+"""
+writeback.py
+============
+Write-behind queue สำหรับงานเขียน DB ที่ไม่ต้องรอผล (เช่น access log)
+
+request thread แค่ put() record ลง queue ใน memory แล้ว return ทันที
+background thread จะรวม record แล้วเรียก flush_fn(batch) ครั้งเดียว
+(executemany ใน transaction เดียว) ทุก flush_interval_ms หรือเมื่อครบ max_batch
+ทำให้ scan ที่เข้ามาพร้อมกันไม่ต้องต่อคิวรอ write lock / fsync ของ SQLite ทีละแถว
+
+ตอน shutdown เรียก stop() (ลงทะเบียนกับ atexit ให้อัตโนมัติ) เพื่อ drain ที่ค้างอยู่
+"""
+
+import atexit
+import threading
+import time
+from collections import deque
+
+from metrics import Counter, Gauge, Histogram
+
+queue_depth_gauge = Gauge(
+    "writeback_queue_depth", "Records waiting in the write-behind queue", ("writer",)
+)
+flush_duration = Histogram(
+    "writeback_flush_duration_seconds",
+    "Time to commit one write-behind batch",
+    ("writer",),
+)
+rows_total = Counter(
+    "writeback_rows_total",
+    "Write-behind records by outcome (flushed / dropped)",
+    ("writer", "status"),
+)
+
+
+class BatchWriter:
+    def __init__(
+        self,
+        name: str,
+        flush_fn,
+        flush_interval_ms: int = 20,
+        max_batch: int = 200,
+        max_queue: int = 10000,
+        max_retries: int = 3,
+    ):
+        self.name = name
+        self._flush_fn = flush_fn
+        self._interval = max(flush_interval_ms, 1) / 1000.0
+        self._max_batch = max(max_batch, 1)
+        self._max_queue = max(max_queue, self._max_batch)
+        self._max_retries = max_retries
+
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # flush ทีละ batch (thread + drain)
+        self._thread = None
+        self._stopping = False
+        self._stats = {
+            "enqueued": 0,
+            "flushed": 0,
+            "batches": 0,
+            "errors": 0,
+            "dropped": 0,
+            "last_batch_size": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+        queue_depth_gauge.set_function(lambda: len(self._queue), writer=name)
+
+    # ---------- producer side ----------
+    def put(self, record):
+        """เพิ่ม record เข้า queue — ไม่ block ยกเว้น queue เต็ม (backpressure)"""
+        with self._cond:
+            stopping = self._stopping
+            if not stopping:
+                self._enqueue(record)
+        if stopping:
+            # หลัง stop แล้ว (กำลังปิด process) → เขียนตรงเลย ไม่ให้ record หาย
+            self._flush([record])
+
+    def _enqueue(self, record):
+        # เรียกภายใต้ self._cond
+        self._ensure_started()
+        while len(self._queue) >= self._max_queue:
+            self._cond.notify_all()
+            self._cond.wait(self._interval)
+        self._queue.append(record)
+        self._stats["enqueued"] += 1
+        if len(self._queue) == 1 or len(self._queue) >= self._max_batch:
+            self._cond.notify_all()
+
+    def _ensure_started(self):
+        # เรียกภายใต้ self._cond — start thread ตอนมี record แรก (import แล้วไม่ spawn)
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name=f"writeback-{self.name}", daemon=True
+            )
+            self._thread.start()
+            atexit.register(self.stop)
+
+    # ---------- consumer side ----------
+    def _take_batch(self):
+        with self._cond:
+            n = min(len(self._queue), self._max_batch)
+            batch = [self._queue.popleft() for _ in range(n)]
+            self._cond.notify_all()  # ปลุก producer ที่รอ queue เต็ม
+            return batch
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._queue and not self._stopping:
+                    self._cond.wait()
+                if self._stopping and not self._queue:
+                    return
+                # รอให้ record สะสมครบ interval (group commit) ยกเว้น batch เต็มแล้ว
+                if len(self._queue) < self._max_batch and not self._stopping:
+                    self._cond.wait(self._interval)
+            batch = self._take_batch()
+            if batch:
+                self._flush(batch)
+
+    def _flush(self, batch):
+        with self._flush_lock:
+            for attempt in range(1, self._max_retries + 1):
+                started = time.perf_counter()
+                try:
+                    self._flush_fn(batch)
+                except Exception as e:
+                    self._stats["errors"] += 1
+                    print(
+                        f"[WRITEBACK:{self.name}] flush error "
+                        f"(attempt {attempt}/{self._max_retries}, {len(batch)} rows): {e}"
+                    )
+                    time.sleep(self._interval * attempt)
+                    continue
+                elapsed = time.perf_counter() - started
+                elapsed_ms = elapsed * 1000.0
+                flush_duration.observe(elapsed, writer=self.name)
+                rows_total.inc(len(batch), writer=self.name, status="flushed")
+                self._stats["flushed"] += len(batch)
+                self._stats["batches"] += 1
+                self._stats["last_batch_size"] = len(batch)
+                self._stats["last_flush_ms"] = elapsed_ms
+                self._stats["total_flush_ms"] += elapsed_ms
+                self._stats["max_flush_ms"] = max(
+                    self._stats["max_flush_ms"], elapsed_ms
+                )
+                return True
+            self._stats["dropped"] += len(batch)
+            rows_total.inc(len(batch), writer=self.name, status="dropped")
+            print(f"[WRITEBACK:{self.name}] dropped {len(batch)} rows after retries")
+            return False
+
+    # ---------- lifecycle ----------
+    def flush(self):
+        """flush ทุกอย่างที่ค้างใน queue ทันที (synchronous)"""
+        while True:
+            batch = self._take_batch()
+            if not batch:
+                return
+            self._flush(batch)
+
+    def stop(self, timeout: float = 10.0):
+        """หยุด thread และ drain queue ให้หมดก่อนปิด process"""
+        with self._cond:
+            if self._stopping:
+                return
+            self._stopping = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            depth = len(self._queue)
+        s = dict(self._stats)
+        s["queue_depth"] = depth
+        s["running"] = self._thread is not None and self._thread.is_alive()
+        s["avg_flush_ms"] = (
+            round(s["total_flush_ms"] / s["batches"], 3) if s["batches"] else 0.0
+        )
+        for k in ("last_flush_ms", "max_flush_ms", "total_flush_ms"):
+            s[k] = round(s[k], 3)
+        return s
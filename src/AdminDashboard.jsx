@@ -1474,37 +1474,55 @@ const SystemSettings = ({ onSelectRoom, selectedRoom, refreshKey }) => {
     fetchRooms();
   }, [refreshKey]);
 
-  // Poll room device statuses every 3 seconds
+  // สถานะประตูทุกห้อง: โหลดครั้งเดียวจาก /api/door/status/all แล้วรับ door_status ทาง socket
+  // เฉพาะตอน online/offline เปลี่ยน — poll /all ทุก 30 วิ สำรองไว้กรณี socket หลุด
   useEffect(() => {
     if (rooms.length === 0) return;
-    const poll = async () => {
-      const updated = await Promise.all(
-        rooms.map(async (room) => {
-          try {
-            const res = await fetch(`/api/door/status?room=${encodeURIComponent(room.name)}`);
-            if (res.ok) {
-              const data = await res.json();
-              return {
-                ...room,
-                doorStatus: data.door_status ?? room.doorStatus ?? 'LOCKED',
-                doorOnline: data.door_online ?? room.doorOnline ?? false,
-                rfidOnline: data.rfid_online ?? room.rfidOnline ?? false,
-              };
-            }
-          } catch { /* keep existing state */ }
-          return room;
-        })
-      );
-      // เรียง Online ขึ้นก่อน
-      setRooms([...updated].sort((a, b) => {
+    const applyStatuses = (statuses) => {
+      setRooms(prev => [...prev.map(room => {
+        const st = statuses[room.name];
+        return st ? {
+          ...room,
+          doorStatus: st.door_status ?? room.doorStatus ?? 'LOCKED',
+          doorOnline: st.door_online ?? room.doorOnline ?? false,
+          rfidOnline: st.rfid_online ?? room.rfidOnline ?? false,
+        } : room;
+      })].sort((a, b) => {
+        // เรียง Online ขึ้นก่อน
         const aOnline = (a.doorOnline || a.rfidOnline) ? 1 : 0;
         const bOnline = (b.doorOnline || b.rfidOnline) ? 1 : 0;
         return bOnline - aOnline;
       }));
     };
-    poll();
-    const interval = setInterval(poll, 3000);
-    return () => clearInterval(interval);
+    const fetchAll = async () => {
+      try {
+        const res = await fetch('/api/door/status/all');
+        if (res.ok) {
+          const data = await res.json();
+          applyStatuses(data.rooms || {});
+        }
+      } catch { /* keep existing state */ }
+    };
+
+    const SOCKET_URL = process.env.NODE_ENV === 'production' ? window.location.origin : 'http://localhost:5000';
+    const socket = io(SOCKET_URL, {
+      transports: ['websocket', 'polling'],
+      auth: { token: localStorage.getItem('token') },
+    });
+    socket.on('connect', () => {
+      socket.emit('subscribe', { door_status: true });
+      fetchAll(); // sync ใหม่ทุกครั้งที่ (re)connect เผื่อพลาด event ระหว่างหลุด
+    });
+    socket.on('door_status', (data) => {
+      applyStatuses({ [data.room]: data });
+    });
+
+    fetchAll();
+    const interval = setInterval(fetchAll, 30000);
+    return () => {
+      clearInterval(interval);
+      socket.disconnect();
+    };
   }, [rooms.length]);
 
   const handleRenameRoom = async (roomId, newName) => {
@@ -1915,10 +1933,13 @@ const AccessLogs = () => {
   const [search,       setSearch]       = useState('');
   const [searchInput,  setSearchInput]  = useState('');
 
-  // Pagination
-  const [offset, setOffset] = useState(0);
-  const [total,  setTotal]  = useState(0);
+  // Pagination (keyset) — cursors[i] = cursor ของหน้าที่ i (หน้าแรก = null)
+  const [page,       setPage]       = useState(0);
+  const [cursors,    setCursors]    = useState([null]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [total,      setTotal]      = useState(null);
   const LIMIT = 50;
+  const offset = page * LIMIT;
 
   const token = () => localStorage.getItem('token');
 
@@ -1945,17 +1966,32 @@ const AccessLogs = () => {
   // โหลด logs เมื่อ filter / search / pagination เปลี่ยน
   useEffect(() => {
     fetchLogs();
-  }, [filterRoom, filterResult, search, offset]);
+  }, [filterRoom, filterResult, search, page]);
+
+  // heatmap วัน × ชั่วโมง (เวลาไทย) ย้อนหลัง HEATMAP_DAYS วัน ตามห้องที่เลือก
+  const [heatmap, setHeatmap] = useState(null);
+  const HEATMAP_DAYS = 120;
+  useEffect(() => {
+    const from = new Date(Date.now() - HEATMAP_DAYS * 86400000).toISOString().slice(0, 10);
+    const params = new URLSearchParams({ bucket: 'weekday_hour', from });
+    if (filterRoom) params.set('room', filterRoom);
+    fetch(`/api/access-logs/analytics?${params}`, {
+      headers: { 'Authorization': `Bearer ${token()}` }
+    })
+      .then(r => r.json())
+      .then(d => { if (d.success) setHeatmap(d); })
+      .catch(() => {});
+  }, [filterRoom]);
 
   const fetchLogs = async () => {
     setLoading(true);
     try {
       const params = new URLSearchParams({
         limit:  LIMIT,
-        offset: offset,
         result: filterResult,
-        ...(filterRoom && { room: filterRoom }),
-        ...(search     && { search }),
+        ...(cursors[page] && { cursor: cursors[page] }),
+        ...(filterRoom    && { room: filterRoom }),
+        ...(search        && { search }),
       });
       const res  = await fetch(`/api/access-logs?${params}`, {
         headers: { 'Authorization': `Bearer ${token()}` }
@@ -1963,7 +1999,8 @@ const AccessLogs = () => {
       const data = await res.json();
       if (res.ok && data.success) {
         setLogs(data.logs  || []);
-        setTotal(data.total || 0);
+        setTotal(data.total ?? null);  // null = ไม่ทราบ (ค้นหาด้วย search)
+        setNextCursor(data.next_cursor || null);
       }
     } catch (e) {
       console.error('Error fetching logs:', e);
@@ -1972,10 +2009,50 @@ const AccessLogs = () => {
     }
   };
 
-  // รีเซ็ต offset เมื่อ filter เปลี่ยน
-  const handleFilterRoom   = (v) => { setFilterRoom(v);   setOffset(0); };
-  const handleFilterResult = (v) => { setFilterResult(v); setOffset(0); };
-  const handleSearch       = ()  => { setSearch(searchInput); setOffset(0); };
+  // กลับไปหน้าแรกเมื่อ filter เปลี่ยน
+  const resetPages = () => { setPage(0); setCursors([null]); };
+  const handleFilterRoom   = (v) => { setFilterRoom(v);   resetPages(); };
+  const handleFilterResult = (v) => { setFilterResult(v); resetPages(); };
+  const handleSearch       = ()  => { setSearch(searchInput); resetPages(); };
+  const goNextPage = () => {
+    if (!nextCursor) return;
+    setCursors(c => [...c.slice(0, page + 1), nextCursor]);
+    setPage(page + 1);
+  };
+
+  // Export ทุกแถวที่ตรง filter ปัจจุบัน (server stream เป็น CSV ทีละ chunk)
+  const [exporting, setExporting] = useState(false);
+  const handleExport = async () => {
+    setExporting(true);
+    try {
+      const params = new URLSearchParams({
+        format: 'csv',
+        result: filterResult,
+        ...(filterRoom && { room: filterRoom }),
+        ...(search     && { search }),
+      });
+      const res = await fetch(`/api/access-logs/export?${params}`, {
+        headers: { 'Authorization': `Bearer ${token()}` }
+      });
+      if (!res.ok) {
+        const data = await res.json().catch(() => ({}));
+        showLogsToast(data.error || 'Export ไม่สำเร็จ', 'error');
+        return;
+      }
+      const disposition = res.headers.get('Content-Disposition') || '';
+      const match = disposition.match(/filename="([^"]+)"/);
+      const url = URL.createObjectURL(await res.blob());
+      const a = document.createElement('a');
+      a.href = url;
+      a.download = match ? match[1] : 'access_logs.csv';
+      a.click();
+      URL.revokeObjectURL(url);
+    } catch {
+      showLogsToast('เกิดข้อผิดพลาดในการเชื่อมต่อ', 'error');
+    } finally {
+      setExporting(false);
+    }
+  };
 
   const formatDateTime = (raw) => {
     if (!raw) return '-';
@@ -1989,16 +2066,16 @@ const AccessLogs = () => {
     });
   };
 
-  const totalPages   = Math.ceil(total / LIMIT);
-  const currentPage  = Math.floor(offset / LIMIT) + 1;
+  const totalPages   = total != null ? Math.ceil(total / LIMIT) : null;
+  const currentPage  = page + 1;
 
   return (
     <>
     <ConfirmModal
       isOpen={purgeModal}
-      title="ลบ Log เก่า"
-      message="ต้องการลบ log ที่เก่ากว่า 30 วันทั้งหมดใช่ไหม?"
-      confirmLabel="ลบ"
+      title="Archive Log เก่า"
+      message="ต้องการย้าย log ของเดือนที่เก่ากว่า 30 วันไปเก็บใน archive ใช่ไหม? (ยังเปิดดู / export ย้อนหลังได้)"
+      confirmLabel="Archive"
       confirmColor="#e74c3c"
       onConfirm={async () => {
         setPurgeModal(false);
@@ -2009,8 +2086,22 @@ const AccessLogs = () => {
           });
           const data = await res.json();
           if (res.ok) {
-            showLogsToast(`ลบแล้ว ${data.deleted} รายการ`, 'success');
-            fetchLogs();
+            // server ลบทีละ batch ใน background → poll สถานะจนเสร็จ
+            showLogsToast('กำลัง archive log เก่า...', 'success');
+            const poll = setInterval(async () => {
+              try {
+                const r = await fetch('/api/access-logs/purge-status', {
+                  headers: { 'Authorization': `Bearer ${token()}` }
+                });
+                const d = await r.json();
+                if (!r.ok || d.progress.running) return;
+                clearInterval(poll);
+                showLogsToast(`ย้ายไป archive แล้ว ${d.progress.deleted} รายการ`, 'success');
+                fetchLogs();
+              } catch {
+                clearInterval(poll);
+              }
+            }, 2000);
           } else {
             showLogsToast(data.error || 'เกิดข้อผิดพลาด', 'error');
           }
@@ -2056,6 +2147,43 @@ const AccessLogs = () => {
         ) : null}
       </div>
 
+      {/* Weekly heatmap */}
+      {heatmap && (() => {
+        const counts = heatmap.buckets.map((_, i) => heatmap.totals.granted[i] + heatmap.totals.denied[i]);
+        const max = Math.max(1, ...counts);
+        const days = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun'];
+        return (
+          <>
+            <div className="quick-stats-title">
+              Scans by Weekday &amp; Hour ({filterRoom || 'All Rooms'}, last {HEATMAP_DAYS} days)
+            </div>
+            <div style={{ background: '#fff', borderRadius: '8px', padding: '12px', marginBottom: '24px', overflowX: 'auto' }}>
+              <div style={{ display: 'grid', gridTemplateColumns: '36px repeat(24, minmax(16px, 1fr))', gap: '2px', fontSize: '10px', color: '#888' }}>
+                <div></div>
+                {Array.from({ length: 24 }, (_, h) => (
+                  <div key={h} style={{ textAlign: 'center' }}>{h % 3 === 0 ? h : ''}</div>
+                ))}
+                {days.map((day, w) => (
+                  <React.Fragment key={day}>
+                    <div style={{ lineHeight: '16px' }}>{day}</div>
+                    {Array.from({ length: 24 }, (_, h) => {
+                      const i = w * 24 + h;
+                      return (
+                        <div
+                          key={h}
+                          title={`${day} ${String(h).padStart(2, '0')}:00 — granted ${heatmap.totals.granted[i]}, denied ${heatmap.totals.denied[i]}`}
+                          style={{ height: '16px', borderRadius: '2px', background: counts[i] ? `rgba(216, 139, 139, ${0.15 + 0.85 * counts[i] / max})` : '#f3f3f3' }}
+                        />
+                      );
+                    })}
+                  </React.Fragment>
+                ))}
+              </div>
+            </div>
+          </>
+        );
+      })()}
+
       {/* Filters Row */}
       <div style={{ display: 'flex', gap: '10px', flexWrap: 'wrap', marginBottom: '16px', alignItems: 'center' }}>
 
@@ -2077,7 +2205,7 @@ const AccessLogs = () => {
           </button>
           {search && (
             <button
-              onClick={() => { setSearchInput(''); setSearch(''); setOffset(0); }}
+              onClick={() => { setSearchInput(''); setSearch(''); resetPages(); }}
               style={{ padding: '8px 10px', background: '#e8e8e8', border: '2px solid #fff', borderRadius: '6px', cursor: 'pointer', fontSize: '13px', color: '#444', fontWeight: '600' }}
               title="ล้างการค้นหา"
             >
@@ -2134,13 +2262,23 @@ const AccessLogs = () => {
           <i className="fa-solid fa-rotate-right"></i>
         </button>
 
+        {/* Export CSV */}
+        <button
+          onClick={handleExport}
+          disabled={exporting}
+          style={{ padding: '8px 12px', background: '#e8f5e9', border: '1px solid #81c784', borderRadius: '6px', cursor: exporting ? 'wait' : 'pointer', fontSize: '13px', color: '#2e7d32', fontWeight: '600', display: 'flex', alignItems: 'center', gap: '6px' }}
+          title="Export log ทั้งหมดตาม filter เป็น CSV"
+        >
+          <i className={exporting ? 'fa-solid fa-spinner fa-spin' : 'fa-solid fa-file-csv'}></i> Export CSV
+        </button>
+
         {/* Purge old logs */}
         <button
           onClick={() => setPurgeModal(true)}
           style={{ padding: '8px 12px', background: '#fdecea', border: '1px solid #e57373', borderRadius: '6px', cursor: 'pointer', fontSize: '13px', color: '#c62828', fontWeight: '600', display: 'flex', alignItems: 'center', gap: '6px' }}
-          title="ลบ log เก่ากว่า 30 วัน"
+          title="archive log ของเดือนที่เก่ากว่า 30 วัน"
         >
-          <i className="fa-solid fa-trash-clock"></i> Clear old logs
+          <i className="fa-solid fa-box-archive"></i> Archive old logs
         </button>
       </div>
 
@@ -2229,24 +2367,27 @@ const AccessLogs = () => {
         </div>
 
         {/* Pagination */}
-        {total > LIMIT && (
+        {(page > 0 || nextCursor) && (
           <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', padding: '14px 4px', fontSize: '13px', color: '#666' }}>
-            <span>Showing {offset + 1}–{Math.min(offset + LIMIT, total)} of {total.toLocaleString()} records</span>
+            <span>
+              Showing {offset + 1}–{offset + logs.length}
+              {total != null && <> of {total.toLocaleString()}</>} records
+            </span>
             <div style={{ display: 'flex', gap: '6px' }}>
               <button
-                disabled={offset === 0}
-                onClick={() => setOffset(Math.max(0, offset - LIMIT))}
-                style={{ padding: '6px 12px', borderRadius: '6px', border: '1px solid #ddd', background: offset === 0 ? '#f5f5f5' : '#fff', cursor: offset === 0 ? 'not-allowed' : 'pointer', color: offset === 0 ? '#bbb' : '#333' }}
+                disabled={page === 0}
+                onClick={() => setPage(Math.max(0, page - 1))}
+                style={{ padding: '6px 12px', borderRadius: '6px', border: '1px solid #ddd', background: page === 0 ? '#f5f5f5' : '#fff', cursor: page === 0 ? 'not-allowed' : 'pointer', color: page === 0 ? '#bbb' : '#333' }}
               >
                 ‹ Prev
               </button>
               <span style={{ padding: '6px 12px', background: '#d88b8b', color: '#fff', borderRadius: '6px', fontWeight: '600' }}>
-                {currentPage} / {totalPages}
+                {currentPage}{totalPages != null && <> / {totalPages}</>}
               </span>
               <button
-                disabled={offset + LIMIT >= total}
-                onClick={() => setOffset(offset + LIMIT)}
-                style={{ padding: '6px 12px', borderRadius: '6px', border: '1px solid #ddd', background: offset + LIMIT >= total ? '#f5f5f5' : '#fff', cursor: offset + LIMIT >= total ? 'not-allowed' : 'pointer', color: offset + LIMIT >= total ? '#bbb' : '#333' }}
+                disabled={!nextCursor}
+                onClick={goNextPage}
+                style={{ padding: '6px 12px', borderRadius: '6px', border: '1px solid #ddd', background: !nextCursor ? '#f5f5f5' : '#fff', cursor: !nextCursor ? 'not-allowed' : 'pointer', color: !nextCursor ? '#bbb' : '#333' }}
               >
                 Next ›
               </button>
@@ -2695,7 +2836,15 @@ const AdminDashboard = ({ user, onLogout }) => {
 
   useEffect(() => {
     const SOCKET_URL = process.env.NODE_ENV === 'production' ? window.location.origin : 'http://localhost:5000';
-    const socket = io(SOCKET_URL, { transports: ['websocket', 'polling'] });
+    // server รับเฉพาะ client ที่มี JWT ของ admin และส่ง uuid_update เฉพาะ room ที่ subscribe
+    const socket = io(SOCKET_URL, {
+      transports: ['websocket', 'polling'],
+      auth: { token: localStorage.getItem('token') },
+    });
+    // subscribe ใหม่ทุกครั้งที่ connect/reconnect — หน้านี้ใช้แค่ scan จาก ESP32_Register
+    socket.on('connect', () => {
+      socket.emit('subscribe', { registration: true });
+    });
     fetch('/api/reset_uuid', { method: 'POST' }).catch(err => {
       console.error('Error resetting UUID:', err);
     });